@@ -0,0 +1,251 @@
+# HTTP job-queue service around the classification / summarisation / report pipeline
+#
+# Usage:
+#   uvicorn Api_service:app --host 0.0.0.0 --port 8000
+#
+# Run a single uvicorn worker process: jobs run on a bounded thread pool inside it, all
+# sharing one loaded model, and clauses from concurrent jobs are batched into shared
+# forward passes by Clause_batcher.
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from Clause_batcher import get_batcher
+from Clause_index import get_clause_index
+from Ingestion import file_type_of, load_document
+from Input_pipeline import CASCADE, classify_contract
+from Model_registry import registry
+from Report_Generator import build_pdf_report
+from Summarisation_pipeline import hierarchical_summary_openai, tiered_summary_openai
+from Tracing import collect_spans, metrics, span, summarize_spans
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DIR = os.getenv("API_JOBS_DIR", os.path.join(BASE_DIR, "jobs"))
+JOB_WORKERS = int(os.getenv("API_JOB_WORKERS", 2))
+# Running plus queued jobs; submissions beyond this get 429 instead of an ever-growing queue.
+MAX_PENDING_JOBS = int(os.getenv("API_MAX_PENDING_JOBS", 16))
+JOB_RETENTION_SECONDS = int(os.getenv("API_JOB_RETENTION_SECONDS", 24 * 3600))
+# "full" summarises every clause; "tiered" gives Tier 1-2 clauses the full budget, compresses
+# the rest into one call and caps the contract's tokens and cost (see tiered_summary_openai).
+SUMMARY_MODE = os.getenv("CONTRACT_NLP_SUMMARY_MODE", "full")
+
+ARTIFACTS = {
+    "csv": ("classified_contract.csv", "text/csv"),
+    "summary": ("Contract_Abstractive_Summary.txt", "text/plain"),
+    "report": ("Contract_Analysis_Report.pdf", "application/pdf"),
+}
+
+
+@dataclass
+class Job:
+    id: str
+    filename: str
+    status: str = "queued"
+    stage: str = None
+    error: str = None
+    failed_stage: str = None
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    clauses: int = None
+    artifacts: dict = field(default_factory=dict)
+    spans: list = field(default_factory=list)
+    summary_tokens: dict = None
+
+    @property
+    def directory(self):
+        return os.path.join(JOBS_DIR, self.id)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "failed_stage": self.failed_stage,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "clauses": self.clauses,
+            "artifacts": sorted(self.artifacts),
+            # Per-stage totals of the job's tracing spans (see Tracing); stages are job_<stage>.
+            "timings": summarize_spans(self.spans),
+            # Tiered summaries only: clauses and tokens per tier, and the budget they were held to.
+            "summary_tokens": self.summary_tokens,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.max_pending = max_pending
+        self.jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, filename, data):
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+            job = Job(id=uuid.uuid4().hex, filename=filename)
+            self.jobs[job.id] = job
+        self._executor.submit(self._run, job, data)
+        return job
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        return job
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _expire(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+            job = self.jobs.pop(job_id)
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+    def _run(self, job, data):
+        job.status, job.started = "running", time.time()
+        try:
+            with collect_spans() as job.spans:
+                run_pipeline(job, data)
+            job.status = "done"
+        except Exception as e:
+            job.status, job.error, job.failed_stage = "failed", f"{e.__class__.__name__}: {e}", job.stage
+        finally:
+            job.stage, job.finished = None, time.time()
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _stage(job, name):
+    job.stage = name
+    return span(f"job_{name}")
+
+
+def run_pipeline(job, data):
+    os.makedirs(job.directory, exist_ok=True)
+    paths = {name: os.path.join(job.directory, filename) for name, (filename, _) in ARTIFACTS.items()}
+
+    with _stage(job, "ingestion") as s:
+        # Workers=1: the job pool already runs documents in parallel.
+        document = load_document(data=data, filename=job.filename, workers=1)
+        s.items = len(document.pages)
+
+    with _stage(job, "classification") as s:
+        df = classify_contract(document, output_csv=paths["csv"], predictor=get_batcher().predict_clause_labels)
+        job.clauses = s.items = len(df)
+    job.artifacts["csv"] = paths["csv"]
+
+    with _stage(job, "summarization"):
+        if SUMMARY_MODE == "tiered":
+            final_summary, _, job.summary_tokens = tiered_summary_openai(df)
+        else:
+            final_summary, _ = hierarchical_summary_openai(clauses=df["Clause"].tolist())
+        with open(paths["summary"], "w", encoding="utf-8") as f:
+            f.write(final_summary)
+    job.artifacts["summary"] = paths["summary"]
+
+    with _stage(job, "report"):
+        report = build_pdf_report(df, final_summary, document=document)
+        with open(paths["report"], "wb") as f:
+            f.write(report.getbuffer())
+    job.artifacts["report"] = paths["report"]
+
+
+jobs = JobQueue()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    registry.warmup(background=True)
+    get_batcher().start()
+    yield
+    jobs.shutdown()
+
+
+app = FastAPI(title="Contract NLP API", lifespan=lifespan)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    try:
+        file_type_of(file.filename)
+    except ValueError:
+        raise HTTPException(status_code=415, detail="Upload a PDF or DOCX contract")
+    data = await file.read()
+    job = jobs.submit(file.filename, data)
+    if job is None:
+        raise HTTPException(status_code=429, detail="Too many pending jobs, retry later",
+                            headers={"Retry-After": "10"})
+    return {"id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return jobs.get(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/{artifact}")
+def job_artifact(job_id: str, artifact: str):
+    if artifact not in ARTIFACTS:
+        raise HTTPException(status_code=404, detail="Unknown artifact")
+    job = jobs.get(job_id)
+    path = job.artifacts.get(artifact)
+    if path is None:
+        raise HTTPException(status_code=409, detail=f"'{artifact}' is not ready (job is {job.status})")
+    filename, media_type = ARTIFACTS[artifact]
+    if artifact == "summary":
+        with open(path, encoding="utf-8") as f:
+            return PlainTextResponse(f.read())
+    return FileResponse(path, media_type=media_type, filename=filename)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health():
+    return {
+        "pending_jobs": jobs.pending,
+        "max_pending_jobs": jobs.max_pending,
+        "model": registry.stats(),
+        "batcher": get_batcher().stats(),
+        "clause_index": get_clause_index().stats() if get_clause_index() else None,
+        "cascade": _cascade_stats(),
+    }
+
+
+def _cascade_stats():
+    if not CASCADE:
+        return None
+    from Clause_cascade import get_cascade
+    cascade = get_cascade(registry.get_label_encoder())
+    return cascade.stats() if cascade else None
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", 8000)))
@@ -0,0 +1,159 @@
+# Bulk contract classification
+#
+# Usage:
+#   python Batch_classify.py <contracts_dir | manifest.txt> --output <dataset_dir> [--workers 4] [--torch-threads 2]
+#
+# Documents are fanned out to worker processes, each holding one model copy. Results are
+# written as a Parquet dataset partitioned by content-hash shard
+# (<dataset_dir>/shard=ab/<content_hash>.parquet), and every finished document is appended
+# to a checkpoint file so a crashed or interrupted run resumes where it stopped.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+
+CHECKPOINT_NAME = "_checkpoint.jsonl"
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+
+def collect_inputs(source):
+    """Contract paths from a directory (recursive) or a manifest with one path per line."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(SUPPORTED_EXTENSIONS))
+        return sorted(paths)
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [line if os.path.isabs(line) else os.path.join(base, line) for line in lines]
+
+
+def load_checkpoint(path):
+    """Paths already written successfully by earlier runs."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a torn last line; that document is simply redone.
+                continue
+            if record.get("status") == "ok":
+                done.add(record["path"])
+    return done
+
+
+def append_checkpoint(path, record):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_partition(output_dir, content_hash, df):
+    partition = os.path.join(output_dir, f"shard={content_hash[:2]}")
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, f"{content_hash}.parquet")
+    # Dot-prefixed, so readers of the dataset skip a file left behind by a crash.
+    tmp = os.path.join(partition, f".{content_hash}.{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+# Worker process
+# Set per worker by _init_worker.
+_PDF_BACKEND = None
+_USE_CACHE = True
+
+
+def _init_worker(torch_threads, pdf_backend, use_cache):
+    import torch
+    from Model_registry import registry
+
+    torch.set_num_threads(torch_threads)
+    global _PDF_BACKEND, _USE_CACHE
+    _PDF_BACKEND, _USE_CACHE = pdf_backend, use_cache
+    registry.warmup(background=False)
+
+
+def _classify_one(path):
+    from Ingestion import load_document
+    from Input_pipeline import classify_contract
+
+    start = time.perf_counter()
+    # Extraction stays in this worker: the pool already uses every core.
+    document = load_document(path, backend=_PDF_BACKEND, workers=1)
+    df = classify_contract(document, output_csv=None, use_cache=_USE_CACHE)
+    df.insert(0, "document", os.path.basename(path))
+    df.insert(1, "content_hash", document.content_hash)
+    df.insert(2, "clause_index", range(len(df)))
+    df["start"] = [c.start for c in document.clauses]
+    df["end"] = [c.end for c in document.clauses]
+    return path, document.content_hash, df, time.perf_counter() - start
+
+
+def run_batch(inputs, output_dir, workers=2, torch_threads=1, pdf_backend=None, use_cache=True):
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = os.path.join(output_dir, CHECKPOINT_NAME)
+    done = load_checkpoint(checkpoint)
+    pending = [p for p in inputs if p not in done]
+    print(f"{len(inputs)} documents, {len(done)} already done, {len(pending)} to classify")
+
+    docs = clauses = errors = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(torch_threads, pdf_backend, use_cache)) as pool:
+        futures = {pool.submit(_classify_one, path): path for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, content_hash, df, seconds = future.result()
+            except Exception as e:
+                errors += 1
+                append_checkpoint(checkpoint, {"path": path, "status": "error", "error": repr(e)})
+                print(f"❌ {path}: {e}")
+                continue
+            write_partition(output_dir, content_hash, df)
+            append_checkpoint(checkpoint, {"path": path, "status": "ok", "content_hash": content_hash,
+                                           "clauses": len(df), "seconds": round(seconds, 3)})
+            docs += 1
+            clauses += len(df)
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ {docs} documents, {clauses} clauses, {errors} errors in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"   {docs / elapsed:.2f} docs/sec, {clauses / elapsed:.1f} clauses/sec")
+    return {"documents": docs, "clauses": clauses, "errors": errors, "seconds": elapsed}
+
+
+def read_dataset(output_dir):
+    """Load every partition of a batch output into one DataFrame."""
+    return pd.read_parquet(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a corpus of contracts into a Parquet dataset.")
+    parser.add_argument("input", help="Directory of PDF/DOCX contracts, or a manifest file with one path per line")
+    parser.add_argument("--output", required=True, help="Output dataset directory")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Worker processes; each loads one model copy")
+    parser.add_argument("--torch-threads", type=int, default=2, help="torch intra-op threads per worker")
+    parser.add_argument("--pdf-backend", choices=("pdfplumber", "pymupdf"), default=None)
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the classification result cache")
+    args = parser.parse_args()
+
+    run_batch(collect_inputs(args.input), args.output, args.workers, args.torch_threads,
+              args.pdf_backend, use_cache=not args.no_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# End-to-end pipeline benchmark
+#
+# Usage:
+#   python Benchmark.py [--stages extraction,segmentation,classification,long_clauses,summarization,report]
+#                       [--output results.json] [--baseline benchmarks/baseline.json] [--save-baseline]
+#
+# Times each stage on fixed inputs: the bundled Franchise Agreement PDF for extraction and
+# segmentation, a sample of combined_clauses.csv for classification (at several batch
+# sizes) and report generation, its longest clauses for long-clause handling (truncated,
+# strided windows batched in one pass, and one window per forward pass), and a local fake LLM with configurable latency for
+# summarisation. Results are written as JSON together with machine information, and
+# compared against a stored baseline: a stage whose median time grew by more than
+# --tolerance is flagged as a regression and the command exits with status 1.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+CONTRACT_PATH = os.path.join(ROOT_DIR, "PfHospitalityGroupInc_20150923_10-12G_EX-10.1_9266710_EX-10.1_Franchise Agreement1.pdf")
+CLAUSES_CSV = os.path.join(ROOT_DIR, "combined_clauses.csv")
+BENCH_DIR = os.path.join(BASE_DIR, "benchmarks")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+STAGES = ("extraction", "segmentation", "classification", "long_clauses", "summarization", "report")
+BATCH_SIZES = (1, 8, 32)
+SAMPLE_SIZE = 256
+LONG_SAMPLE_SIZE = 64
+LLM_LATENCY = 0.05
+REPEAT = 3
+TOLERANCE = 0.20
+# Differences below this many seconds are noise, whatever the ratio.
+NOISE_FLOOR_SECONDS = 0.005
+
+
+def machine_info():
+    info = {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def timed(fn, repeat=REPEAT):
+    """Run ``fn`` ``repeat`` times; returns its last result and the timings."""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return result, {
+        "seconds_median": statistics.median(runs),
+        "seconds_min": min(runs),
+        "runs": len(runs),
+    }
+
+
+def _with_rate(stats, items, unit):
+    stats["items"] = items
+    stats["unit"] = unit
+    stats[f"{unit}_per_second"] = items / stats["seconds_median"] if stats["seconds_median"] else None
+    return stats
+
+
+# Stages
+
+def bench_extraction(context, repeat):
+    from Ingestion import PDF_BACKENDS, load_document
+
+    results = {}
+    for backend in PDF_BACKENDS:
+        try:
+            document, stats = timed(lambda: load_document(context["contract"], backend=backend), repeat)
+        except ImportError as e:
+            results[backend] = {"skipped": str(e)}
+            continue
+        results[backend] = _with_rate(stats, len(document.pages), "pages")
+        context.setdefault("document", document)
+    return results
+
+
+def bench_segmentation(context, repeat):
+    from Clause_segmenter import iter_clauses_from_pages
+    from Ingestion import load_document
+
+    document = context.get("document") or load_document(context["contract"])
+    context["document"] = document
+    clauses, stats = timed(lambda: list(iter_clauses_from_pages(document.pages)), max(repeat, 10))
+    return {"clause_segmenter": _with_rate(stats, len(clauses), "clauses")}
+
+
+def bench_classification(context, repeat):
+    from Input_pipeline import batched_predict_ids
+    from Model_registry import registry
+
+    clauses, true_ids = context["sample"]
+    load_start = time.perf_counter()
+    bundle = registry.get()
+    results = {"model_load_seconds": time.perf_counter() - load_start, "backend": bundle.backend.name}
+
+    for batch_size in context["batch_sizes"]:
+        pred_ids, stats = timed(lambda: batched_predict_ids(bundle.tokenizer, bundle.backend, clauses,
+                                                            max_batch_size=batch_size), repeat)
+        stats["accuracy"] = float(np.mean(pred_ids == true_ids))
+        results[f"batch_{batch_size}"] = _with_rate(stats, len(clauses), "clauses")
+    return results
+
+
+def load_longest_clauses(csv_path, label_encoder, count=LONG_SAMPLE_SIZE):
+    df = pd.read_csv(csv_path, usecols=["Label", "Clause"]).dropna()
+    df = df[df["Label"].isin(label_encoder.classes_)].drop_duplicates("Clause")
+    df = df.loc[df["Clause"].astype(str).str.len().sort_values(ascending=False, kind="stable").index[:count]]
+    return df["Clause"].astype(str).tolist(), label_encoder.transform(df["Label"])
+
+
+def bench_long_clauses(context, repeat):
+    from Input_pipeline import MAX_LENGTH, WINDOW_STRIDE, batched_predict_ids
+    from Model_registry import registry
+
+    clauses, true_ids = context["long_sample"]
+    bundle = registry.get()
+    tokenizer, backend = bundle.tokenizer, bundle.backend
+    windows = tokenizer(clauses, truncation=True, max_length=MAX_LENGTH, stride=WINDOW_STRIDE,
+                        return_overflowing_tokens=True)
+    window_to_clause = np.asarray(windows.pop("overflow_to_sample_mapping"))
+    window_tokens = sum(len(ids) for ids in windows["input_ids"])
+    truncated_tokens = sum(min(len(ids), MAX_LENGTH) for ids in
+                           tokenizer(clauses, truncation=True, max_length=MAX_LENGTH)["input_ids"])
+    results = {
+        "clauses": len(clauses),
+        "over_max_length": int(np.sum(np.bincount(window_to_clause) > 1)),
+        "windows": len(window_to_clause),
+        "truncated_tokens": truncated_tokens,
+        "window_tokens": window_tokens,
+    }
+
+    def one_window_per_pass():
+        # What callers did before: split each clause into windows themselves and run every
+        # window as its own forward pass
+        pred_ids = []
+        for clause in clauses:
+            encoded = tokenizer(clause, truncation=True, max_length=MAX_LENGTH, stride=WINDOW_STRIDE,
+                                return_overflowing_tokens=True)
+            encoded.pop("overflow_to_sample_mapping", None)
+            logits = np.concatenate([
+                backend.logits(tokenizer.pad([{k: encoded[k][i] for k in encoded.keys()}],
+                                             return_tensors=backend.tensor_type))
+                for i in range(len(encoded["input_ids"]))
+            ])
+            pred_ids.append(int(np.argmax(logits.mean(axis=0))))
+        return np.asarray(pred_ids)
+
+    for case, fn in (
+        ("truncate", lambda: batched_predict_ids(tokenizer, backend, clauses, windowed=False)),
+        ("windows_batched", lambda: batched_predict_ids(tokenizer, backend, clauses, windowed=True)),
+        ("windows_one_per_pass", one_window_per_pass),
+    ):
+        pred_ids, stats = timed(fn, repeat)
+        stats["accuracy"] = float(np.mean(pred_ids == true_ids))
+        results[case] = _with_rate(stats, len(clauses), "clauses")
+    return results
+
+
+def bench_summarization(context, repeat):
+    from Fake_llm import FakeOpenAIClient
+    from Ingestion import load_document
+    from Summarisation_pipeline import RateLimiter, hierarchical_summary_openai
+
+    document = context.get("document") or load_document(context["contract"])
+    context["document"] = document
+    clients = []
+
+    def run():
+        client = FakeOpenAIClient(latency=context["llm_latency"])
+        clients.append(client)
+        # No summary cache and no rate limit: this measures chunking and the map/reduce scheduler.
+        return hierarchical_summary_openai(clauses=document.clause_texts, client=client,
+                                           limiter=RateLimiter(10 ** 6, 10 ** 9), cache=False)
+
+    _, stats = timed(run, repeat)
+    stats["llm_latency"] = context["llm_latency"]
+    stats["max_in_flight"] = clients[-1].max_in_flight
+    return {"map_reduce": _with_rate(stats, clients[-1].calls, "calls")}
+
+
+def bench_report(context, repeat):
+    from Input_pipeline import label_ids_to_tiers
+    from Model_registry import registry
+    from Report_Generator import build_pdf_report
+    from Report_graphs import report_graphs
+
+    clauses, true_ids = context["sample"]
+    # The reference labels stand in for predictions, so this stage needs no model.
+    df = pd.DataFrame({
+        "predicted_class_id": true_ids,
+        "Predicted Label": registry.get_label_encoder().inverse_transform(true_ids),
+        "Tier": label_ids_to_tiers(true_ids),
+        "Clause": clauses
+    })
+    summary = "Summary:\n- " + "\n- ".join(c[:200] for c in clauses[:20])
+
+    _, render = timed(lambda: report_graphs(df, cache=False), repeat)
+    graphs = report_graphs(df, cache=False)
+    pdf, build = timed(lambda: build_pdf_report(df, summary, graphs=graphs), repeat)
+    _, full = timed(lambda: build_pdf_report(df, summary, graphs=report_graphs(df, cache=False)), repeat)
+    build["bytes"] = len(pdf.getvalue())
+    return {"graphs": render, "pdf_build": build, "end_to_end": full}
+
+
+BENCHMARKS = {
+    "extraction": bench_extraction,
+    "segmentation": bench_segmentation,
+    "classification": bench_classification,
+    "long_clauses": bench_long_clauses,
+    "summarization": bench_summarization,
+    "report": bench_report,
+}
+
+
+def run_benchmarks(stages=STAGES, contract=CONTRACT_PATH, sample_size=SAMPLE_SIZE, batch_sizes=BATCH_SIZES,
+                   llm_latency=LLM_LATENCY, repeat=REPEAT):
+    context = {
+        "contract": contract,
+        "batch_sizes": batch_sizes,
+        "llm_latency": llm_latency,
+    }
+    if {"classification", "report"} & set(stages):
+        from Inference_backends import load_parity_sample
+        from Model_registry import registry
+        context["sample"] = load_parity_sample(CLAUSES_CSV, registry.get_label_encoder(), sample_size)
+    if "long_clauses" in stages:
+        from Model_registry import registry
+        context["long_sample"] = load_longest_clauses(CLAUSES_CSV, registry.get_label_encoder())
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "config": {"stages": list(stages), "contract": os.path.basename(contract), "sample_size": sample_size,
+                   "batch_sizes": list(batch_sizes), "llm_latency": llm_latency, "repeat": repeat},
+        "stages": {},
+    }
+    for stage in stages:
+        print(f"Benchmarking {stage}...")
+        start = time.perf_counter()
+        results["stages"][stage] = BENCHMARKS[stage](context, repeat)
+        print(f"   done in {time.perf_counter() - start:.1f}s")
+    return results
+
+
+# Baseline comparison
+
+def _timings(stages):
+    """Flatten ``{stage: {case: {seconds_median: ...}}}`` to ``{"stage/case": seconds}``."""
+    flat = {}
+    for stage, cases in stages.items():
+        for case, stats in cases.items():
+            if isinstance(stats, dict) and "seconds_median" in stats:
+                flat[f"{stage}/{case}"] = stats["seconds_median"]
+    return flat
+
+
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    """
+    Per-case comparison of median times against ``baseline``.
+
+    Returns:
+        list[dict]: one row per case present in both, with ``regression`` set when the
+        case got slower by more than ``tolerance`` (and by more than the noise floor).
+    """
+    current, previous = _timings(results["stages"]), _timings(baseline["stages"])
+    rows = []
+    for key in sorted(current.keys() & previous.keys()):
+        now, before = current[key], previous[key]
+        change = (now - before) / before if before else 0.0
+        rows.append({
+            "case": key,
+            "baseline_seconds": before,
+            "seconds": now,
+            "change": change,
+            "regression": change > tolerance and now - before > NOISE_FLOOR_SECONDS,
+        })
+    return rows
+
+
+def print_comparison(rows, results, baseline):
+    if baseline.get("machine", {}).get("platform") != results["machine"]["platform"] or \
+            baseline.get("machine", {}).get("cpu_count") != results["machine"]["cpu_count"]:
+        print("⚠️ Baseline was recorded on a different machine; differences may not be regressions.")
+    for row in rows:
+        flag = "❌ REGRESSION" if row["regression"] else ""
+        print(f"{row['case']:38s} {row['baseline_seconds'] * 1000:10.2f} ms -> {row['seconds'] * 1000:10.2f} ms "
+              f"({row['change']:+.1%}) {flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the contract analysis pipeline.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--contract", default=CONTRACT_PATH)
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, help="Clauses sampled from combined_clauses.csv")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--llm-latency", type=float, default=LLM_LATENCY, help="Seconds per fake LLM call")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--output", help="Results JSON (default: benchmarks/results-<timestamp>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(stages, args.contract, args.sample_size,
+                             tuple(int(b) for b in args.batch_sizes.split(",")), args.llm_latency, args.repeat)
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    output = args.output or os.path.join(BENCH_DIR, f"results-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to '{output}'")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Baseline saved to '{args.baseline}'")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at '{args.baseline}'; run with --save-baseline to record one.")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare_to_baseline(results, baseline, args.tolerance)
+    print_comparison(rows, results, baseline)
+    if any(row["regression"] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Persistent cache of classify_contract results
+#
+# Two levels, both namespaced by the model fingerprint, label-encoder hash, inference
+# backend and clause-splitter version, so a new model or label set never serves stale rows:
+#   - documents: the full classified table per file content hash, stored as Parquet;
+#     a hit is served without loading the model at all.
+#   - clauses:   predicted class id per clause-text hash (SQLite), so an amended version
+#     of a contract only runs inference on new or changed clauses.
+
+import hashlib
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from Ingestion import CLAUSE_SPLITTER_VERSION
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv("CLASSIFICATION_CACHE_DIR", os.path.join(BASE_DIR, "cache", "classification"))
+CACHE_BYPASS_ENV = "CLASSIFICATION_CACHE_BYPASS"
+_SQL_BATCH = 500
+
+
+def clause_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=8)
+def _file_sha256(path, mtime, size):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def file_sha256(path):
+    stat = os.stat(path)
+    return _file_sha256(path, stat.st_mtime, stat.st_size)
+
+
+def model_namespace(registry, variant=None):
+    """
+    Cache namespace for the registry's configured model; computed without loading it.
+    ``variant`` separates predictions made differently with the same model.
+    """
+    parts = [
+        registry.fingerprint(),
+        file_sha256(registry.label_encoder_path),
+        registry.backend_name,
+        f"splitter-v{CLAUSE_SPLITTER_VERSION}",
+    ]
+    namespace = hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:20]
+    if variant:
+        namespace = hashlib.sha256(f"{namespace}|{variant}".encode("utf-8")).hexdigest()[:20]
+    return namespace
+
+
+class ClassificationCache:
+    """
+    Args:
+        namespace (str): Model namespace from ``model_namespace``.
+        cache_dir (str): Root directory for the Parquet tables and the clause database.
+    """
+
+    def __init__(self, namespace, cache_dir=CACHE_DIR):
+        self.namespace = namespace
+        self.documents_dir = os.path.join(cache_dir, "documents", namespace)
+        os.makedirs(self.documents_dir, exist_ok=True)
+        self.document_hits = 0
+        self.document_misses = 0
+        self.clause_hits = 0
+        self.clause_misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "clauses.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS clause_predictions ("
+            " namespace TEXT NOT NULL,"
+            " clause_hash TEXT NOT NULL,"
+            " pred_id INTEGER NOT NULL,"
+            " PRIMARY KEY (namespace, clause_hash))"
+        )
+        self._conn.commit()
+
+    # Document level
+
+    def _document_path(self, document, variant=None):
+        # The extractor is part of the key: PyMuPDF and pdfplumber split the same file differently.
+        suffix = f".{variant}" if variant else ""
+        return os.path.join(self.documents_dir, f"{document.content_hash}.{document.extractor or 'text'}{suffix}.parquet")
+
+    def get_document(self, document, variant=None):
+        path = self._document_path(document, variant)
+        if not os.path.exists(path):
+            self.document_misses += 1
+            return None
+        self.document_hits += 1
+        return pd.read_parquet(path)
+
+    def put_document(self, document, df, variant=None):
+        path = self._document_path(document, variant)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    # Clause level
+
+    def lookup_clauses(self, clauses):
+        """Cached class id per clause, ``-1`` where the clause has not been seen."""
+        hashes = [clause_hash(c) for c in clauses]
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), _SQL_BATCH):
+                batch = hashes[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    "SELECT clause_hash, pred_id FROM clause_predictions"
+                    f" WHERE namespace = ? AND clause_hash IN ({','.join('?' * len(batch))})",
+                    [self.namespace, *batch]
+                ).fetchall()
+                found.update(rows)
+        pred_ids = np.fromiter((found.get(h, -1) for h in hashes), dtype=np.int64, count=len(hashes))
+        hits = int((pred_ids >= 0).sum())
+        self.clause_hits += hits
+        self.clause_misses += len(hashes) - hits
+        return pred_ids
+
+    def store_clauses(self, clauses, pred_ids):
+        rows = [(self.namespace, clause_hash(c), int(p)) for c, p in zip(clauses, pred_ids)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO clause_predictions VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def stats(self):
+        return {
+            "namespace": self.namespace,
+            "document_hits": self.document_hits,
+            "document_misses": self.document_misses,
+            "clause_hits": self.clause_hits,
+            "clause_misses": self.clause_misses,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_classification_cache(registry, variant=None):
+    """
+    Process-wide cache for the registry's current model, or None when bypassed. ``variant``
+    separates predictions made differently with the same model (e.g. through Clause_cascade).
+    """
+    if os.getenv(CACHE_BYPASS_ENV, "").lower() in ("1", "true", "yes"):
+        return None
+    namespace = model_namespace(registry, variant)
+    with _caches_lock:
+        if namespace not in _caches:
+            _caches[namespace] = ClassificationCache(namespace)
+        return _caches[namespace]
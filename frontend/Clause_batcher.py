@@ -0,0 +1,213 @@
+# Cross-request clause batching in front of the classifier
+#
+# Concurrent callers (e.g. API jobs) submit their clauses and get a Future back. A single
+# scheduler thread drains the queue, so clauses from different callers that arrive within
+# a few milliseconds of each other share the same length-bucketed forward passes.
+#
+# Each request remembers the caller's collect_spans() list, so a job's trace still gets a
+# "predict" span for the forward passes its clauses shared (items are the job's clauses,
+# tokens its share of the batch).
+#
+# Set CONTRACT_NLP_MICRO_BATCHING=1 to route Input_pipeline.predict_clause_label and
+# classify_contract through the process-wide batcher as well.
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import replace
+from concurrent.futures import Future
+
+import numpy as np
+
+from Input_pipeline import batched_predict_ids
+from Model_registry import registry
+from Tracing import collect_spans, current_collector
+
+
+MAX_BATCH_CLAUSES = int(os.getenv("CONTRACT_NLP_BATCH_MAX_CLAUSES", 256))
+MAX_WAIT_MS = float(os.getenv("CONTRACT_NLP_BATCH_WAIT_MS", 5.0))
+LATENCY_WINDOW = 4096
+
+
+class BatcherMetrics:
+    """Queue depth, batch-size histogram and request latency of a ``ClauseBatcher``."""
+
+    def __init__(self, max_batch_clauses, window=LATENCY_WINDOW):
+        # Power-of-two upper bounds; the last bucket also takes oversized single requests.
+        self.bucket_bounds = [1 << i for i in range((max(1, max_batch_clauses) - 1).bit_length() + 1)]
+        self.batch_sizes = [0] * len(self.bucket_bounds)
+        self.queued_clauses = 0
+        self.requests = 0
+        self.batches = 0
+        self.clauses = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def queued(self, n):
+        with self._lock:
+            self.queued_clauses += n
+            self.requests += 1
+
+    def dequeued(self, n):
+        with self._lock:
+            self.queued_clauses -= n
+
+    def batch(self, size, latencies, failed=False):
+        bucket = min(max(0, size - 1).bit_length(), len(self.bucket_bounds) - 1)
+        with self._lock:
+            self.batches += 1
+            self.clauses += size
+            self.errors += int(failed)
+            self.batch_sizes[bucket] += 1
+            self._latencies.extend(latencies)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.asarray(self._latencies, dtype=np.float64)
+            snapshot = {
+                "queue_depth": self.queued_clauses,
+                "requests": self.requests,
+                "batches": self.batches,
+                "clauses": self.clauses,
+                "errors": self.errors,
+                "mean_batch_size": round(self.clauses / self.batches, 2) if self.batches else None,
+                "batch_size_histogram": {f"<={b}": n for b, n in zip(self.bucket_bounds, self.batch_sizes)},
+            }
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000.0
+            snapshot["latency_ms"] = {"p50": round(float(p50), 2), "p99": round(float(p99), 2),
+                                      "window": len(latencies)}
+        else:
+            snapshot["latency_ms"] = {"p50": None, "p99": None, "window": 0}
+        return snapshot
+
+
+class ClauseBatcher:
+    """
+    Args:
+        max_batch_clauses (int): Stop collecting once this many clauses are pending.
+        max_wait_ms (float): How long to wait for more requests after the first one arrives.
+        model_registry: Source of the tokenizer and inference backend.
+    """
+
+    def __init__(self, max_batch_clauses=MAX_BATCH_CLAUSES, max_wait_ms=MAX_WAIT_MS, model_registry=registry):
+        self.max_batch_clauses = max_batch_clauses
+        self.max_wait = max_wait_ms / 1000.0
+        self.registry = model_registry
+        self.metrics = BatcherMetrics(max_batch_clauses)
+        self._queue = queue.Queue()
+        # A request that did not fit into the previous batch; it opens the next one.
+        self._carry = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clause-batcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, clauses):
+        """Queue ``clauses``; the returned Future resolves to their predicted class ids."""
+        future = Future()
+        clauses = list(clauses)
+        if not clauses:
+            future.set_result(np.empty(0, dtype=np.int64))
+            return future
+        self.start()
+        self.metrics.queued(len(clauses))
+        self._queue.put((clauses, future, time.perf_counter(), current_collector()))
+        return future
+
+    def predict_clause_labels(self, clauses):
+        """Same contract as ``Input_pipeline.predict_clause_labels``, served through the batcher."""
+        pred_ids = self.submit(clauses).result()
+        if not len(pred_ids):
+            return np.asarray([], dtype=object), pred_ids
+        return self.registry.get_label_encoder().inverse_transform(pred_ids), pred_ids
+
+    def predict_clause_label(self, clause):
+        """Same contract as ``Input_pipeline.predict_clause_label``, served through the batcher."""
+        labels, pred_ids = self.predict_clause_labels([clause])
+        return labels[0], int(pred_ids[0])
+
+    def stats(self):
+        return self.metrics.snapshot()
+
+    def _collect(self):
+        if self._carry is not None:
+            requests, self._carry = [self._carry], None
+        else:
+            requests = [self._queue.get()]
+        pending = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while pending < self.max_batch_clauses:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if pending + len(request[0]) > self.max_batch_clauses:
+                self._carry = request
+                break
+            requests.append(request)
+            pending += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            clauses = [c for request_clauses, _, _, _ in requests for c in request_clauses]
+            self.metrics.dequeued(len(clauses))
+            try:
+                with collect_spans() as spans:
+                    bundle = self.registry.get()
+                    pred_ids = batched_predict_ids(bundle.tokenizer, bundle.backend, clauses)
+            except Exception as e:
+                self._share_spans(requests, spans, len(clauses))
+                for _, future, _, _ in requests:
+                    future.set_exception(e)
+                self._record(requests, len(clauses), failed=True)
+                continue
+            # Spans go to the callers' collectors before their futures resolve.
+            self._share_spans(requests, spans, len(clauses))
+            offset = 0
+            for request_clauses, future, _, _ in requests:
+                future.set_result(pred_ids[offset:offset + len(request_clauses)])
+                offset += len(request_clauses)
+            self._record(requests, len(clauses))
+
+    @staticmethod
+    def _share_spans(requests, spans, size):
+        """Add each request's share of the batch's spans to the collector it was submitted from."""
+        for request_clauses, _, _, collector in requests:
+            if collector is None:
+                continue
+            n = len(request_clauses)
+            for s in spans:
+                collector.append(replace(
+                    s, items=n, tokens=round(s.tokens * n / size) if s.tokens is not None else None,
+                    attrs={**s.attrs, "batch_clauses": size}))
+
+    def _record(self, requests, size, failed=False):
+        now = time.perf_counter()
+        self.metrics.batch(size, [now - submitted for _, _, submitted, _ in requests], failed)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Process-wide batcher shared by every caller."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = ClauseBatcher()
+        return _batcher
@@ -0,0 +1,252 @@
+# Two-stage clause classifier: TF-IDF + logistic regression first, Legal-BERT when unsure
+#
+# Usage:
+#   python Clause_cascade.py calibrate [--csv ../combined_clauses.csv] [--max-accuracy-drop 0.01]
+#   python Clause_cascade.py report
+#
+# ``calibrate`` trains the linear model on part of the labelled clauses, runs both models on
+# the held-out rest and prints accuracy against the fraction of clauses escalated to
+# Legal-BERT for a range of confidence thresholds. The operating point is the lowest
+# escalation whose accuracy is within --max-accuracy-drop of Legal-BERT alone. The linear
+# model is then refitted on all rows and saved with that threshold.
+#
+# Set CONTRACT_NLP_CASCADE=1 to put the cascade in front of every model prediction in
+# Input_pipeline (it wraps the micro-batcher too, so escalated clauses are still batched).
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+from functools import cached_property
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GroupShuffleSplit
+
+from Clause_index import normalize_for_index
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CASCADE_PATH = os.getenv("CONTRACT_NLP_CASCADE_PATH", os.path.join(BASE_DIR, "models", "clause_cascade.joblib"))
+SEED_CSV = os.path.join(BASE_DIR, "..", "combined_clauses.csv")
+DEFAULT_THRESHOLD = 0.9
+MAX_ACCURACY_DROP = 0.01
+HOLDOUT = 0.2
+THRESHOLDS = np.round(np.arange(0.0, 1.0001, 0.05), 2)
+
+
+def train_linear(clauses, ids):
+    """Fit the TF-IDF + multinomial logistic regression stage on clause texts and class ids."""
+    vectorizer = TfidfVectorizer(preprocessor=normalize_for_index, ngram_range=(1, 2), min_df=2,
+                                 sublinear_tf=True, max_features=200_000, dtype=np.float32)
+    features = vectorizer.fit_transform(clauses)
+    classifier = LogisticRegression(C=10.0, max_iter=2000)
+    classifier.fit(features, ids)
+    return vectorizer, classifier
+
+
+class ClauseCascade:
+    """
+    Linear first stage with a confidence gate. ``predictor(fallback)`` gives a drop-in for
+    ``Input_pipeline.predict_clause_labels`` that sends only clauses whose top linear
+    probability is below ``threshold`` to ``fallback``.
+    """
+
+    def __init__(self, vectorizer, classifier, threshold, label_classes, calibration=None):
+        self.vectorizer = vectorizer
+        self.classifier = classifier
+        self.threshold = threshold
+        self.label_classes = list(label_classes)
+        self.calibration = calibration or []
+        self.clauses = 0
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    @cached_property
+    def fingerprint(self):
+        h = hashlib.sha256(f"{self.threshold}|{len(self.vectorizer.vocabulary_)}".encode("utf-8"))
+        h.update(np.ascontiguousarray(self.classifier.coef_).tobytes())
+        return h.hexdigest()[:16]
+
+    def predict_ids(self, clauses):
+        """Linear-stage class ids and their probabilities."""
+        proba = self.classifier.predict_proba(self.vectorizer.transform(clauses))
+        best = proba.argmax(axis=1)
+        return self.classifier.classes_[best].astype(np.int64), proba[np.arange(len(best)), best]
+
+    def predictor(self, fallback):
+        def predict_clause_labels(clauses):
+            clauses = list(clauses)
+            if not clauses:
+                return fallback(clauses)
+            pred_ids, confidence = self.predict_ids(clauses)
+            unsure = np.flatnonzero(confidence < self.threshold)
+            if len(unsure):
+                _, escalated_ids = fallback([clauses[i] for i in unsure])
+                pred_ids[unsure] = escalated_ids
+            with self._lock:
+                self.clauses += len(clauses)
+                self.escalated += len(unsure)
+            labels = np.asarray(self.label_classes, dtype=object)[pred_ids]
+            return labels, pred_ids
+        return predict_clause_labels
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "clauses": self.clauses,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalated / self.clauses if self.clauses else None,
+        }
+
+    def save(self, path=CASCADE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({
+            "vectorizer": self.vectorizer,
+            "classifier": self.classifier,
+            "threshold": self.threshold,
+            "label_classes": self.label_classes,
+            "calibration": self.calibration,
+        }, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=CASCADE_PATH):
+        state = joblib.load(path)
+        return cls(state["vectorizer"], state["classifier"], state["threshold"], state["label_classes"],
+                   state["calibration"])
+
+
+_cascade = None  # (mtime, ClauseCascade or None) of the model file last looked at
+_cascade_lock = threading.Lock()
+_missing_warned = False
+
+
+def get_cascade(label_encoder):
+    """
+    Process-wide cascade, reloaded when the model file is recalibrated; None when it has not
+    been calibrated yet or was trained for another label set.
+    """
+    global _cascade, _missing_warned
+    try:
+        mtime = os.stat(CASCADE_PATH).st_mtime
+    except OSError:
+        if not _missing_warned:
+            print(f"⚠️ No cascade model at '{CASCADE_PATH}'; run: python Clause_cascade.py calibrate")
+            _missing_warned = True
+        return None
+    with _cascade_lock:
+        if _cascade is None or _cascade[0] != mtime:
+            cascade = ClauseCascade.load(CASCADE_PATH)
+            if cascade.label_classes != list(label_encoder.classes_):
+                print(f"⚠️ Cascade model at '{CASCADE_PATH}' was trained for another label set; not used")
+                cascade = None
+            _cascade = (mtime, cascade)
+        return _cascade[1]
+
+
+# Calibration
+
+def group_split(groups, holdout=HOLDOUT, seed=0):
+    """Row indices (train, test), with every row of a group on the same side."""
+    splitter = GroupShuffleSplit(n_splits=1, test_size=holdout, random_state=seed)
+    train, test = next(splitter.split(np.zeros(len(groups)), groups=groups))
+    return np.sort(train), np.sort(test)
+
+
+def calibration_table(linear_ids, confidence, teacher_ids, true_ids, thresholds=THRESHOLDS):
+    """Accuracy and escalated fraction of the cascade at each confidence threshold."""
+    rows = []
+    for threshold in thresholds:
+        escalate = confidence < threshold
+        cascade_ids = np.where(escalate, teacher_ids, linear_ids)
+        rows.append({
+            "threshold": float(threshold),
+            "escalated": float(escalate.mean()),
+            "accuracy": float((cascade_ids == true_ids).mean()),
+        })
+    return rows
+
+
+def choose_threshold(rows, teacher_accuracy, max_accuracy_drop=MAX_ACCURACY_DROP):
+    """Lowest-escalation threshold within ``max_accuracy_drop`` of the teacher alone."""
+    eligible = [r for r in rows if r["accuracy"] >= teacher_accuracy - max_accuracy_drop]
+    if not eligible:
+        return max(rows, key=lambda r: r["accuracy"])
+    return min(eligible, key=lambda r: (r["escalated"], -r["accuracy"]))
+
+
+def calibrate(csv_path=SEED_CSV, holdout=HOLDOUT, max_accuracy_drop=MAX_ACCURACY_DROP, refit=True, seed=0,
+              output=CASCADE_PATH):
+    from Inference_backends import load_parity_sample
+    from Input_pipeline import predict_clause_labels
+    from Model_registry import registry
+
+    label_encoder = registry.get_label_encoder()
+    clauses, true_ids = load_parity_sample(csv_path, label_encoder, sample_size=0)
+    # CUAD repeats a span once per category it belongs to: all copies of a text go to the
+    # same side, so the linear stage is never scored on texts it was trained on.
+    train, test = group_split([normalize_for_index(c) for c in clauses], holdout, seed)
+    test_clauses = [clauses[i] for i in test]
+
+    start = time.perf_counter()
+    vectorizer, classifier = train_linear([clauses[i] for i in train], true_ids[train])
+    print(f"Linear stage trained on {len(train)} clauses in {time.perf_counter() - start:.1f}s")
+    cascade = ClauseCascade(vectorizer, classifier, DEFAULT_THRESHOLD, label_encoder.classes_)
+
+    start = time.perf_counter()
+    linear_ids, confidence = cascade.predict_ids(test_clauses)
+    linear_ms = 1000 * (time.perf_counter() - start) / len(test)
+    start = time.perf_counter()
+    _, teacher_ids = predict_clause_labels(test_clauses)
+    teacher_ms = 1000 * (time.perf_counter() - start) / len(test)
+
+    teacher_accuracy = float((teacher_ids == true_ids[test]).mean())
+    rows = calibration_table(linear_ids, confidence, teacher_ids, true_ids[test])
+    chosen = choose_threshold(rows, teacher_accuracy, max_accuracy_drop)
+
+    print(f"\nHeld-out clauses: {len(test)}  |  Legal-BERT {teacher_ms:.2f} ms/clause, linear {linear_ms:.3f} ms/clause")
+    print(f"Legal-BERT alone: accuracy {teacher_accuracy:.4f}  |  linear alone: accuracy {rows[0]['accuracy']:.4f}")
+    print(f"{'threshold':>9} {'escalated':>10} {'accuracy':>9} {'est. ms/clause':>15}")
+    for r in rows:
+        marker = "  <-" if r is chosen else ""
+        print(f"{r['threshold']:>9.2f} {r['escalated']:>10.1%} {r['accuracy']:>9.4f} "
+              f"{linear_ms + r['escalated'] * teacher_ms:>15.2f}{marker}")
+
+    if refit:
+        vectorizer, classifier = train_linear(clauses, true_ids)
+    cascade = ClauseCascade(vectorizer, classifier, chosen["threshold"], label_encoder.classes_,
+                            calibration=[dict(r, teacher_accuracy=teacher_accuracy) for r in rows])
+    cascade.save(output)
+    print(f"✅ Cascade saved to '{output}' with threshold {chosen['threshold']:.2f} "
+          f"({chosen['escalated']:.1%} escalated, accuracy {chosen['accuracy']:.4f})")
+    return cascade
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the linear + Legal-BERT clause cascade.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="Train the linear stage and choose the escalation threshold.")
+    cal.add_argument("--csv", default=SEED_CSV)
+    cal.add_argument("--holdout", type=float, default=HOLDOUT)
+    cal.add_argument("--max-accuracy-drop", type=float, default=MAX_ACCURACY_DROP)
+    cal.add_argument("--no-refit", action="store_true", help="Keep the model trained on the calibration split only")
+    cal.add_argument("--output", default=CASCADE_PATH)
+    sub.add_parser("report", help="Print the stored calibration table.")
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        calibrate(args.csv, args.holdout, args.max_accuracy_drop, refit=not args.no_refit, output=args.output)
+        return
+    cascade = ClauseCascade.load(CASCADE_PATH)
+    print(f"Threshold {cascade.threshold:.2f}")
+    for r in cascade.calibration:
+        print(f"{r['threshold']:>9.2f} {r['escalated']:>10.1%} {r['accuracy']:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# Near-duplicate clause index
+#
+# Usage:
+#   python Clause_index.py build [--csv ../combined_clauses.csv]
+#   python Clause_index.py add reviewed_contract.csv [--label-column "Predicted Label"]
+#   python Clause_index.py evaluate [--csv ../combined_clauses.csv] [--holdout 0.2]
+#   python Clause_index.py stats
+#
+# Standard clauses (governing law, notices, counterparts...) recur nearly verbatim across
+# contracts. The index maps them to a known label, so classify_contract only runs novel
+# clauses through the model. It is seeded from the labelled combined_clauses.csv and grown
+# from reviewed results (``add``). Classification only consults it with
+# CONTRACT_NLP_CLAUSE_INDEX=1; check ``evaluate`` on your data before turning it on.
+#
+# A clause is looked up in two steps on its normalised text (lower case, punctuation and
+# "(Page n)" markers removed):
+#   - exact: 64-bit hash in a sorted key table;
+#   - near-duplicate: MinHash signature over word 3-shingles, candidates from banded LSH
+#     tables, accepted when the estimated Jaccard similarity reaches the threshold.
+# Everything is stored as .npy arrays and loaded with mmap_mode="r", so opening the index
+# costs almost nothing and concurrent processes share the pages.
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.getenv("CLAUSE_INDEX_DIR", os.path.join(BASE_DIR, "cache", "clause_index"))
+INDEX_BYPASS_ENV = "CLAUSE_INDEX_BYPASS"
+SEED_CSV = os.path.join(BASE_DIR, "..", "combined_clauses.csv")
+INDEX_VERSION = 1
+
+SIMILARITY_THRESHOLD = float(os.getenv("CLAUSE_INDEX_THRESHOLD", 0.9))
+# Short texts ("Parties", a bare date) say too little about the clause type to reuse a label.
+MIN_WORDS = 6
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs at Jaccard 0.9 are candidates with p > 0.999
+# Reviewed labels outvote seed labels for the same text.
+CONFIRMED_VOTE_WEIGHT = 5
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.default_rng(20240611)
+# a < 2**31 and x < 2**32 keep a * x + b inside uint64.
+_PERM_A = _rng.integers(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, np.iinfo(np.int64).max, size=NUM_PERM // LSH_BANDS, dtype=np.uint64) | np.uint64(1)
+
+_PAGE_MARKER = re.compile(r"\(\s*page\s+\d+\s*\)")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_for_index(text):
+    text = _PAGE_MARKER.sub(" ", str(text).lower())
+    return " ".join(_NON_WORD.split(text)).strip()
+
+
+def _exact_key(normalized):
+    return int.from_bytes(hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(words):
+    """MinHash signature (uint32[NUM_PERM]) of a word list's 3-shingles."""
+    n = max(1, len(words) - SHINGLE_WORDS + 1)
+    shingles = {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8")) for i in range(n)}
+    x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    hashed = (_PERM_A[:, None] * x[None, :] + _PERM_B[:, None]) % _PRIME
+    return (hashed.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def band_keys(signatures):
+    """LSH bucket key of every band of every signature: uint64[bands, n]."""
+    signatures = np.asarray(signatures, dtype=np.uint64).reshape(len(signatures), LSH_BANDS, -1)
+    with np.errstate(over="ignore"):
+        return (signatures * _BAND_MIX).sum(axis=2).T % _MERSENNE
+
+
+def _featurize(texts):
+    """Exact keys, signatures and an ``indexable`` mask for ``texts``."""
+    keys = np.zeros(len(texts), dtype=np.uint64)
+    signatures = np.zeros((len(texts), NUM_PERM), dtype=np.uint32)
+    indexable = np.zeros(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        normalized = normalize_for_index(text)
+        words = normalized.split()
+        if len(words) < MIN_WORDS:
+            continue
+        keys[i] = _exact_key(normalized)
+        signatures[i] = minhash(words)
+        indexable[i] = True
+    return keys, signatures, indexable
+
+
+class ClauseIndex:
+    """
+    Read-only view of an index directory; ``build``/``add`` write a new one.
+
+    Files: ``meta.json`` (label names, settings, build id), ``keys.npy`` / ``key_rows.npy``
+    (sorted exact keys and their rows), ``signatures.npy``, ``band_keys.npy`` /
+    ``band_rows.npy`` (per-band sorted LSH keys), ``votes.npy`` (label votes per row) and
+    ``labels.npy`` (winning label per row, -1 when the vote is tied).
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, threshold=SIMILARITY_THRESHOLD):
+        self.index_dir = index_dir
+        self.threshold = threshold
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != INDEX_VERSION or self.meta["num_perm"] != NUM_PERM:
+            raise ValueError(f"Clause index at '{index_dir}' was built with other settings; rebuild it")
+        self.label_names = self.meta["labels"]
+        arrays = {}
+        for name in ("keys", "key_rows", "signatures", "band_keys", "band_rows", "votes", "labels"):
+            arrays[name] = np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        self.__dict__.update(arrays)
+        self.lookups = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self._lock = threading.Lock()
+
+    @property
+    def build_id(self):
+        return self.meta["build_id"]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _candidates(self, signature):
+        rows = set()
+        for band, key in enumerate(band_keys(signature[None, :])[:, 0]):
+            keys = self.band_keys[band]
+            lo, hi = np.searchsorted(keys, key, "left"), np.searchsorted(keys, key, "right")
+            rows.update(self.band_rows[band, lo:hi].tolist())
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def match(self, clauses):
+        """
+        Look ``clauses`` up.
+
+        Returns:
+            tuple[list, np.ndarray]: label name per clause (None when there is no match with
+            an unambiguous label) and the match similarity (1.0 for an exact match, the
+            estimated Jaccard similarity for a near-duplicate, 0.0 for no match).
+        """
+        keys, signatures, indexable = _featurize(clauses)
+        labels = [None] * len(clauses)
+        similarity = np.zeros(len(clauses))
+        exact = fuzzy = 0
+        for i in np.flatnonzero(indexable):
+            pos = np.searchsorted(self.keys, keys[i])
+            if pos < len(self.keys) and self.keys[pos] == keys[i]:
+                label = int(self.labels[self.key_rows[pos]])
+                if label >= 0:
+                    labels[i], similarity[i] = self.label_names[label], 1.0
+                    exact += 1
+                continue
+            rows = self._candidates(signatures[i])
+            if not len(rows):
+                continue
+            rows = rows[np.asarray(self.labels[rows]) >= 0]
+            if not len(rows):
+                continue
+            scores = (np.asarray(self.signatures[rows]) == signatures[i]).mean(axis=1)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                labels[i], similarity[i] = self.label_names[int(self.labels[rows[best]])], float(scores[best])
+                fuzzy += 1
+        with self._lock:
+            self.lookups += len(clauses)
+            self.exact_hits += exact
+            self.fuzzy_hits += fuzzy
+        return labels, similarity
+
+    def lookup_ids(self, clauses, label_encoder):
+        """Class id per clause from the index, ``-1`` where it has no match (or the label is unknown to the model)."""
+        labels, _ = self.match(clauses)
+        known = {name: i for i, name in enumerate(label_encoder.classes_)}
+        return np.fromiter((known.get(label, -1) for label in labels), dtype=np.int64, count=len(labels))
+
+    def stats(self):
+        hits = self.exact_hits + self.fuzzy_hits
+        return {
+            "path": self.index_dir,
+            "rows": len(self),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "hit_rate": hits / self.lookups if self.lookups else None,
+        }
+
+
+# Building
+
+def _write_index(index_dir, label_names, keys, signatures, votes, sources):
+    order = np.argsort(keys, kind="stable")
+    labels = votes.argmax(axis=1).astype(np.int32)
+    top = np.sort(votes, axis=1)
+    if votes.shape[1] > 1:
+        labels[top[:, -1] == top[:, -2]] = -1  # tied vote: let the model decide
+    bands = band_keys(signatures)
+    band_order = np.argsort(bands, axis=1, kind="stable")
+
+    tmp = f"{index_dir}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    os.makedirs(tmp)
+    arrays = {
+        "keys": keys[order],
+        "key_rows": order.astype(np.int64),
+        "signatures": signatures,
+        "band_keys": np.take_along_axis(bands, band_order, axis=1),
+        "band_rows": band_order.astype(np.int32),
+        "votes": votes,
+        "labels": labels,
+        "sources": sources,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "num_perm": NUM_PERM, "bands": LSH_BANDS, "shingle_words": SHINGLE_WORDS,
+                   "min_words": MIN_WORDS, "labels": label_names, "rows": len(keys),
+                   "build_id": uuid.uuid4().hex}, f, indent=2)
+
+    old = None
+    if os.path.exists(index_dir):
+        old = f"{tmp}.old"
+        os.replace(index_dir, old)
+    os.replace(tmp, index_dir)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+    return index_dir
+
+
+def _merge(label_names, keys, signatures, votes, sources, texts, labels, weight, source):
+    """Add labelled texts to index arrays (in memory); returns the new arrays."""
+    new_labels = [label for label in dict.fromkeys(labels) if label not in label_names]
+    label_names = list(label_names) + new_labels
+    votes = np.pad(votes, ((0, 0), (0, len(new_labels))))
+    label_idx = {name: i for i, name in enumerate(label_names)}
+
+    t_keys, t_signatures, indexable = _featurize(texts)
+    row_of = {int(k): i for i, k in enumerate(keys)}
+    added_keys, added_signatures, added_votes = [], [], []
+    for i in np.flatnonzero(indexable):
+        key = int(t_keys[i])
+        row = row_of.get(key)
+        if row is None:
+            row = len(keys) + len(added_keys)
+            row_of[key] = row
+            added_keys.append(key)
+            added_signatures.append(t_signatures[i])
+            added_votes.append(np.zeros(len(label_names), dtype=np.int32))
+        target = votes[row] if row < len(keys) else added_votes[row - len(keys)]
+        target[label_idx[labels[i]]] += weight
+
+    if added_keys:
+        keys = np.concatenate([keys, np.asarray(added_keys, dtype=np.uint64)])
+        signatures = np.concatenate([signatures, np.asarray(added_signatures, dtype=np.uint32)])
+        votes = np.concatenate([votes, np.asarray(added_votes, dtype=np.int32)])
+        sources = np.concatenate([sources, np.full(len(added_keys), source, dtype=np.uint8)])
+    return label_names, keys, signatures, votes, sources
+
+
+def build_index(texts, labels, index_dir=INDEX_DIR):
+    """Build a fresh index from labelled seed clauses."""
+    arrays = _merge([], np.zeros(0, dtype=np.uint64), np.zeros((0, NUM_PERM), dtype=np.uint32),
+                    np.zeros((0, 0), dtype=np.int32), np.zeros(0, dtype=np.uint8),
+                    list(texts), list(labels), weight=1, source=0)
+    return _write_index(index_dir, *arrays)
+
+
+def add_to_index(texts, labels, index_dir=INDEX_DIR, weight=CONFIRMED_VOTE_WEIGHT):
+    """Add reviewed (confirmed) clause labels to an existing index, rewriting it atomically."""
+    index = ClauseIndex(index_dir)
+    arrays = _merge(index.label_names, np.array(index.keys), np.array(index.signatures), np.array(index.votes),
+                    np.load(os.path.join(index_dir, "sources.npy")), list(texts), list(labels), weight=weight, source=1)
+    del index
+    return _write_index(index_dir, *arrays)
+
+
+def load_seed(csv_path=SEED_CSV):
+    df = pd.read_csv(csv_path, usecols=["Label", "Clause"]).dropna()
+    return df["Clause"].astype(str).tolist(), df["Label"].astype(str).tolist()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_clause_index():
+    """
+    Process-wide index, reopened when it has been rebuilt; None when it has not been built
+    or CLAUSE_INDEX_BYPASS is set.
+    """
+    global _index
+    if os.getenv(INDEX_BYPASS_ENV, "").lower() in ("1", "true", "yes"):
+        return None
+    try:
+        mtime = os.stat(os.path.join(INDEX_DIR, "meta.json")).st_mtime
+    except OSError:
+        return None
+    with _index_lock:
+        if _index is None or _index[0] != mtime:
+            _index = (mtime, ClauseIndex(INDEX_DIR))
+        return _index[1]
+
+
+# CLI
+
+def evaluate(csv_path=SEED_CSV, holdout=0.2, seed=0, threshold=SIMILARITY_THRESHOLD, index_dir=None):
+    """
+    Build on part of the labelled data and report hit rate and label precision on the rest.
+
+    The holdout is split by normalised text, so no held-out text is also in the index.
+
+    CUAD is multi-label - the same span appears once per category it belongs to - so
+    ``precision`` counts a hit as correct when its label is any of the labels the text
+    carries in the whole file; ``exact_label_precision`` compares with the held-out row's label only.
+    """
+    import tempfile
+    from sklearn.model_selection import GroupShuffleSplit
+
+    texts, labels = load_seed(csv_path)
+    keys = [normalize_for_index(text) for text in texts]
+    label_sets = {}
+    for key, label in zip(keys, labels):
+        label_sets.setdefault(key, set()).add(label)
+    # Rows repeating a text (one per CUAD category) stay on the same side of the split.
+    splitter = GroupShuffleSplit(n_splits=1, test_size=holdout, random_state=seed)
+    train, test = next(splitter.split(np.zeros(len(texts)), groups=keys))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = build_index([texts[i] for i in train], [labels[i] for i in train], index_dir or os.path.join(tmp, "index"))
+        index = ClauseIndex(path, threshold=threshold)
+        found, similarity = index.match([texts[i] for i in test])
+    hits = [(f, i, s) for f, i, s in zip(found, test, similarity) if f is not None]
+    return {
+        "indexed": len(train),
+        "queries": len(test),
+        "hits": len(hits),
+        "hit_rate": len(hits) / len(test) if len(test) else 0.0,
+        "exact_hits": int(sum(s == 1.0 for _, _, s in hits)),
+        "precision": sum(f in label_sets[keys[i]] for f, i, _ in hits) / len(hits) if hits else None,
+        "exact_label_precision": sum(f == labels[i] for f, i, _ in hits) / len(hits) if hits else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect the near-duplicate clause index.")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = sub.add_parser("build", help="Build the index from labelled clauses.")
+    build_cmd.add_argument("--csv", default=SEED_CSV)
+
+    add_cmd = sub.add_parser("add", help="Add reviewed clause labels (e.g. a corrected classified_contract.csv).")
+    add_cmd.add_argument("csv")
+    add_cmd.add_argument("--clause-column", default="Clause")
+    add_cmd.add_argument("--label-column", default="Predicted Label")
+
+    eval_cmd = sub.add_parser("evaluate", help="Hit rate and precision on a held-out split.")
+    eval_cmd.add_argument("--csv", default=SEED_CSV)
+    eval_cmd.add_argument("--holdout", type=float, default=0.2)
+    eval_cmd.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+
+    sub.add_parser("stats", help="Index size and label coverage.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        texts, labels = load_seed(args.csv)
+        build_index(texts, labels, args.index_dir)
+        print(f"✅ Clause index built from {len(texts)} clauses: {len(ClauseIndex(args.index_dir))} rows in '{args.index_dir}'")
+    elif args.command == "add":
+        df = pd.read_csv(args.csv, usecols=[args.clause_column, args.label_column]).dropna()
+        add_to_index(df[args.clause_column].astype(str).tolist(), df[args.label_column].astype(str).tolist(), args.index_dir)
+        print(f"✅ Added {len(df)} reviewed clauses: {len(ClauseIndex(args.index_dir))} rows in '{args.index_dir}'")
+    elif args.command == "evaluate":
+        print(json.dumps(evaluate(args.csv, args.holdout, threshold=args.threshold), indent=2))
+    else:
+        index = ClauseIndex(args.index_dir)
+        sources = np.load(os.path.join(args.index_dir, "sources.npy"))
+        print(json.dumps({"rows": len(index), "labels": len(index.label_names),
+                          "ambiguous_rows": int((np.asarray(index.labels) < 0).sum()),
+                          "confirmed_rows": int((sources == 1).sum())}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+# Clause segmentation
+#
+# Usage (regression cases, then a benchmark against the legacy re.split splitter):
+#   python Clause_segmenter.py [contract.pdf] [--repeat 20] [--check]
+#
+# A clause starts at a numbered item (1., 1.2, 1.2.3, 1.2(a), 3), (a), (iv)), a bullet, or
+# after a blank line. Headings (all-caps lines, including numbered ones such as
+# "1. RIGHTS GRANTED") are attached to the clause that follows them. A run of more than
+# MAX_HEADING_LINES all-caps lines is a shouted paragraph (e.g. a disclaimer), not a
+# heading: it is kept together with the lines that continue it, but a numbered item or
+# blank line after it starts a new clause. Page-break artifacts - "Page 3 of 39" lines,
+# form feeds, and bare page numbers and running headers/footers at the edges of pages -
+# are cut out of clause text, so a clause broken by a page break comes out whole. Bare
+# numbers and repeated lines elsewhere on a page are clause text.
+#
+# One precompiled, line-anchored pattern finds every event in a single pass, and clauses
+# are yielded lazily as (start, end, text) with offsets into the source text.
+
+import argparse
+import re
+import statistics
+import time
+from collections import Counter
+from typing import NamedTuple
+
+from Tracing import traced
+
+
+# Part of the classification cache namespace: bump whenever segmentation output changes.
+CLAUSE_SPLITTER_VERSION = 4
+MIN_CLAUSE_CHARS = 20
+MAX_HEADING_CHARS = 80
+MAX_HEADING_LINES = 2
+# Page edges are the first/last PAGE_EDGE_LINES non-blank lines of a page. Running
+# headers/footers are edge lines of at least REPEATED_LINE_MIN_PAGES pages (digits ignored,
+# so "Page 3 of 39" repeats too); they and bare page numbers are removed there only.
+PAGE_EDGE_LINES = 2
+REPEATED_LINE_MIN_PAGES = 3
+MIN_REPEATED_LINE_CHARS = 4
+
+
+class Clause(NamedTuple):
+    start: int
+    end: int
+    text: str
+
+
+# Alternatives are matched right after a newline; line-ending ones stop before the next
+# newline so that it can start the following match. Without page boundaries, a bare number
+# is only a page number right before a form feed or at the end of the text.
+_PAGE_NUMBER = r"[-–]?[ \t]*\d{1,4}[ \t]*[-–]?"
+_ARTIFACT = (
+    r"(?:(?:\f+|Page[ \t]+\d+(?:[ \t]+of[ \t]+\d+)?|[-–][ \t]*[ivxlc]{1,6}[ \t]*[-–])[ \t]*(?=\n|$)"
+    r"|" + _PAGE_NUMBER + r"[ \t]*(?=\n?\f|\n*\Z))"
+)
+_BLANK = r"(?=\n)"
+_NUMBERED = (
+    r"(?:"
+    r"\d{1,3}(?:\.\d{1,3})+\.(?:\([a-z0-9]{1,4}\))*(?=\s)"         # 1.2.  1.2.3.(a)
+    r"|\d{1,3}(?:\.\d{1,3})+(?:\([a-z0-9]{1,4}\))+(?=\s)"           # 1.2(a)
+    r"|\d{1,3}(?:\.\d{1,3})+(?=[ \t]+[^\sa-z])"                      # 1.2 Term  (not "3.5 million")
+    r"|\d{1,3}[.)](?:\([a-z0-9]{1,4}\))*(?=\s)"                      # 1.  3)  4.(b)
+    r"|\((?:[a-z]{1,2}|[ivxlc]{1,6}|\d{1,3})\)(?=\s)"                # (a)  (iv)  (12)
+    r"|[•\-–](?=[ \t])"                                              # bullets
+    r")"
+)
+# A heading line does not end in punctuation; an all-caps sentence line (wrapped or not)
+# usually does.
+_HEADING_END = ",;:."
+_HEADING = r"[A-Z][A-Z0-9 \t,;:&'’()/.\-]{3,%d}(?<![,;:.])[ \t]*(?=\n|$)" % MAX_HEADING_CHARS
+
+
+def _repeated_line_pattern(line):
+    """Regex for a running header/footer line, with digit runs generalised."""
+    return r"\d+".join(re.escape(part) for part in re.split(r"\d+", line))
+
+
+# A literal leading newline lets the regex engine skip straight from line to line.
+_EVENTS = re.compile(
+    r"\n[ \t]*(?:" + "|".join([f"(?P<artifact>{_ARTIFACT})", f"(?P<blank>{_BLANK})",
+                               f"(?P<numbered>{_NUMBERED})", f"(?P<heading>{_HEADING})"]) + ")"
+)
+_PAGE_NUMBER_LINE = re.compile(_PAGE_NUMBER)
+
+
+def _is_heading(text):
+    return len(text) <= MAX_HEADING_CHARS and "\n" not in text and text[-1] not in _HEADING_END and \
+        text.upper() == text and any(ch.isalpha() for ch in text)
+
+
+def _segment(text, edge_artifacts=()):
+    """
+    Raw segments of ``text`` between clause starts.
+
+    Yields ``(start, end, artifacts, kind)`` where ``artifacts`` are the ``(start, end)``
+    ranges inside the segment to leave out of its text and ``kind`` is the event that
+    started it (None for the first). ``edge_artifacts`` are whole lines, in order, to cut
+    out as well (page-edge artifacts); they never start a clause.
+    """
+    seg_start = 0
+    seg_kind = None
+    artifacts = []
+    edge = 0
+    # Scanning "\n" + text puts the first line on the same footing as the others; match
+    # offsets in the padded string are then exactly one past the newline.
+    for m in _EVENTS.finditer("\n" + text):
+        kind = m.lastgroup
+        line_start, line_end = m.start(), m.end() - 1
+        while edge < len(edge_artifacts) and edge_artifacts[edge][0] <= line_start:
+            artifacts.append(edge_artifacts[edge])
+            edge += 1
+        if kind == "artifact" or (edge and edge_artifacts[edge - 1][0] == line_start):
+            if kind == "artifact":
+                artifacts.append((line_start, line_end + 1))
+            continue
+        boundary = line_end if kind == "blank" else line_start
+        if boundary > seg_start:
+            yield seg_start, boundary, artifacts, seg_kind
+            artifacts = []
+        seg_start = max(seg_start, boundary)
+        seg_kind = kind
+    artifacts.extend(edge_artifacts[edge:])
+    if seg_start < len(text):
+        yield seg_start, len(text), artifacts, seg_kind
+
+
+def _clean(text, start, end, artifacts):
+    """Stripped segment text without its artifacts, and the offsets it spans."""
+    if not artifacts:
+        piece = text[start:end]
+        stripped = piece.strip()
+        if not stripped:
+            return None
+        lead = len(piece) - len(piece.lstrip())
+        return start + lead, start + lead + len(stripped), stripped
+    pieces = []
+    pos = start
+    for a, b in artifacts:
+        if a > pos:
+            pieces.append((pos, a))
+        pos = max(pos, b)
+    if pos < end:
+        pieces.append((pos, end))
+    pieces = [(a, b) for a, b in pieces if text[a:b].strip()]
+    if not pieces:
+        return None
+    first_a, first_b = pieces[0]
+    last_a, last_b = pieces[-1]
+    clause_start = first_a + len(text[first_a:first_b]) - len(text[first_a:first_b].lstrip())
+    clause_end = last_b - (len(text[last_a:last_b]) - len(text[last_a:last_b].rstrip()))
+    if len(pieces) == 1:
+        return clause_start, clause_end, text[clause_start:clause_end]
+    parts = [text[a:b] for a, b in pieces]
+    parts[0] = text[clause_start:first_b]
+    parts[-1] = text[last_a:clause_end]
+    return clause_start, clause_end, "".join(parts)
+
+
+def _raw_clauses(text, edge_artifacts=()):
+    """Every clause of ``text``, lazily, before the minimum-length filter."""
+    heading = None  # (start, end, text) of heading lines waiting for their clause
+    heading_lines = 0
+    for start, end, artifacts, kind in _segment(text, edge_artifacts):
+        cleaned = _clean(text, start, end, artifacts)
+        if cleaned is None:
+            continue
+        c_start, c_end, c_text = cleaned
+        if _is_heading(c_text):
+            heading = (heading[0], c_end, heading[2] + "\n" + c_text) if heading else cleaned
+            heading_lines += 1
+            continue
+        if heading and heading_lines > MAX_HEADING_LINES and kind != "heading":
+            # Too many lines for a heading: an all-caps paragraph (or a table of contents),
+            # which ends where a numbered item or blank line starts a new clause
+            yield Clause(*heading)
+        elif heading:
+            c_start, c_text = heading[0], heading[2] + "\n" + c_text
+        heading, heading_lines = None, 0
+        yield Clause(c_start, c_end, c_text)
+    if heading:
+        yield Clause(*heading)
+
+
+def iter_clause_spans(text):
+    """
+    Yield a ``Clause`` for every clause of ``text``, as soon as it is segmented.
+
+    ``start``/``end`` index into ``text``; ``text`` of the clause is that span with any
+    page-break artifacts inside it removed. Page edges are only known for text with form
+    feeds; use ``iter_clauses_from_pages`` to also drop running headers/footers.
+    """
+    for clause in _raw_clauses(text):
+        if len(clause.text) > MIN_CLAUSE_CHARS:
+            yield clause
+
+
+@traced("split", items=len)
+def split_into_clauses(text):
+    return [c.text for c in iter_clause_spans(text)]
+
+
+def _edge_line_spans(page_text):
+    """``(start, end, line)`` of a page's edge lines; ``end`` takes in the line's newline."""
+    n = len(page_text)
+    edges = set()
+    # Only the lines at either end are looked at, scanning inwards.
+    for forward in (True, False):
+        found = 0
+        pos = 0 if forward else n
+        while found < PAGE_EDGE_LINES and 0 <= pos <= n:
+            if forward:
+                start, stop = pos, page_text.find("\n", pos)
+                stop = n if stop < 0 else stop
+                pos = stop + 1
+            else:
+                start, stop = page_text.rfind("\n", 0, pos) + 1, pos
+                pos = start - 1
+            line = page_text[start:stop].strip()
+            if line:
+                edges.add((start, min(stop + 1, n), line))
+                found += 1
+    return sorted(edges)
+
+
+def _normalize_edge_line(line):
+    return re.sub(r"\d+", "0", line) if len(line) >= MIN_REPEATED_LINE_CHARS else None
+
+
+def _edge_lines(page_text):
+    return {_normalize_edge_line(line) for _, _, line in _edge_line_spans(page_text)} - {None}
+
+
+def _edge_artifacts(edges, repeated, base=0):
+    """Edge lines that are page numbers or running headers/footers, as ranges from ``base``."""
+    return [(start - base, end - base) for start, end, line in edges
+            if _PAGE_NUMBER_LINE.fullmatch(line) or _normalize_edge_line(line) in repeated]
+
+
+def repeated_page_lines(page_texts, min_pages=REPEATED_LINE_MIN_PAGES):
+    """Running header/footer lines (digits normalised to 0) of a document's pages."""
+    counts = Counter()
+    for page_text in page_texts:
+        counts.update(_edge_lines(page_text))
+    return tuple(sorted(line for line, n in counts.items() if n >= min_pages))
+
+
+def iter_clauses_from_pages(pages):
+    """
+    Segment clauses while pages are still arriving.
+
+    Pages are joined with a newline. Nothing is yielded until ``REPEATED_LINE_MIN_PAGES``
+    pages are in, so running headers and footers are known; after that, every clause but
+    the last one in the buffer is final and yielded, and only the last one (which the next
+    page may extend) is carried over. Offsets index into the joined text.
+
+    Running headers are learned from the pages seen so far, so a header that first appears
+    late in the document is only removed from clauses after it has repeated. Headers, footers
+    and page numbers are only removed from the edges of each page.
+    """
+    counts = Counter()
+    buffer = ""
+    base = 0
+    seen = 0
+    edges = []  # (start, end, line) of the buffered pages' edge lines, in joined-text offsets
+    for page in pages:
+        if not page.text:
+            continue
+        seen += 1
+        page_text = page.text + "\n"
+        page_start = base + len(buffer)
+        page_edges = _edge_line_spans(page_text)
+        counts.update({_normalize_edge_line(line) for _, _, line in page_edges} - {None})
+        edges += [(page_start + start, page_start + end, line) for start, end, line in page_edges]
+        buffer += page_text
+        if seen < REPEATED_LINE_MIN_PAGES:
+            continue
+        repeated = {line for line, n in counts.items() if n >= REPEATED_LINE_MIN_PAGES}
+        clauses = list(_raw_clauses(buffer, _edge_artifacts(edges, repeated, base)))
+        if len(clauses) < 2:
+            continue
+        for clause in clauses[:-1]:
+            if len(clause.text) > MIN_CLAUSE_CHARS:
+                yield Clause(clause.start + base, clause.end + base, clause.text)
+        tail = clauses[-1].start
+        base += tail
+        buffer = buffer[tail:]
+        edges = [edge for edge in edges if edge[0] >= base]
+    repeated = {line for line, n in counts.items() if n >= REPEATED_LINE_MIN_PAGES}
+    for clause in _raw_clauses(buffer, _edge_artifacts(edges, repeated, base)):
+        if len(clause.text) > MIN_CLAUSE_CHARS:
+            yield Clause(clause.start + base, clause.end + base, clause.text)
+
+
+# Benchmark
+
+_LEGACY_BOUNDARY = r'\n\d+\.|\n\d+\)|\n•|\n-|\n\n'
+
+
+def _legacy_split(text):
+    """The original splitter, kept for the benchmark."""
+    clauses = re.split(_LEGACY_BOUNDARY, text)
+    return [c.strip() for c in clauses if len(c.strip()) > 20]
+
+
+class _Page(NamedTuple):
+    text: str
+
+
+# Inputs the segmenter must split at least where the legacy splitter does: each case lists
+# how the clauses it yields start. A list of strings is a document of several pages.
+REGRESSION_CASES = [
+    # An all-caps disclaimer wrapped over several lines must not swallow the next clause.
+    ("2. LIMITATION OF LIABILITY\nIN NO EVENT SHALL EITHER PARTY BE LIABLE FOR ANY INDIRECT OR\n"
+     "CONSEQUENTIAL DAMAGES ARISING OUT OF THIS AGREEMENT OR ITS\n"
+     "TERMINATION EVEN IF ADVISED OF THE POSSIBILITY THEREOF.\n"
+     "3. Governing law. This Agreement is governed by the laws of the State of Delaware.",
+     ["2. LIMITATION OF LIABILITY", "3. Governing law."]),
+    # ... nor be cut in the middle of a sentence when it wraps over more lines than a heading.
+    ("7. Warranty. The Franchisor provides the System as described herein.\n\n"
+     "THE SYSTEM IS PROVIDED AS IS WITHOUT WARRANTY OF ANY KIND\n"
+     "EITHER EXPRESS OR IMPLIED INCLUDING BUT NOT LIMITED TO THE\n"
+     "IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR\n"
+     "PURPOSE AND THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE\n"
+     "OF THE SYSTEM IS WITH THE FRANCHISEE.\n"
+     "8. Notices. Notices shall be given in writing to the addresses above.",
+     ["7. Warranty.", "THE SYSTEM IS PROVIDED AS IS", "8. Notices."]),
+    # A bare number inside a page is clause text, not a page number.
+    ("4. Term. This Agreement commences on September 23,\n2015\nand thereafter continues for ten years.\n"
+     "5. Renewal. The Franchisee may renew this Agreement once.",
+     ["4. Term. This Agreement commences on September 23,\n2015\nand thereafter", "5. Renewal."]),
+    # Running headers are only cut at page edges: the same line in the body stays.
+    ([f"1. Section 1 Overview\nFranchise Agreement between the parties\n{2 * i + 1}. Section {2 * i + 1} Overview\n"
+      f"The Franchisee shall meet obligation number {2 * i + 1} in full.\n"
+      f"{2 * i + 2}. Section {2 * i + 2} Overview\n"
+      f"The Franchisor shall provide support number {2 * i + 2} promptly.\n"
+      f"Franchise Agreement\nPage {i + 1} of 3" for i in range(3)],
+     [f"{n}. Section {n} Overview\nThe Franchis" for n in range(1, 7)]),
+]
+
+
+def check_segmentation(cases=REGRESSION_CASES):
+    """Run the regression cases against the segmenter and the legacy splitter; returns the failures."""
+    failures = []
+    for text, expected in cases:
+        if isinstance(text, list):
+            starts = [c.text for c in iter_clauses_from_pages(_Page(page) for page in text)]
+            text = "\n".join(text)
+        else:
+            starts = [c.text for c in iter_clause_spans(text)]
+        ok = len(starts) == len(expected) and all(c.startswith(e) for c, e in zip(starts, expected))
+        legacy = len(_legacy_split(text))
+        print(f"{'ok  ' if ok else 'FAIL'} {expected[0][:40]!r}: segmenter {len(starts)} clauses, "
+              f"expected {len(expected)}, legacy {legacy}")
+        if not ok:
+            failures.append((text, starts))
+    return failures
+
+
+def benchmark(path, repeat=20):
+    from Ingestion import load_document
+
+    document = load_document(path)
+    text = document.text
+    repeated = repeated_page_lines([p.text for p in document.pages])
+
+    def timed(fn):
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            runs.append(time.perf_counter() - start)
+        return result, statistics.median(runs)
+
+    legacy, legacy_s = timed(lambda: _legacy_split(text))
+    spans, spans_s = timed(lambda: list(iter_clauses_from_pages(document.pages)))
+    _, first_s = timed(lambda: next(iter_clauses_from_pages(document.pages)))
+
+    print(f"Document: {document.source} ({len(document.pages)} pages, {len(text):,} chars)")
+    print(f"Running headers/footers: {list(repeated)}")
+    print(f"legacy re.split:   {len(legacy):4d} clauses  {legacy_s * 1000:7.2f} ms")
+    print(f"Clause_segmenter:  {len(spans):4d} clauses  {spans_s * 1000:7.2f} ms"
+          f"  (first clause after {first_s * 1000:.2f} ms)")
+    if repeated:
+        footer = re.compile("|".join(_repeated_line_pattern(line) for line in repeated))
+        print(f"Clauses containing running header/footer text: legacy {sum(1 for c in legacy if footer.search(c))}, "
+              f"segmenter {sum(1 for c in spans if footer.search(c.text))}")
+    return {"legacy_seconds": legacy_s, "segmenter_seconds": spans_s, "first_clause_seconds": first_s,
+            "legacy_clauses": len(legacy), "segmenter_clauses": len(spans)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clause segmentation on a contract.")
+    parser.add_argument("contract", nargs="?",
+                        default="../PfHospitalityGroupInc_20150923_10-12G_EX-10.1_9266710_EX-10.1_Franchise Agreement1.pdf")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--check", action="store_true", help="Only run the segmentation regression cases")
+    args = parser.parse_args()
+    failures = check_segmentation()
+    if args.check:
+        raise SystemExit(1 if failures else 0)
+    benchmark(args.contract, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# In-process stand-in for the OpenAI client, for exercising the summarisation
+# scheduler without network access or API cost.
+
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeAPIError(Exception):
+    """Carries an HTTP status code the way openai.APIStatusError does."""
+
+    def __init__(self, status_code, message="fake API error"):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+class FakeOpenAIClient:
+    """
+    Mimics ``client.chat.completions.create`` with a fixed latency.
+
+    Args:
+        latency (float): Seconds each call sleeps before answering.
+        failures (list[int], optional): Status codes raised, in order, by the first calls
+            (e.g. ``[429, 503]``) before calls start succeeding.
+        respond (callable, optional): Maps the user prompt to the reply text.
+            Defaults to echoing a short prefix of the prompt.
+
+    ``calls`` counts requests, and ``max_in_flight`` records the highest number of
+    concurrent calls seen, which is what the scheduler's in-flight cap should bound.
+    """
+
+    def __init__(self, latency=0.05, failures=None, respond=None):
+        self.latency = latency
+        self.failures = list(failures or [])
+        self.respond = respond or (lambda prompt: f"Summary of: {prompt.strip()[:60]}")
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompts = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, temperature=0.0, max_tokens=None, **kwargs):
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.calls += 1
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failure = self.failures.pop(0) if self.failures else None
+        try:
+            time.sleep(self.latency)
+            if failure is not None:
+                raise FakeAPIError(failure)
+            message = SimpleNamespace(content=self.respond(prompt))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        finally:
+            with self._lock:
+                self.in_flight -= 1
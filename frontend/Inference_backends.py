@@ -0,0 +1,208 @@
+# Pluggable CPU inference backends for the Legal-BERT clause classifier
+#
+# Usage:
+#   python Inference_backends.py export [--int8]
+#   python Inference_backends.py parity --csv ../combined_clauses.csv --sample 1000
+
+import argparse
+import inspect
+import os
+import time
+
+import numpy as np
+import torch
+
+
+BACKENDS = ("eager", "int8", "onnx")
+BACKEND_ENV = "CONTRACT_NLP_BACKEND"
+ONNX_PATH_ENV = "CONTRACT_NLP_ONNX_PATH"
+ONNX_THREADS_ENV = "CONTRACT_NLP_ONNX_THREADS"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_PATH = os.path.join(BASE_DIR, "models", "legalbert.onnx")
+ONNX_INT8_PATH = os.path.join(BASE_DIR, "models", "legalbert.int8.onnx")
+ONNX_OPSET = 17
+
+
+class EagerBackend:
+    """Full-precision PyTorch forward pass."""
+
+    name = "eager"
+    tensor_type = "pt"
+
+    def __init__(self, model):
+        self.model = model
+
+    def logits(self, inputs):
+        with torch.no_grad():
+            return self.model(**inputs).logits.numpy()
+
+
+class QuantizedBackend(EagerBackend):
+    """
+    PyTorch forward pass with every ``nn.Linear`` dynamically quantized to int8.
+
+    With ``inplace=True`` the given model itself is converted instead of a copy, so the
+    full-precision weights are not kept alongside the int8 ones.
+    """
+
+    name = "int8"
+
+    def __init__(self, model, inplace=False):
+        quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8,
+                                                           inplace=inplace)
+        quantized.eval()
+        super().__init__(quantized)
+
+
+class OnnxBackend:
+    """Exported ONNX graph run through onnxruntime on the CPU execution provider."""
+
+    name = "onnx"
+    tensor_type = "np"
+
+    def __init__(self, onnx_path=None, intra_op_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The 'onnx' backend needs onnxruntime: pip install onnxruntime") from e
+
+        onnx_path = onnx_path or os.getenv(ONNX_PATH_ENV) or ONNX_PATH
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX model not found at '{onnx_path}'. Run: python Inference_backends.py export")
+
+        options = ort.SessionOptions()
+        # One request is one batch, so all cores go to intra-op parallelism.
+        options.intra_op_num_threads = int(intra_op_threads or os.getenv(ONNX_THREADS_ENV) or os.cpu_count() or 1)
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def logits(self, inputs):
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(["logits"], feed)[0]
+
+
+def create_backend(name, model=None, onnx_path=None, inplace=False):
+    if name == "eager":
+        return EagerBackend(model)
+    if name == "int8":
+        return QuantizedBackend(model, inplace=inplace)
+    if name == "onnx":
+        return OnnxBackend(onnx_path)
+    raise ValueError(f"Unknown inference backend '{name}'. Choose one of {BACKENDS}.")
+
+
+# Export / convert
+
+def export_onnx(model, tokenizer, output_path=ONNX_PATH, int8_path=None):
+    """
+    Export the classifier to ONNX with dynamic batch and sequence axes.
+
+    If ``int8_path`` is given, the exported graph is also converted with onnxruntime's
+    dynamic int8 quantization.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    model.eval()
+    sample = tokenizer(["export sample clause", "a second, slightly longer export sample clause"],
+                       padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript exporter honours dynamic_axes on every torch release we support.
+        export_kwargs["dynamo"] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            **export_kwargs,
+        )
+    print(f"✅ ONNX model exported to '{output_path}'")
+
+    if int8_path:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(output_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"✅ int8 ONNX model written to '{int8_path}'")
+    return output_path
+
+
+# Accuracy parity
+
+def load_parity_sample(csv_path, label_encoder, sample_size=1000, seed=0):
+    import pandas as pd
+    df = pd.read_csv(csv_path, usecols=["Label", "Clause"]).dropna()
+    df = df[df["Label"].isin(label_encoder.classes_)]
+    if sample_size and len(df) > sample_size:
+        df = df.sample(sample_size, random_state=seed)
+    return df["Clause"].astype(str).tolist(), label_encoder.transform(df["Label"])
+
+
+def parity_report(backends, tokenizer, clauses, true_ids):
+    """Predict ``clauses`` with each backend; report agreement with the first one, accuracy and latency."""
+    from Input_pipeline import batched_predict_ids
+
+    rows = []
+    reference = None
+    for backend in backends:
+        start = time.perf_counter()
+        pred_ids = batched_predict_ids(tokenizer, backend, clauses)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = pred_ids
+        rows.append({
+            "backend": backend.name,
+            "agreement": float(np.mean(pred_ids == reference)),
+            "accuracy": float(np.mean(pred_ids == true_ids)),
+            "seconds": seconds,
+            "ms_per_clause": 1000 * seconds / max(len(clauses), 1),
+        })
+    return rows
+
+
+def main():
+    from Model_registry import registry
+
+    parser = argparse.ArgumentParser(description="Export and compare CPU inference backends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export", help="Export the classifier to ONNX (optionally int8).")
+    export_cmd.add_argument("--output", default=ONNX_PATH)
+    export_cmd.add_argument("--int8", action="store_true", help=f"Also write {os.path.basename(ONNX_INT8_PATH)}")
+
+    parity_cmd = sub.add_parser("parity", help="Agreement and latency of each backend on labelled clauses.")
+    parity_cmd.add_argument("--csv", default=os.path.join(BASE_DIR, "..", "combined_clauses.csv"))
+    parity_cmd.add_argument("--sample", type=int, default=1000)
+    parity_cmd.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parity_cmd.add_argument("--onnx-path", default=None)
+    args = parser.parse_args()
+
+    registry.configure(backend="eager")
+    bundle = registry.get()
+
+    if args.command == "export":
+        int8_path = os.path.splitext(args.output)[0] + ".int8.onnx" if args.int8 else None
+        export_onnx(bundle.model, bundle.tokenizer, args.output, int8_path)
+        return
+
+    clauses, true_ids = load_parity_sample(args.csv, bundle.label_encoder, args.sample)
+    backends = [create_backend(name, bundle.model, args.onnx_path) for name in args.backends]
+    print(f"Parity check on {len(clauses)} labelled clauses (agreement is against '{backends[0].name}')")
+    print(f"{'backend':<8} {'agreement':>10} {'accuracy':>10} {'seconds':>9} {'ms/clause':>10}")
+    for row in parity_report(backends, bundle.tokenizer, clauses, true_ids):
+        print(f"{row['backend']:<8} {row['agreement']:>10.4f} {row['accuracy']:>10.4f} "
+              f"{row['seconds']:>9.2f} {row['ms_per_clause']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# Document ingestion shared by classification, summarisation and reporting:
+# a contract is read and parsed once into a ContractDocument.
+
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import pdfplumber
+from docx import Document
+
+# Clause splitting lives in Clause_segmenter; re-exported here for existing callers.
+from Clause_segmenter import (
+    CLAUSE_SPLITTER_VERSION, MIN_CLAUSE_CHARS, Clause,
+    iter_clause_spans, iter_clauses_from_pages, split_into_clauses,
+)
+from Tracing import record_span, span, traced
+
+
+@dataclass(frozen=True)
+class Page:
+    number: int
+    text: str
+    start: int
+    end: int
+    seconds: float = 0.0
+
+
+@dataclass
+class ContractDocument:
+    """
+    Parsed contract. ``start``/``end`` offsets on pages and clauses index into ``text``
+    (a clause's own text is its span with page-break artifacts cut out), ``content_hash``
+    is the SHA-256 of the uploaded file's bytes and ``extractor`` names the text backend
+    that produced ``text``.
+    """
+    source: str
+    file_type: str
+    content_hash: str
+    text: str
+    pages: list = field(default_factory=list)
+    clauses: list = field(default_factory=list)
+    extractor: str = ""
+
+    @property
+    def clause_texts(self):
+        return [c.text for c in self.clauses]
+
+    @property
+    def extraction_seconds(self):
+        """Summed per-page extraction time (CPU time across workers, not wall time)."""
+        return sum(p.seconds for p in self.pages)
+
+
+# Text extraction
+# PDF pages are extracted over page ranges and streamed back in page order, so clause
+# splitting can start before the last page is read. Extraction is serial by default; set
+# CONTRACT_NLP_EXTRACT_WORKERS>1 to spread long documents over a process pool. Workers are
+# spawned rather than forked, since the hosts (Streamlit, the API job threads) are threaded.
+
+PDF_BACKENDS = ("pdfplumber", "pymupdf")
+PDF_BACKEND = os.getenv("CONTRACT_NLP_PDF_BACKEND", "pdfplumber")
+EXTRACT_WORKERS = int(os.getenv("CONTRACT_NLP_EXTRACT_WORKERS", 1))
+PAGES_PER_TASK = 8
+# Below this many pages, process start-up costs more than it saves.
+PARALLEL_MIN_PAGES = 24
+
+
+@dataclass(frozen=True)
+class ExtractedPage:
+    number: int
+    text: str
+    seconds: float
+
+
+def _open_pymupdf(source):
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    if isinstance(source, (bytes, bytearray)):
+        return pymupdf.open(stream=source, filetype="pdf")
+    return pymupdf.open(source)
+
+
+def _as_file(source):
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+
+def _page_count(source, backend):
+    if backend == "pymupdf":
+        with _open_pymupdf(source) as doc:
+            return doc.page_count
+    with pdfplumber.open(_as_file(source)) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_page_range(source, start, stop, backend):
+    """Extract pages ``[start, stop)`` (0-based) and time each one."""
+    results = []
+    if backend == "pymupdf":
+        with _open_pymupdf(source) as doc:
+            for i in range(start, stop):
+                t0 = time.perf_counter()
+                text = doc[i].get_text("text")
+                results.append(ExtractedPage(i + 1, text, time.perf_counter() - t0))
+    elif backend == "pdfplumber":
+        # Only the requested pages are parsed, not the whole page tree.
+        with pdfplumber.open(_as_file(source), pages=range(start + 1, stop + 1)) as pdf:
+            for page in pdf.pages:
+                t0 = time.perf_counter()
+                text = page.extract_text()
+                # pdfplumber caches parsed page objects; release them on long documents.
+                page.close()
+                results.append(ExtractedPage(page.page_number, text, time.perf_counter() - t0))
+    else:
+        raise ValueError(f"Unknown PDF backend '{backend}'. Choose one of {PDF_BACKENDS}.")
+    return results
+
+
+# Set once per worker process so large uploads are not re-sent with every page range.
+_worker_source = None
+
+
+def _init_worker(source):
+    global _worker_source
+    _worker_source = source
+
+
+def _extract_worker_range(start, stop, backend):
+    return _extract_page_range(_worker_source, start, stop, backend)
+
+
+def iter_pdf_pages(source, backend=None, workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Yield an ``ExtractedPage`` per PDF page, in page order, as soon as it is available.
+
+    Args:
+        source (str | bytes): Path to the PDF or its contents.
+        backend (str, optional): ``pdfplumber`` (default) or ``pymupdf``; PyMuPDF is several
+            times faster but lays out text slightly differently.
+        workers (int, optional): Worker processes (default ``EXTRACT_WORKERS``). Short
+            documents are read serially.
+        pages_per_task (int): Pages per task sent to a worker.
+    """
+    backend = backend or PDF_BACKEND
+    workers = EXTRACT_WORKERS if workers is None else workers
+    count = _page_count(source, backend)
+
+    if workers <= 1 or count < PARALLEL_MIN_PAGES:
+        for start in range(0, count, pages_per_task):
+            yield from _extract_page_range(source, start, min(start + pages_per_task, count), backend)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(source,)) as pool:
+        futures = [pool.submit(_extract_worker_range, start, min(start + pages_per_task, count), backend)
+                   for start in range(0, count, pages_per_task)]
+        for future in futures:
+            yield from future.result()
+
+
+def _docx_text(source):
+    doc = Document(source)
+    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+
+
+def _iter_docx_pages(source):
+    # Word documents have no fixed pagination; the body is treated as one page.
+    t0 = time.perf_counter()
+    text = _docx_text(_as_file(source))
+    yield ExtractedPage(1, text, time.perf_counter() - t0)
+
+
+def extract_text_from_pdf(pdf_path, backend=None, workers=None):
+    with span("extract", file_type="pdf", backend=backend or PDF_BACKEND) as s:
+        pages = list(iter_pdf_pages(pdf_path, backend, workers))
+        s.items = len(pages)
+    # Pages with no extractable text (scans, blank pages) are skipped.
+    return "".join([p.text + "\n" for p in pages if p.text])
+
+
+@traced("extract")
+def extract_text_from_docx(docx_path):
+    return _docx_text(docx_path)
+
+
+# Loading
+
+def file_type_of(name):
+    name = name.lower()
+    if name.endswith(".pdf"):
+        return "pdf"
+    if name.endswith(".docx"):
+        return "docx"
+    raise ValueError("Unsupported file type")
+
+
+def load_document(file_path=None, data=None, filename=None, backend=None, workers=None):
+    """
+    Read and parse a PDF or DOCX contract once.
+
+    PDF pages are streamed (in parallel when ``workers`` > 1, see ``iter_pdf_pages``) and
+    clauses are split as pages arrive.
+
+    Args:
+        file_path (str, optional): Path to the contract.
+        data (bytes, optional): File contents, e.g. a Streamlit upload; needs ``filename``.
+        filename (str, optional): Name used for the file type and ``source``.
+        backend (str, optional): PDF text backend, ``pdfplumber`` or ``pymupdf``.
+        workers (int, optional): Extraction worker processes (default ``EXTRACT_WORKERS``).
+
+    Returns:
+        ContractDocument
+    """
+    if data is None:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    filename = filename or os.path.basename(file_path)
+    file_type = file_type_of(filename)
+
+    if file_type == "pdf":
+        extractor = backend or PDF_BACKEND
+        extracted = iter_pdf_pages(data, extractor, workers)
+    else:
+        extractor = "python-docx"
+        extracted = _iter_docx_pages(data)
+
+    pages = []
+    parts = []
+    offset = 0
+    extract_seconds = 0.0
+
+    def _collect():
+        nonlocal offset, extract_seconds
+        extracted_pages = iter(extracted)
+        while True:
+            # Extraction and splitting interleave; only the wait for the next page is extraction.
+            t0 = time.perf_counter()
+            page = next(extracted_pages, None)
+            extract_seconds += time.perf_counter() - t0
+            if page is None:
+                return
+            # Pages with no extractable text (scans, blank pages) are skipped.
+            if not page.text:
+                continue
+            pages.append(Page(page.number, page.text, offset, offset + len(page.text), page.seconds))
+            parts.append(page.text + "\n")
+            offset += len(page.text) + 1
+            yield page
+
+    t0 = time.perf_counter()
+    clauses = list(iter_clauses_from_pages(_collect()))
+    record_span("extract", extract_seconds, items=len(pages), file_type=file_type, backend=extractor)
+    record_span("split", time.perf_counter() - t0 - extract_seconds, items=len(clauses))
+    return ContractDocument(
+        source=filename,
+        file_type=file_type,
+        content_hash=hashlib.sha256(data).hexdigest(),
+        text="".join(parts),
+        pages=pages,
+        clauses=clauses,
+        extractor=extractor,
+    )
+
+
+def as_document(file_or_document):
+    """Accept either a path or an already-parsed ContractDocument."""
+    if isinstance(file_or_document, ContractDocument):
+        return file_or_document
+    return load_document(file_or_document)
@@ -1,87 +1,334 @@
 # backend/input_processor.py
 
-import re
-import torch
-import joblib
+import numpy as np
 import pandas as pd
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import pdfplumber
-from docx import Document
 import os
+from Model_registry import MODEL_REPO, LABEL_ENCODER_PATH, registry
+# Extraction and clause splitting live in Ingestion; re-exported here for existing callers.
+from Ingestion import as_document, extract_text_from_pdf, extract_text_from_docx, split_into_clauses
+from Classification_cache import get_classification_cache, model_namespace
+from Clause_index import get_clause_index
+from Tracing import span
 
 
-LABEL_ENCODER_PATH = ("D:\AI\Projects\Contract_NLP\label_encoder.pkl")
 OUTPUT_CSV_PATH = ("D:\AI\Projects\Contract_NLP\output\classified_contract.csv")
 
-# Text extraction
+# Model, tokenizer and label encoder are loaded lazily by Model_registry on first prediction
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    return text
 
-def extract_text_from_docx(docx_path):
-    doc = Document(docx_path)
-    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+# Prediction
 
-def split_into_clauses(text):
-    clauses = re.split(r'\n\d+\.|\n\d+\)|\n•|\n-|\n\n', text)
-    return [c.strip() for c in clauses if len(c.strip()) > 20]
+MAX_LENGTH = 512
+# Micro-batches are capped by padded tokens (longest clause in the batch x batch size)
+# so a handful of long clauses never drags a whole batch of short ones up to 512 tokens.
+MAX_BATCH_TOKENS = 8192
+MAX_BATCH_SIZE = 32
+# Route predictions through the process-wide Clause_batcher, so concurrent callers share
+# forward passes instead of each running their own small ones.
+MICRO_BATCHING = os.getenv("CONTRACT_NLP_MICRO_BATCHING", "").lower() in ("1", "true", "yes")
+# Long-clause mode: clauses over MAX_LENGTH tokens are split into overlapping windows
+# (WINDOW_STRIDE tokens shared between neighbours) that are batched with everything else,
+# and their logits are pooled back per clause ("mean" or "max") instead of the clause
+# being judged on its first MAX_LENGTH tokens.
+WINDOWED = os.getenv("CONTRACT_NLP_WINDOWED", "").lower() in ("1", "true", "yes")
+WINDOW_STRIDE = int(os.getenv("CONTRACT_NLP_WINDOW_STRIDE", 128))
+WINDOW_POOLING = os.getenv("CONTRACT_NLP_WINDOW_POOLING", "mean")
+# Classify with the TF-IDF + linear stage of Clause_cascade first and only send clauses it
+# is unsure about to Legal-BERT.
+CASCADE = os.getenv("CONTRACT_NLP_CASCADE", "").lower() in ("1", "true", "yes")
+# Take labels of (near-)duplicates of labelled clauses from Clause_index instead of the
+# model. Off by default: on a holdout split by clause text, the index built from
+# combined_clauses.csv answers ~0.5% of clauses with ~55% label precision.
+CLAUSE_INDEX = os.getenv("CONTRACT_NLP_CLAUSE_INDEX", "").lower() in ("1", "true", "yes")
 
-# Load model and label encoder (from Hugging Face)
+DEFAULT_TIER = 5
+LABEL_ID_TO_TIER = {
+    0: 5, 1: 5, 2: 5, 3: 5, 4: 1, 5: 1, 6: 1, 7: 3, 8: 2, 9: 2,
+    10: 5, 11: 5, 12: 5, 13: 1, 14: 5, 15: 5, 16: 1, 17: 1, 18: 2,
+    19: 2, 20: 2, 21: 2, 22: 1, 23: 2, 24: 2, 25: 2, 26: 2, 27: 1,
+    28: 2, 29: 2, 30: 4, 31: 4, 32: 5, 33: 5, 34: 2, 35: 2, 36: 4,
+    37: 3, 38: 3, 39: 2, 40: 2, 41: 1, 42: 4, 43: 1, 44: 2, 45: 2, 46: 3
+}
 
-MODEL_REPO = "bhargav-07-bidkar/Legalbert_Finetuned"
+_TIER_LOOKUP = np.full(max(LABEL_ID_TO_TIER) + 1, DEFAULT_TIER, dtype=np.int64)
+_TIER_LOOKUP[list(LABEL_ID_TO_TIER)] = list(LABEL_ID_TO_TIER.values())
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_REPO)
-model = AutoModelForSequenceClassification.from_pretrained(MODEL_REPO)
-model.eval()
 
-le = joblib.load(LABEL_ENCODER_PATH)
+def label_ids_to_tiers(pred_ids):
+    """Vectorised ``LABEL_ID_TO_TIER.get(pred_id, DEFAULT_TIER)`` over an array of ids."""
+    pred_ids = np.asarray(pred_ids, dtype=np.int64)
+    tiers = np.full(pred_ids.shape, DEFAULT_TIER, dtype=np.int64)
+    known = (pred_ids >= 0) & (pred_ids < len(_TIER_LOOKUP))
+    tiers[known] = _TIER_LOOKUP[pred_ids[known]]
+    return tiers
 
 
-# Prediction
+def _cascade():
+    if not CASCADE:
+        return None
+    from Clause_cascade import get_cascade
+    return get_cascade(registry.get_label_encoder())
+
+
+def _resolve_predictor(predictor=None):
+    if predictor is None and MICRO_BATCHING:
+        from Clause_batcher import get_batcher
+        predictor = get_batcher().predict_clause_labels
+    predictor = predictor or predict_clause_labels
+    cascade = _cascade()
+    return cascade.predictor(predictor) if cascade is not None else predictor
+
+
+def _classification_variant():
+    # Cascade and windowed predictions differ from plain Legal-BERT ones, so each setting is
+    # cached under its own namespace.
+    cascade = _cascade()
+    variant = []
+    if cascade is not None:
+        variant.append(f"cascade-{cascade.fingerprint}")
+    if WINDOWED:
+        variant.append(f"windows-{WINDOW_STRIDE}-{WINDOW_POOLING}")
+    return "|".join(variant) or None
+
+
+def _classification_cache():
+    return get_classification_cache(registry, _classification_variant())
+
+
+def classification_namespace(use_index=None):
+    """
+    Identifies the classifier ``classify_clauses`` would use - model, label encoder, backend,
+    splitter, cascade, windowing and, when ``use_index`` applies, the clause index build -
+    without loading the model. Labels made under another namespace may differ.
+    """
+    variant = [_classification_variant()]
+    index = get_clause_index() if (CLAUSE_INDEX if use_index is None else use_index) else None
+    if index is not None:
+        variant.append(f"index-{index.build_id[:12]}")
+    return model_namespace(registry, "|".join(v for v in variant if v) or None)
+
 
 def predict_clause_label(clause):
-    inputs = tokenizer(clause, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        pred_id = torch.argmax(outputs.logits, dim=-1).item()
+    if _cascade() is not None:
+        labels, pred_ids = _resolve_predictor()([clause])
+        return labels[0], int(pred_ids[0])
+    if MICRO_BATCHING:
+        from Clause_batcher import get_batcher
+        return get_batcher().predict_clause_label(clause)
+    bundle = registry.get()
+    tokenizer, backend, le = bundle.tokenizer, bundle.backend, bundle.label_encoder
+    if WINDOWED:
+        pred_id = int(batched_predict_ids(tokenizer, backend, [clause])[0])
+        return le.inverse_transform([pred_id])[0], pred_id
+    with span("predict", items=1, backend=backend.name) as s:
+        inputs = tokenizer(clause, return_tensors=backend.tensor_type, truncation=True, padding=True, max_length=MAX_LENGTH)
+        s.tokens = int(inputs["input_ids"].shape[-1])
+        pred_id = int(np.argmax(backend.logits(inputs), axis=-1)[0])
     return le.inverse_transform([pred_id])[0], pred_id
 
-def classify_contract(file_path, output_csv=OUTPUT_CSV_PATH):
-    if file_path.lower().endswith(".pdf"):
-        text = extract_text_from_pdf(file_path)
-    elif file_path.lower().endswith(".docx"):
-        text = extract_text_from_docx(file_path)
-    else:
-        raise ValueError("Unsupported file type")
-
-    clauses = split_into_clauses(text)
-
-    label_id_to_tier = {
-        0: 5, 1: 5, 2: 5, 3: 5, 4: 1, 5: 1, 6: 1, 7: 3, 8: 2, 9: 2,
-        10: 5, 11: 5, 12: 5, 13: 1, 14: 5, 15: 5, 16: 1, 17: 1, 18: 2,
-        19: 2, 20: 2, 21: 2, 22: 1, 23: 2, 24: 2, 25: 2, 26: 2, 27: 1,
-        28: 2, 29: 2, 30: 4, 31: 4, 32: 5, 33: 5, 34: 2, 35: 2, 36: 4,
-        37: 3, 38: 3, 39: 2, 40: 2, 41: 1, 42: 4, 43: 1, 44: 2, 45: 2, 46: 3
-    }
-
-    results = []
-    for clause in clauses:
-        label, pred_id = predict_clause_label(clause)
-        tier = label_id_to_tier.get(pred_id, 5)
-        results.append({
-            "predicted_class_id": pred_id,
-            "Predicted Label": label,
-            "Tier": tier,
-            "Clause": clause
+
+def length_bucketed_batches(lengths, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Group indices into micro-batches of similar token length.
+
+    Indices are visited in ascending length order and a batch is closed as soon as adding
+    the next item would push ``padded_length * batch_size`` over ``max_batch_tokens`` or the
+    batch would exceed ``max_batch_size``. A single item longer than the budget still gets
+    its own batch.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(lengths, kind="stable")
+    batches = []
+    current = []
+    for idx in order:
+        # Lengths are ascending, so the item being added is the longest in the batch.
+        padded_tokens = int(lengths[idx]) * (len(current) + 1)
+        if current and (padded_tokens > max_batch_tokens or len(current) >= max_batch_size):
+            batches.append(np.asarray(current, dtype=np.int64))
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(np.asarray(current, dtype=np.int64))
+    return batches
+
+
+def _pool_window_logits(logits, window_to_clause, n_clauses, pooling=WINDOW_POOLING):
+    """Combine per-window logits into one row per clause."""
+    if pooling == "max":
+        pooled = np.full((n_clauses, logits.shape[1]), -np.inf, dtype=logits.dtype)
+        np.maximum.at(pooled, window_to_clause, logits)
+        return pooled
+    if pooling != "mean":
+        raise ValueError(f"Unknown window pooling '{pooling}'; expected 'mean' or 'max'")
+    pooled = np.zeros((n_clauses, logits.shape[1]), dtype=logits.dtype)
+    np.add.at(pooled, window_to_clause, logits)
+    return pooled / np.bincount(window_to_clause, minlength=n_clauses)[:, None]
+
+
+def batched_predict_ids(tokenizer, backend, clauses, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE,
+                        windowed=None, stride=None):
+    """
+    Predict class ids for ``clauses`` with one forward pass per length-bucketed micro-batch.
+
+    All clauses are tokenized in one call, sorted by token length and packed into padded
+    micro-batches (see ``length_bucketed_batches``). Padding is masked out by the attention
+    mask, so the predictions are the ones the per-clause path produces.
+
+    With ``windowed`` (default ``WINDOWED``), clauses longer than ``MAX_LENGTH`` tokens
+    become overlapping windows sharing ``stride`` tokens. The windows are bucketed together
+    with the short clauses and their logits are pooled per clause, so the extra work is
+    the overflow tokens (plus the overlaps) rather than extra passes per long clause.
+    """
+    clauses = list(clauses)
+    pred_ids = np.empty(len(clauses), dtype=np.int64)
+    if not clauses:
+        return pred_ids
+    windowed = WINDOWED if windowed is None else windowed
+    if windowed and not getattr(tokenizer, "is_fast", False):
+        print("⚠️ Windowed long-clause mode needs a fast tokenizer; truncating at MAX_LENGTH instead")
+        windowed = False
+
+    with span("predict", items=len(clauses), backend=backend.name) as s:
+        if windowed:
+            encodings = tokenizer(clauses, truncation=True, max_length=MAX_LENGTH,
+                                  stride=WINDOW_STRIDE if stride is None else stride, return_overflowing_tokens=True)
+            window_to_clause = np.asarray(encodings.pop("overflow_to_sample_mapping"), dtype=np.int64)
+        else:
+            encodings = tokenizer(clauses, truncation=True, max_length=MAX_LENGTH)
+            window_to_clause = None
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        keys = list(encodings.keys())
+        batches = length_bucketed_batches(lengths, max_batch_tokens, max_batch_size)
+        s.tokens = sum(lengths)
+        s.attrs["batches"] = len(batches)
+
+        logits = None
+        for batch in batches:
+            features = [{k: encodings[k][i] for k in keys} for i in batch]
+            inputs = tokenizer.pad(features, return_tensors=backend.tensor_type)
+            batch_logits = np.asarray(backend.logits(inputs))
+            if logits is None:
+                logits = np.empty((len(lengths), batch_logits.shape[1]), dtype=batch_logits.dtype)
+            logits[batch] = batch_logits
+        if window_to_clause is not None:
+            s.attrs["windows"] = len(lengths)
+            logits = _pool_window_logits(logits, window_to_clause, len(clauses))
+        pred_ids[:] = np.argmax(logits, axis=-1)
+    return pred_ids
+
+
+def predict_clause_labels(clauses, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Batched counterpart of ``predict_clause_label``, using the registry's model and backend.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: predicted labels and predicted class ids, in input order.
+    """
+    clauses = list(clauses)
+    if not clauses:
+        return np.asarray([], dtype=object), np.empty(0, dtype=np.int64)
+
+    bundle = registry.get()
+    pred_ids = batched_predict_ids(bundle.tokenizer, bundle.backend, clauses, max_batch_tokens, max_batch_size)
+    return bundle.label_encoder.inverse_transform(pred_ids), pred_ids
+
+
+def _predict_with_clause_cache(clauses, cache, predictor=None, index=None, sources=None):
+    """
+    Predict only the clauses neither the clause-level cache nor the near-duplicate clause
+    index (see Clause_index) can answer; returns (labels, ids).
+
+    ``sources``, if given, is filled with how many clauses each path answered.
+    """
+    predictor = _resolve_predictor(predictor)
+    if cache is None and index is None:
+        if sources is not None:
+            sources.update(cache=0, index=0, model=len(clauses))
+        return predictor(clauses)
+
+    pred_ids = cache.lookup_clauses(clauses) if cache is not None else np.full(len(clauses), -1, dtype=np.int64)
+    missing = np.flatnonzero(pred_ids < 0)
+    cache_hits = len(clauses) - len(missing)
+    index_hits = 0
+    if len(missing) and index is not None:
+        with span("index_lookup", items=len(missing)) as s:
+            found = index.lookup_ids([clauses[i] for i in missing], registry.get_label_encoder())
+            pred_ids[missing] = found
+            index_hits = s.attrs["hits"] = int((found >= 0).sum())
+        missing = missing[found < 0]
+    if len(missing):
+        new_clauses = [clauses[i] for i in missing]
+        _, new_ids = predictor(new_clauses)
+        pred_ids[missing] = new_ids
+        if cache is not None:
+            cache.store_clauses(new_clauses, new_ids)
+    if sources is not None:
+        sources.update(cache=cache_hits, index=index_hits, model=len(missing))
+    if not len(pred_ids):
+        return np.asarray([], dtype=object), pred_ids
+    # Decoding needs only the label encoder, so a fully cached document never loads the model.
+    return registry.get_label_encoder().inverse_transform(pred_ids), pred_ids
+
+
+def classify_clauses(clauses, use_cache=True, predictor=None, use_index=None):
+    """
+    Labels and class ids for clause texts, through the clause-level cache and the clause index.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: predicted labels and predicted class ids, in input order.
+    """
+    cache = _classification_cache() if use_cache else None
+    index = get_clause_index() if (CLAUSE_INDEX if use_index is None else use_index) else None
+    return _predict_with_clause_cache(list(clauses), cache, predictor, index)
+
+
+def classify_contract(file_path, output_csv=OUTPUT_CSV_PATH, use_cache=True, predictor=None, use_index=None):
+    """
+    Classify every clause of a contract.
+
+    ``file_path`` may be a path or a ``ContractDocument`` from ``Ingestion.load_document``;
+    passing the document avoids parsing the file again. Rows follow ``document.clauses``.
+
+    With ``use_cache`` (default), a file classified before by the same model is served from
+    the Parquet result cache without loading the model, and otherwise only clauses not seen
+    before are run through the model (see Classification_cache).
+
+    With ``use_index`` (default ``CLAUSE_INDEX``, i.e. CONTRACT_NLP_CLAUSE_INDEX=1), clauses
+    that are (near-)duplicates of labelled ones in the clause index (Clause_index) take their
+    label from it; its hit rate for the document is printed and kept in
+    ``df.attrs["clause_sources"]``.
+
+    ``predictor`` replaces ``predict_clause_labels`` for the clauses that do need the model,
+    e.g. ``Clause_batcher.ClauseBatcher.predict_clause_labels`` to share forward passes
+    with other concurrent requests; ``CONTRACT_NLP_MICRO_BATCHING=1`` makes that the default.
+    """
+    document = as_document(file_path)
+    cache = _classification_cache() if use_cache else None
+    index = get_clause_index() if (CLAUSE_INDEX if use_index is None else use_index) else None
+    # Index labels differ from model labels, so cached tables are kept per index build.
+    variant = f"index-{index.build_id[:12]}" if index is not None else None
+
+    df = cache.get_document(document, variant) if cache is not None else None
+    if df is None:
+        clauses = document.clause_texts
+        sources = {}
+        labels, pred_ids = _predict_with_clause_cache(clauses, cache, predictor, index, sources)
+        if index is not None and clauses:
+            print(f"✅ Clause index matched {sources['index']}/{len(clauses)} clauses "
+                  f"({sources['index'] / len(clauses):.1%}); {sources['model']} sent to the model")
+        df = pd.DataFrame({
+            "predicted_class_id": pred_ids,
+            "Predicted Label": labels,
+            "Tier": label_ids_to_tiers(pred_ids),
+            "Clause": clauses
         })
+        if cache is not None:
+            cache.put_document(document, df, variant)
+        df.attrs["clause_sources"] = sources
+    else:
+        print(f"✅ Classification served from cache for '{document.source}'")
 
-    df = pd.DataFrame(results)
-    df.to_csv(output_csv, index=False, encoding="utf-8")
-    print(f"✅ Classification complete. Saved to '{output_csv}'")
+    if output_csv:
+        df.to_csv(output_csv, index=False, encoding="utf-8")
+        print(f"✅ Classification complete. Saved to '{output_csv}'")
     return df
@@ -0,0 +1,240 @@
+# Lazy, process-wide model registry shared by the frontend pipelines
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+import joblib
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from Inference_backends import BACKEND_ENV, create_backend
+from Tracing import peak_rss_mb
+
+
+MODEL_REPO = "bhargav-07-bidkar/Legalbert_Finetuned"
+LABEL_ENCODER_PATH = ("D:\AI\Projects\Contract_NLP\label_encoder.pkl")
+
+# Environment overrides, so deployments can pin a downloaded snapshot and
+# pre-load the model without code changes.
+MODEL_PATH_ENV = "CONTRACT_NLP_MODEL_PATH"
+MODEL_REVISION_ENV = "CONTRACT_NLP_MODEL_REVISION"
+LABEL_ENCODER_ENV = "CONTRACT_NLP_LABEL_ENCODER"
+WARMUP_ENV = "CONTRACT_NLP_WARMUP"
+
+
+@dataclass
+class ModelBundle:
+    tokenizer: object
+    model: object
+    label_encoder: object
+    backend: object
+    source: str
+    revision: str
+    load_seconds: float
+    rss_mb: float = None   # process peak RSS right after loading
+
+
+class ModelRegistry:
+    """
+    Loads the tokenizer, classifier and label encoder on first use and shares them.
+
+    One registry lives at module level (``registry``), so it survives Streamlit script
+    reruns and is shared by every thread of the process. Loading is guarded by a lock:
+    concurrent first callers wait for a single load instead of each loading a copy.
+    """
+
+    def __init__(self, model_source=None, revision=None, label_encoder_path=None, backend=None, onnx_path=None):
+        self._lock = threading.Lock()
+        self._bundle = None
+        self._label_encoder = None
+        self._warmup_thread = None
+        self._commit = None
+        self.configure(model_source, revision, label_encoder_path, backend, onnx_path)
+
+    def configure(self, model_source=None, revision=None, label_encoder_path=None, backend=None, onnx_path=None):
+        """
+        Choose where the model is loaded from. Must be called before the first ``get()``.
+
+        Args:
+            model_source (str, optional): Local snapshot directory or hub repo id.
+                Defaults to ``$CONTRACT_NLP_MODEL_PATH``, then ``MODEL_REPO``.
+            revision (str, optional): Hub revision (branch, tag or commit) to pin.
+            label_encoder_path (str, optional): Path to ``label_encoder.pkl``.
+            backend (str, optional): ``eager``, ``int8`` or ``onnx`` (see Inference_backends).
+                Defaults to ``$CONTRACT_NLP_BACKEND``, then ``eager``.
+            onnx_path (str, optional): Exported graph for the ``onnx`` backend.
+        """
+        with self._lock:
+            if self._bundle is not None:
+                raise RuntimeError("Model already loaded; configure the registry before first use.")
+            self.model_source = model_source or os.getenv(MODEL_PATH_ENV) or MODEL_REPO
+            self.revision = revision or os.getenv(MODEL_REVISION_ENV) or "main"
+            self.label_encoder_path = label_encoder_path or os.getenv(LABEL_ENCODER_ENV) or LABEL_ENCODER_PATH
+            self.backend_name = backend or os.getenv(BACKEND_ENV) or "eager"
+            self.onnx_path = onnx_path
+            self._commit = None
+
+    @property
+    def is_local(self):
+        return os.path.isdir(self.model_source)
+
+    @property
+    def is_loaded(self):
+        return self._bundle is not None
+
+    def get(self):
+        bundle = self._bundle
+        if bundle is not None:
+            return bundle
+        with self._lock:
+            if self._bundle is None:
+                self._bundle = self._load()
+            return self._bundle
+
+    def get_label_encoder(self):
+        """The label encoder alone, without loading the model (e.g. to decode cached ids)."""
+        bundle = self._bundle
+        if bundle is not None:
+            return bundle.label_encoder
+        with self._lock:
+            if self._label_encoder is None:
+                self._label_encoder = joblib.load(self.label_encoder_path)
+            return self._label_encoder
+
+    def fingerprint(self):
+        """
+        Identify the configured weights without loading them, for keying cached predictions.
+
+        A local snapshot is identified by its config and the size/mtime of its files; a hub
+        repo by the commit its revision resolves to (see ``hub_commit``), never by a branch
+        or tag name.
+        """
+        if self.is_local:
+            entries = []
+            for name in sorted(os.listdir(self.model_source)):
+                path = os.path.join(self.model_source, name)
+                if os.path.isfile(path):
+                    stat = os.stat(path)
+                    entries.append([name, stat.st_size, int(stat.st_mtime)])
+            digest = hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+            return f"local:{digest[:16]}"
+        return f"{self.model_source}@{self.hub_commit()}"
+
+    def hub_commit(self):
+        """
+        Commit the configured hub revision resolves to. It is resolved once and the model is
+        loaded from that commit, so cache keys and loaded weights always agree, even if the
+        branch moves while the process runs.
+        """
+        if self._commit is None:
+            self._commit = _resolve_hub_commit(self.model_source, self.revision)
+        return self._commit
+
+    def _load(self):
+        start = time.perf_counter()
+        if self.is_local:
+            kwargs = {"local_files_only": True}
+        else:
+            kwargs = {"revision": self.hub_commit()}
+        tokenizer = AutoTokenizer.from_pretrained(self.model_source, **kwargs)
+        if self.backend_name == "onnx":
+            # The exported graph carries the weights; skip loading the PyTorch copy.
+            model = None
+        else:
+            model = AutoModelForSequenceClassification.from_pretrained(self.model_source, **kwargs)
+            model.eval()
+        # The int8 backend converts the loaded model in place, so no fp32 copy stays resident;
+        # bundle.model is then the quantized module.
+        backend = create_backend(self.backend_name, model, self.onnx_path, inplace=True)
+        label_encoder = joblib.load(self.label_encoder_path)
+        load_seconds = time.perf_counter() - start
+
+        bundle = ModelBundle(
+            tokenizer=tokenizer,
+            model=model,
+            label_encoder=label_encoder,
+            backend=backend,
+            source=self.model_source,
+            revision="local" if self.is_local else self.hub_commit(),
+            load_seconds=load_seconds,
+            rss_mb=peak_rss_mb(),
+        )
+        rss = f", peak RSS {bundle.rss_mb:.0f} MB" if bundle.rss_mb is not None else ""
+        print(f"✅ Model loaded from '{bundle.source}' ({backend.name} backend) in {load_seconds:.1f}s{rss}")
+        return bundle
+
+    def warmup(self, background=True):
+        """
+        Load the model ahead of the first request and run one tiny forward pass.
+
+        With ``background=True`` the load runs on a daemon thread and this returns
+        immediately; callers that need the model simply block in ``get()`` until it is ready.
+        """
+        def _run():
+            bundle = self.get()
+            inputs = bundle.tokenizer("warmup", return_tensors=bundle.backend.tensor_type)
+            bundle.backend.logits(inputs)
+
+        if not background:
+            _run()
+            return None
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=_run, name="model-warmup", daemon=True)
+                self._warmup_thread.start()
+            return self._warmup_thread
+
+    def stats(self):
+        bundle = self._bundle
+        return {
+            "source": self.model_source,
+            "revision": bundle.revision if bundle else self.revision,
+            "backend": self.backend_name,
+            "loaded": bundle is not None,
+            "load_seconds": bundle.load_seconds if bundle else None,
+            "rss_mb_after_load": bundle.rss_mb if bundle else None,
+            "rss_mb": peak_rss_mb(),
+        }
+
+
+def _resolve_hub_commit(repo_id, revision):
+    """
+    The commit ``revision`` of ``repo_id`` points to: asked from the hub, else read from the
+    local Hugging Face cache (offline). Raises RuntimeError when neither knows it.
+    """
+    if re.fullmatch(r"[0-9a-f]{40}", revision):
+        return revision
+    from huggingface_hub import HfApi
+    from huggingface_hub.constants import HF_HUB_CACHE, HF_HUB_OFFLINE
+
+    if not HF_HUB_OFFLINE:
+        try:
+            return HfApi().model_info(repo_id, revision=revision, timeout=10).sha
+        except Exception as e:
+            print(f"⚠️ Could not resolve '{repo_id}@{revision}' on the hub ({e.__class__.__name__}); "
+                  "using the local cache")
+    ref = os.path.join(HF_HUB_CACHE, "models--" + repo_id.replace("/", "--"), "refs", revision)
+    try:
+        with open(ref, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        raise RuntimeError(f"Cannot resolve '{repo_id}@{revision}' to a commit: the hub is unreachable "
+                           f"and it is not in the local cache. Set {MODEL_PATH_ENV} to a downloaded "
+                           f"snapshot or pin {MODEL_REVISION_ENV} to a commit.") from None
+
+
+registry = ModelRegistry()
+
+
+def get_model_bundle():
+    return registry.get()
+
+
+def warmup_from_env():
+    """Start a background warm-up when ``$CONTRACT_NLP_WARMUP`` is set to a truthy value."""
+    if os.getenv(WARMUP_ENV, "").lower() in ("1", "true", "yes"):
+        return registry.warmup(background=True)
+    return None
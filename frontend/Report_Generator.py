@@ -1,90 +1,31 @@
-
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import io
 import os
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from Report_graphs import GRAPHS, report_graphs
+from Tracing import span
 
 csv_path = ("D:\AI\Projects\Contract_NLP\output\classified_contract.csv")
 summary_path =("D:\AI\Projects\Contract_NLP\output\Contract_Abstractive_Summary.txt")
-graphs_dir = ("D:\AI\Projects\Contract_NLP\Graphs")
 output_pdf = ("D:\AI\Projects\Contract_NLP\Contract_Analysis_Report.pdf")
 
-os.makedirs(graphs_dir, exist_ok=True)
-
-def generate_graphs(df, graphs_dir):
-    # Tier Distribution
-    tier_counts = df['Tier'].value_counts().sort_index()
-    plt.figure(figsize=(6,6))
-    colors = sns.color_palette("RdYlGn_r", len(tier_counts))
-    plt.pie(tier_counts, labels=[f"Tier {i}" for i in tier_counts.index], autopct='%1.1f%%', colors=colors)
-    plt.title("Clause Distribution by Tier")
-    plt.tight_layout()
-    plt.savefig(os.path.join(graphs_dir, "tier_distribution.png"))
-    plt.close()
-
-
-    # Label Frequency
-    label_counts = df['Predicted Label'].value_counts()
-    plt.figure(figsize=(10,6))
-    sns.barplot(x=label_counts.values, y=label_counts.index, palette="viridis")
-    plt.xlabel("Number of Clauses")
-    plt.ylabel("Clause Label")
-    plt.title("Number of Clauses per Label")
-    plt.tight_layout()
-    plt.savefig(os.path.join(graphs_dir, "label_frequency.png"))
-    plt.show()
-
-    # Heatmap Tier vs Label
-    tier_label_matrix = pd.crosstab(df['Predicted Label'], df['Tier'])
-    plt.figure(figsize=(12,10))
-    sns.heatmap(tier_label_matrix, annot=True, fmt="d", cmap="YlGnBu")
-    plt.title("Clause Labels vs Tier Heatmap")
-    plt.savefig(os.path.join(graphs_dir, "tier_label_heatmap.png"))
-    plt.close()
-
-    # Clause Length Distribution
-    df['Clause_Length'] = df['Clause'].apply(lambda x: len(x.split()))
-    plt.figure(figsize=(8,5))
-    sns.histplot(df['Clause_Length'], bins=20, kde=True, color="skyblue")
-    plt.xlabel("Number of Words")
-    plt.ylabel("Frequency")
-    plt.title("Distribution of Clause Lengths")
-    plt.savefig(os.path.join(graphs_dir, "clause_length_distribution.png"))
-    plt.close()
-
-    # Expert Review vs Low Risk
-    df['Review_Need'] = df['Tier'].apply(lambda x: 'Requires Review' if x <=2 else 'Low Risk')
-    review_counts = df['Review_Need'].value_counts()
-    plt.figure(figsize=(6,6))
-    colors = ["#FF4C4C", "#4CAF50"]
-    plt.pie(review_counts, labels=review_counts.index, autopct='%1.1f%%', colors=colors)
-    plt.title("Clauses Requiring Expert Review vs Low Risk")
-    plt.savefig(os.path.join(graphs_dir, "review_vs_lowrisk.png"))
-    plt.close()
-
-def generate_pdf_report(csv_path, summary_path, output_pdf, graphs_dir):
-    import pandas as pd
-    import os
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-
-    # Read CSV and summary
-    df = pd.read_csv(csv_path)
-    with open(summary_path, "r", encoding="utf-8") as f:
-        summary_text = f.read()
+# Reports are built in memory (build_pdf_report); nothing is written unless the caller
+# asks for a file, so concurrent reports never share intermediate paths.
 
-    # Generate graphs
-    generate_graphs(df, graphs_dir)
+def generate_graphs(df, graphs_dir, graphs=None):
+    # Writes the report figures as PNG files; build_pdf_report does not need them on disk.
+    # Aggregates, rendering and the PNG cache live in Report_graphs
+    graphs = graphs or report_graphs(df)
+    os.makedirs(graphs_dir, exist_ok=True)
+    for name, png in graphs.items():
+        with open(os.path.join(graphs_dir, name), "wb") as f:
+            f.write(png)
+    return graphs
 
-    doc = SimpleDocTemplate(output_pdf, pagesize=A4,
-                            rightMargin=50, leftMargin=50,
-                            topMargin=50, bottomMargin=50)
+def _report_styles():
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name='MyHeading1',
                           fontName='Times-Bold',
@@ -105,11 +46,50 @@ def generate_pdf_report(csv_path, summary_path, output_pdf, graphs_dir):
                           leading=16,
                           leftIndent=20,
                           spaceAfter=4))
+    return styles
+
+
+def build_pdf_report(df, summary_text, document=None, graphs=None):
+    """
+    Build the analysis report entirely in memory.
+
+    Args:
+        df (pd.DataFrame): Output of ``Input_pipeline.classify_contract``.
+        summary_text (str): Final summary from ``hierarchical_summary_openai``.
+        document: Optional ``Ingestion.ContractDocument``, for the source details.
+        graphs (dict): Pre-rendered ``{file name: PNG bytes}``; rendered (or taken from
+            the graph cache) when omitted.
+
+    Returns:
+        io.BytesIO: The PDF, rewound and ready to stream.
+    """
+    with span("generate_pdf_report", items=len(df)) as s:
+        buffer = _build_pdf(df, summary_text, document, graphs)
+        s.attrs["bytes"] = buffer.getbuffer().nbytes
+    return buffer
+
+
+def _build_pdf(df, summary_text, document, graphs):
+    if graphs is None:
+        graphs = report_graphs(df)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                            rightMargin=50, leftMargin=50,
+                            topMargin=50, bottomMargin=50)
+    styles = _report_styles()
 
     elements = []
     elements.append(Paragraph("Comprehensive Contract Analysis Report", styles['Heading1']))
     elements.append(Spacer(1,12))
 
+    # Source document (Ingestion.ContractDocument), when the caller has it
+    if document is not None:
+        elements.append(Paragraph(f"Document: {document.source}", styles['MyBodyText']))
+        elements.append(Paragraph(f"Pages: {len(document.pages)} | Clauses: {len(document.clauses)}", styles['MyBodyText']))
+        elements.append(Paragraph(f"SHA-256: {document.content_hash}", styles['MyBodyText']))
+        elements.append(Spacer(1,12))
+
     lines = summary_text.split('\n')
     for line in lines:
         line = line.strip()
@@ -124,24 +104,29 @@ def generate_pdf_report(csv_path, summary_path, output_pdf, graphs_dir):
         else:
             elements.append(Paragraph(line, styles['BodyText']))
     elements.append(Spacer(1,12))
-    
 
     # Add graphs
-    graph_files = [
-        ("tier_distribution.png", "Clause Distribution by Tier"),
-        ("label_frequency.png", "Number of Clauses per Label"),
-        ("tier_label_heatmap.png", "Clause Labels vs Tier Heatmap"),
-        ("clause_length_distribution.png", "Distribution of Clause Lengths"),
-        ("review_vs_lowrisk.png", "Clauses Requiring Expert Review vs Low Risk")
-    ]
-    for gf, title in graph_files:
+    for gf, title, _ in GRAPHS:
         elements.append(Paragraph(title, styles['MyHeading2']))
         elements.append(Spacer(1,6))
-        img_path = os.path.join(graphs_dir, gf)
-        if os.path.exists(img_path):
-            img = Image(img_path, width=6.5*inch, height=4*inch)
+        if gf in graphs:
+            img = Image(io.BytesIO(graphs[gf]), width=6.5*inch, height=4*inch)
             elements.append(img)
             elements.append(Spacer(1,12))
 
     doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def generate_pdf_report(csv_path, summary_path, output_pdf, graphs_dir=None, document=None):
+    # File-based wrapper around build_pdf_report; graphs_dir, if given, also gets the PNGs.
+    df = pd.read_csv(csv_path)
+    with open(summary_path, "r", encoding="utf-8") as f:
+        summary_text = f.read()
+
+    graphs = generate_graphs(df, graphs_dir) if graphs_dir else report_graphs(df)
+    pdf = build_pdf_report(df, summary_text, document=document, graphs=graphs)
+    with open(output_pdf, "wb") as f:
+        f.write(pdf.getvalue())
     print(f"✅ PDF report generated: {output_pdf}")
@@ -0,0 +1,260 @@
+# Report analytics and graph rendering
+#
+# All aggregates behind the report figures are computed in one vectorised pass over the
+# classified table. Figures are drawn with matplotlib's object-oriented API on the Agg
+# canvas (no pyplot state, no GUI) one after another - rendering is CPU-bound under the
+# GIL, so threads would not help - and the PNGs are cached on disk under a hash of the
+# aggregates: regenerating the report for unchanged results skips plotting entirely.
+
+import hashlib
+import io
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from Tracing import span
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAPH_CACHE_DIR = os.getenv("REPORT_GRAPH_CACHE_DIR", os.path.join(BASE_DIR, "cache", "graphs"))
+GRAPH_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_GRAPH_CACHE_MAX_ENTRIES", 256))
+CACHE_BYPASS_ENV = "REPORT_GRAPH_CACHE_BYPASS"
+# Bump when a figure's styling changes so cached PNGs are re-rendered.
+GRAPH_STYLE_VERSION = 1
+REVIEW_TIER_MAX = 2
+
+
+# Analytics
+
+@dataclass
+class ReportAnalytics:
+    tier_counts: pd.Series         # clauses per tier, by tier
+    label_counts: pd.Series        # clauses per label, most frequent first
+    tier_label_matrix: pd.DataFrame  # label x tier clause counts
+    clause_lengths: np.ndarray     # words per clause
+    review_counts: pd.Series       # 'Requires Review' / 'Low Risk'
+
+    def fingerprint(self):
+        """Hash of everything the figures are drawn from."""
+        h = hashlib.sha256(f"graphs-v{GRAPH_STYLE_VERSION}".encode("utf-8"))
+        m = self.tier_label_matrix
+        h.update("\x1f".join(map(str, m.index)).encode("utf-8"))
+        h.update(np.asarray(m.columns, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(m.to_numpy(dtype=np.int64)).tobytes())
+        h.update(np.ascontiguousarray(self.clause_lengths, dtype=np.int64).tobytes())
+        return h.hexdigest()
+
+
+def compute_report_analytics(df):
+    """
+    Every aggregate the report figures need, from a classify_contract table.
+
+    The label x tier matrix comes from a single groupby; tier and label totals are its
+    marginals, and clause lengths and review status are vectorised column operations.
+    The caller's DataFrame is not modified.
+    """
+    tiers = df["Tier"].to_numpy(dtype=np.int64)
+    matrix = (
+        df.groupby(["Predicted Label", "Tier"]).size()
+        .unstack(fill_value=0)
+        .sort_index()
+        .sort_index(axis=1)
+    )
+    matrix.columns.name = "Tier"
+    # Same order as value_counts(): descending count, ties in order of first appearance.
+    label_counts = matrix.sum(axis=1).reindex(pd.unique(df["Predicted Label"]))
+    label_counts = label_counts.sort_values(ascending=False, kind="stable")
+
+    review = np.count_nonzero(tiers <= REVIEW_TIER_MAX)
+    review_counts = pd.Series({"Requires Review": review, "Low Risk": len(tiers) - review})
+    review_counts = review_counts[review_counts > 0].sort_values(ascending=False, kind="stable")
+
+    return ReportAnalytics(
+        tier_counts=matrix.sum(axis=0),
+        label_counts=label_counts,
+        tier_label_matrix=matrix,
+        clause_lengths=df["Clause"].astype(str).str.count(r"\S+").to_numpy(dtype=np.int64),
+        review_counts=review_counts,
+    )
+
+
+# Figures
+
+def _figure(figsize):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
+
+
+def _png(fig, tight=False):
+    if tight:
+        fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def _tier_distribution(a):
+    fig, ax = _figure((6, 6))
+    colors = sns.color_palette("RdYlGn_r", len(a.tier_counts))
+    ax.pie(a.tier_counts, labels=[f"Tier {i}" for i in a.tier_counts.index], autopct='%1.1f%%', colors=colors)
+    ax.set_title("Clause Distribution by Tier")
+    return _png(fig, tight=True)
+
+
+def _label_frequency(a):
+    fig, ax = _figure((10, 6))
+    sns.barplot(x=a.label_counts.values, y=a.label_counts.index, hue=a.label_counts.index,
+                palette="viridis", legend=False, ax=ax)
+    ax.set_xlabel("Number of Clauses")
+    ax.set_ylabel("Clause Label")
+    ax.set_title("Number of Clauses per Label")
+    return _png(fig, tight=True)
+
+
+def _tier_label_heatmap(a):
+    fig, ax = _figure((12, 10))
+    sns.heatmap(a.tier_label_matrix, annot=True, fmt="d", cmap="YlGnBu", ax=ax)
+    ax.set_title("Clause Labels vs Tier Heatmap")
+    return _png(fig)
+
+
+def _clause_length_distribution(a):
+    fig, ax = _figure((8, 5))
+    sns.histplot(a.clause_lengths, bins=20, kde=True, color="skyblue", ax=ax)
+    ax.set_xlabel("Number of Words")
+    ax.set_ylabel("Frequency")
+    ax.set_title("Distribution of Clause Lengths")
+    return _png(fig)
+
+
+def _review_vs_lowrisk(a):
+    fig, ax = _figure((6, 6))
+    colors = ["#FF4C4C", "#4CAF50"]
+    ax.pie(a.review_counts, labels=a.review_counts.index, autopct='%1.1f%%', colors=colors)
+    ax.set_title("Clauses Requiring Expert Review vs Low Risk")
+    return _png(fig)
+
+
+# (file name, report title, renderer), in report order
+GRAPHS = [
+    ("tier_distribution.png", "Clause Distribution by Tier", _tier_distribution),
+    ("label_frequency.png", "Number of Clauses per Label", _label_frequency),
+    ("tier_label_heatmap.png", "Clause Labels vs Tier Heatmap", _tier_label_heatmap),
+    ("clause_length_distribution.png", "Distribution of Clause Lengths", _clause_length_distribution),
+    ("review_vs_lowrisk.png", "Clauses Requiring Expert Review vs Low Risk", _review_vs_lowrisk),
+]
+
+
+def render_graphs(analytics):
+    """Render every figure; returns ``{file name: PNG bytes}`` in report order."""
+    return {name: render(analytics) for name, _, render in GRAPHS}
+
+
+# Cache
+
+class GraphCache:
+    """
+    Rendered PNGs in ``<cache_dir>/<analytics fingerprint>/``, keeping the most recently
+    used ``max_entries`` reports.
+    """
+
+    def __init__(self, cache_dir=GRAPH_CACHE_DIR, max_entries=GRAPH_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            pngs = {}
+            for name, _, _ in GRAPHS:
+                with open(os.path.join(entry, name), "rb") as f:
+                    pngs[name] = f.read()
+            os.utime(entry)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pngs
+
+    def put(self, key, pngs):
+        entry = os.path.join(self.cache_dir, key)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name, png in pngs.items():
+            with open(os.path.join(tmp, name), "wb") as f:
+                f.write(png)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another writer stored the same figures first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.cache_dir) if e.is_dir() and not e.name.endswith(".tmp")]
+            except FileNotFoundError:
+                return
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for e in entries[:len(entries) - self.max_entries]:
+                shutil.rmtree(e.path, ignore_errors=True)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "path": self.cache_dir}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_graph_cache():
+    """Process-wide graph cache, or None when REPORT_GRAPH_CACHE_BYPASS is set."""
+    global _cache
+    if os.getenv(CACHE_BYPASS_ENV, "").lower() in ("1", "true", "yes"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = GraphCache()
+        return _cache
+
+
+def report_graphs(df, cache=None):
+    """
+    PNG bytes of every report figure for a classified table, served from the graph cache
+    when the same aggregates were plotted before.
+
+    Args:
+        df (pd.DataFrame): Output of ``Input_pipeline.classify_contract``.
+        cache: A ``GraphCache``; None uses the process-wide one, False disables caching.
+
+    Returns:
+        dict: ``{file name: PNG bytes}`` in report order (see ``GRAPHS``).
+    """
+    with span("generate_graphs", items=len(GRAPHS)) as s:
+        analytics = compute_report_analytics(df)
+        if cache is None:
+            cache = get_graph_cache()
+        if not cache:
+            return render_graphs(analytics)
+
+        key = analytics.fingerprint()
+        pngs = cache.get(key)
+        s.attrs["cached"] = pngs is not None
+        if pngs is None:
+            pngs = render_graphs(analytics)
+            cache.put(key, pngs)
+        return pngs
@@ -0,0 +1,389 @@
+# Incremental re-analysis of contract revisions
+#
+# Usage:
+#   python Revision_analysis.py analyze <contract> --out v1.json
+#   python Revision_analysis.py revise <revised contract> --prior v1.json --out v2.json [--changes changes.csv]
+#
+# A full analysis (clause labels, tiers, chunk summaries, final summary) is stored as JSON.
+# A revision is aligned clause by clause against it: exact matches on normalised text,
+# then fuzzy matching inside the changed regions to tell modified clauses from added and
+# removed ones. Unchanged clauses keep their labels and tiers, summary chunks made only of
+# unchanged clauses keep their summaries, and just the changed clauses are reclassified
+# and re-chunked, so the work done scales with the diff rather than the contract. Labels
+# are only kept when the classifier (Input_pipeline.classification_namespace) is the same
+# one that produced them.
+
+import argparse
+import hashlib
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+from Ingestion import as_document
+from Input_pipeline import classification_namespace, classify_clauses, label_ids_to_tiers
+from Summarisation_pipeline import (
+    CHUNK_TOKENS, MAX_IN_FLIGHT, SUMMARIZATION_PROMPT, SYSTEM_PROMPT,
+    chunk_budget, chunk_clause_groups, reduce_summaries, summarize_chunks_openai,
+)
+
+
+ANALYSIS_VERSION = 1
+# Minimum difflib ratio for a changed clause to count as a modification of an old one.
+FUZZY_THRESHOLD = 0.6
+# Old clauses considered per new clause inside a changed region.
+FUZZY_WINDOW = 50
+
+
+def normalize_clause(text):
+    return " ".join(text.split())
+
+
+def _clause_key(text):
+    return hashlib.sha1(normalize_clause(text).encode("utf-8")).hexdigest()
+
+
+def _summary_settings(model, max_chunk_tokens):
+    """Everything chunk summaries depend on besides the chunk text."""
+    payload = json.dumps([SUMMARIZATION_PROMPT, SYSTEM_PROMPT, model, chunk_budget(model, max_chunk_tokens)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class Chunk:
+    start: int      # clause range [start, end) of the analysis it belongs to
+    end: int
+    summary: str
+
+
+@dataclass
+class ContractAnalysis:
+    source: str
+    content_hash: str
+    clauses: list           # clause texts
+    pred_ids: list
+    labels: list
+    tiers: list
+    chunks: list            # Chunk, in document order
+    final_summary: str
+    model: str = "gpt-4.1-mini"
+    summary_settings: str = ""
+    classifier: str = ""    # classification_namespace the labels were made under
+
+    @property
+    def chunk_summaries(self):
+        return [c.summary for c in self.chunks]
+
+    def to_dataframe(self):
+        """Same layout as ``Input_pipeline.classify_contract``."""
+        return pd.DataFrame({
+            "predicted_class_id": self.pred_ids,
+            "Predicted Label": self.labels,
+            "Tier": self.tiers,
+            "Clause": self.clauses
+        })
+
+    def save(self, path):
+        data = asdict(self)
+        data["version"] = ANALYSIS_VERSION
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.pop("version", None) != ANALYSIS_VERSION:
+            raise ValueError(f"'{path}' was written by an incompatible version of Revision_analysis")
+        data["chunks"] = [Chunk(**c) for c in data["chunks"]]
+        return cls(**data)
+
+
+# Alignment
+
+@dataclass(frozen=True)
+class ClauseChange:
+    kind: str             # 'unchanged', 'modified', 'added' or 'removed'
+    old_index: int = None
+    new_index: int = None
+    similarity: float = 1.0
+
+
+def _fuzzy_pairs(old, new, i1, i2, j1, j2, threshold):
+    """Monotone greedy pairing of the clauses of one changed region."""
+    changes = []
+    next_old = i1
+    for j in range(j1, j2):
+        best, best_ratio = None, threshold
+        for i in range(next_old, min(i2, next_old + FUZZY_WINDOW)):
+            matcher = SequenceMatcher(None, old[i], new[j], autojunk=False)
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = i, ratio
+        if best is None:
+            changes.append(ClauseChange("added", new_index=j, similarity=0.0))
+            continue
+        changes.extend(ClauseChange("removed", old_index=i, similarity=0.0) for i in range(next_old, best))
+        changes.append(ClauseChange("modified", best, j, round(best_ratio, 4)))
+        next_old = best + 1
+    changes.extend(ClauseChange("removed", old_index=i, similarity=0.0) for i in range(next_old, i2))
+    return changes
+
+
+def align_clauses(old_clauses, new_clauses, threshold=FUZZY_THRESHOLD):
+    """
+    Align two versions of a contract's clause list.
+
+    Clauses are first matched by a hash of their whitespace-normalised text (a
+    ``SequenceMatcher`` over the hash sequences, so moved blocks and insertions are
+    handled); within each changed region, remaining clauses are paired by difflib ratio.
+
+    Returns:
+        list[ClauseChange]: in document order of the new version, removed clauses placed
+        where they used to be.
+    """
+    old_keys = [_clause_key(c) for c in old_clauses]
+    new_keys = [_clause_key(c) for c in new_clauses]
+    changes = []
+    old_norm = new_norm = None
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_keys, new_keys, autojunk=False).get_opcodes():
+        if tag == "equal":
+            changes.extend(ClauseChange("unchanged", i, j) for i, j in zip(range(i1, i2), range(j1, j2)))
+        elif tag == "delete":
+            changes.extend(ClauseChange("removed", old_index=i, similarity=0.0) for i in range(i1, i2))
+        elif tag == "insert":
+            changes.extend(ClauseChange("added", new_index=j, similarity=0.0) for j in range(j1, j2))
+        else:
+            if old_norm is None:
+                old_norm = [normalize_clause(c) for c in old_clauses]
+                new_norm = [normalize_clause(c) for c in new_clauses]
+            changes.extend(_fuzzy_pairs(old_norm, new_norm, i1, i2, j1, j2, threshold))
+    return changes
+
+
+# Analysis
+
+def _summarize_runs(clauses, runs, model, max_chunk_tokens, max_in_flight, client, limiter, cache):
+    """Chunk and summarise each clause range in ``runs``; returns Chunks in order."""
+    budget = chunk_budget(model, max_chunk_tokens)
+    groups = []
+    for run_start, run_end in runs:
+        groups.extend((run_start + s, run_start + e, text)
+                      for s, e, text in chunk_clause_groups(clauses[run_start:run_end], budget, model=model))
+    summaries = summarize_chunks_openai([text for _, _, text in groups], model=model, max_in_flight=max_in_flight,
+                                        client=client, limiter=limiter, cache=cache)
+    return [Chunk(s, e, summary) for (s, e, _), summary in zip(groups, summaries)]
+
+
+def analyze_contract(file_path, model="gpt-4.1-mini", max_chunk_tokens=CHUNK_TOKENS, max_in_flight=MAX_IN_FLIGHT,
+                     client=None, limiter=None, cache=None, use_cache=True):
+    """
+    Full analysis of a contract, in the form ``analyze_revision`` builds on.
+
+    Args:
+        file_path (str | ContractDocument): Contract path or parsed document.
+        cache: Summary cache, as for ``hierarchical_summary_openai``.
+        use_cache (bool): Use the classification cache.
+    """
+    document = as_document(file_path)
+    clauses = document.clause_texts or [document.text]
+    classifier = classification_namespace()
+    labels, pred_ids = classify_clauses(clauses, use_cache=use_cache)
+    chunks = _summarize_runs(clauses, [(0, len(clauses))], model, max_chunk_tokens, max_in_flight,
+                             client, limiter, cache)
+    final_summary = reduce_summaries([c.summary for c in chunks], model=model, client=client,
+                                     limiter=limiter, cache=cache)
+    return ContractAnalysis(
+        source=document.source,
+        content_hash=document.content_hash,
+        clauses=clauses,
+        pred_ids=[int(i) for i in pred_ids],
+        labels=[str(label) for label in labels],
+        tiers=[int(t) for t in label_ids_to_tiers(pred_ids)],
+        chunks=chunks,
+        final_summary=final_summary,
+        model=model,
+        summary_settings=_summary_settings(model, max_chunk_tokens),
+        classifier=classifier,
+    )
+
+
+@dataclass
+class RevisionResult:
+    analysis: ContractAnalysis
+    changes: pd.DataFrame
+    stats: dict = field(default_factory=dict)
+
+    def change_report(self):
+        s = self.stats
+        lines = [
+            f"Revision of '{self.analysis.source}'",
+            f"Clauses: {s['unchanged']} unchanged, {s['modified']} modified, {s['added']} added, {s['removed']} removed",
+            f"Reclassified {s['reclassified']} of {s['clauses']} clauses; "
+            f"re-summarised {s['chunks_summarised']} of {s['chunks']} chunks",
+            f"Label changes: {s['label_changes']}",
+        ]
+        for row in self.changes[self.changes["label_changed"]].itertuples():
+            lines.append(f"  clause {row.new_index}: {row.old_label} -> {row.new_label} (tier {row.new_tier})")
+        return "\n".join(lines)
+
+
+def analyze_revision(file_path, prior, model=None, max_chunk_tokens=CHUNK_TOKENS, max_in_flight=MAX_IN_FLIGHT,
+                     client=None, limiter=None, cache=None, use_cache=True, threshold=FUZZY_THRESHOLD):
+    """
+    Analyse a new version of a contract against the stored analysis of an earlier one.
+
+    Labels and tiers of unchanged clauses are copied from ``prior``; only modified and
+    added clauses are classified. If ``prior`` was classified under another classifier
+    namespace (new model, backend, cascade, index...), every clause is reclassified. Prior chunks whose clauses are all unchanged and still
+    contiguous keep their summaries; every other clause is re-chunked within its changed
+    run and summarised. The final reduce step runs over the merged chunk summaries (and is
+    served from the summary cache when nothing changed).
+
+    Args:
+        file_path (str | ContractDocument): The revised contract.
+        prior (ContractAnalysis | str): Analysis of the earlier version, or its JSON path.
+        model (str): Summary model; defaults to the prior analysis' model.
+
+    Returns:
+        RevisionResult: merged analysis, per-clause change table and work statistics.
+    """
+    start_time = time.perf_counter()
+    if isinstance(prior, str):
+        prior = ContractAnalysis.load(prior)
+    model = model or prior.model
+    document = as_document(file_path)
+    clauses = document.clause_texts or [document.text]
+    changes = align_clauses(prior.clauses, clauses, threshold)
+
+    # Classification: copy unchanged clauses, predict the rest
+    old_of_new = {c.new_index: c.old_index for c in changes if c.kind == "unchanged"}
+    classifier = classification_namespace()
+    reuse_labels = old_of_new if prior.classifier == classifier else {}
+    if old_of_new and not reuse_labels:
+        print("⚠️ The prior analysis was classified with a different model or settings; reclassifying every clause")
+    pred_ids = [prior.pred_ids[reuse_labels[j]] if j in reuse_labels else -1 for j in range(len(clauses))]
+    labels = [prior.labels[reuse_labels[j]] if j in reuse_labels else None for j in range(len(clauses))]
+    todo = [j for j in range(len(clauses)) if j not in reuse_labels]
+    if todo:
+        new_labels, new_ids = classify_clauses([clauses[j] for j in todo], use_cache=use_cache)
+        for j, label, pred_id in zip(todo, new_labels, new_ids):
+            labels[j], pred_ids[j] = str(label), int(pred_id)
+    tiers = [int(t) for t in label_ids_to_tiers(pred_ids)]
+
+    # Summaries: keep prior chunks that map onto an unchanged, contiguous clause range
+    reused = {}
+    if prior.summary_settings == _summary_settings(model, max_chunk_tokens):
+        new_of_old = {old: new for new, old in old_of_new.items()}
+        for chunk in prior.chunks:
+            mapped = [new_of_old.get(i) for i in range(chunk.start, chunk.end)]
+            if None in mapped or mapped != list(range(mapped[0], mapped[0] + len(mapped))):
+                continue
+            reused.setdefault((mapped[0], mapped[-1] + 1), []).append(chunk.summary)
+
+    covered = [False] * len(clauses)
+    for s, e in reused:
+        covered[s:e] = [True] * (e - s)
+    runs = []
+    j = 0
+    while j < len(clauses):
+        if covered[j]:
+            j += 1
+            continue
+        run_start = j
+        while j < len(clauses) and not covered[j]:
+            j += 1
+        runs.append((run_start, j))
+
+    fresh = _summarize_runs(clauses, runs, model, max_chunk_tokens, max_in_flight, client, limiter, cache)
+    chunks = fresh + [Chunk(s, e, summary) for (s, e), summaries in reused.items() for summary in summaries]
+    # Stable sort keeps the windows of one long clause in order.
+    chunks.sort(key=lambda c: c.start)
+    final_summary = reduce_summaries([c.summary for c in chunks], model=model, client=client,
+                                     limiter=limiter, cache=cache)
+
+    analysis = ContractAnalysis(
+        source=document.source,
+        content_hash=document.content_hash,
+        clauses=clauses,
+        pred_ids=pred_ids,
+        labels=labels,
+        tiers=tiers,
+        chunks=chunks,
+        final_summary=final_summary,
+        model=model,
+        summary_settings=_summary_settings(model, max_chunk_tokens),
+        classifier=classifier,
+    )
+
+    rows = []
+    for c in changes:
+        old_label = prior.labels[c.old_index] if c.old_index is not None else None
+        new_label = labels[c.new_index] if c.new_index is not None else None
+        rows.append({
+            "change": c.kind,
+            "old_index": c.old_index,
+            "new_index": c.new_index,
+            "similarity": c.similarity,
+            "old_label": old_label,
+            "new_label": new_label,
+            "new_tier": tiers[c.new_index] if c.new_index is not None else None,
+            "label_changed": c.kind in ("modified", "unchanged") and old_label != new_label,
+            "Clause": clauses[c.new_index] if c.new_index is not None else prior.clauses[c.old_index],
+        })
+    table = pd.DataFrame(rows, columns=["change", "old_index", "new_index", "similarity", "old_label",
+                                        "new_label", "new_tier", "label_changed", "Clause"])
+    table = table.astype({"old_index": "Int64", "new_index": "Int64", "new_tier": "Int64"})
+    kinds = table["change"].value_counts()
+    stats = {
+        "clauses": len(clauses),
+        "unchanged": int(kinds.get("unchanged", 0)),
+        "modified": int(kinds.get("modified", 0)),
+        "added": int(kinds.get("added", 0)),
+        "removed": int(kinds.get("removed", 0)),
+        "reclassified": len(todo),
+        "label_changes": int(table["label_changed"].sum()),
+        "chunks": len(chunks),
+        "chunks_summarised": len(fresh),
+        "seconds": round(time.perf_counter() - start_time, 3),
+    }
+    return RevisionResult(analysis, table, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a contract, or a revision of an analysed contract.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_analyze = sub.add_parser("analyze", help="Full analysis of a contract")
+    p_analyze.add_argument("contract")
+    p_analyze.add_argument("--out", required=True, help="Analysis JSON to write")
+
+    p_revise = sub.add_parser("revise", help="Re-analyse a revised contract against a prior analysis")
+    p_revise.add_argument("contract")
+    p_revise.add_argument("--prior", required=True, help="Analysis JSON of the earlier version")
+    p_revise.add_argument("--out", required=True, help="Merged analysis JSON to write")
+    p_revise.add_argument("--changes", help="Optional CSV of per-clause changes")
+    p_revise.add_argument("--threshold", type=float, default=FUZZY_THRESHOLD,
+                          help="Minimum similarity for a changed clause to count as modified")
+    args = parser.parse_args()
+
+    if args.command == "analyze":
+        analysis = analyze_contract(args.contract)
+        analysis.save(args.out)
+        print(f"✅ Analysis of {len(analysis.clauses)} clauses saved to '{args.out}'")
+        return
+
+    result = analyze_revision(args.contract, args.prior, threshold=args.threshold)
+    result.analysis.save(args.out)
+    if args.changes:
+        result.changes.to_csv(args.changes, index=False, encoding="utf-8")
+    print(result.change_report())
+    print(f"✅ Revision analysis saved to '{args.out}' in {result.stats['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,30 @@
 import os
 import re
-import pdfplumber
-from docx import Document
-from openai import OpenAI
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from openai import OpenAI, APIConnectionError
 from dotenv import load_dotenv
+from Summary_cache import get_summary_cache, summary_cache_key
+from Tracing import current_span, propagate, span
+from Ingestion import ContractDocument, as_document, extract_text_from_pdf, extract_text_from_docx, split_into_clauses
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Text Extraction
-def extract_text_from_pdf(pdf_path: str) -> str:
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-    return text
+# Retries are handled by the scheduler below, so the client itself must not retry.
+_client = None
+_client_lock = threading.Lock()
 
-def extract_text_from_docx(docx_path: str) -> str:
-    doc = Document(docx_path)
-    return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
+def get_client():
+    """Shared OpenAI client, created on first use (honours OPENAI_API_KEY and OPENAI_BASE_URL)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        return _client
 
 #OpenAI Summarization
 SUMMARIZATION_PROMPT = """
@@ -35,82 +41,681 @@ Provide:
 3) If present, list any key dates or numeric amounts found.
 """
 
-def summarize_chunk_openai(chunk_text: str, model: str = "gpt-4.1-mini", temperature: float = 0.0, max_tokens: int = 400) -> str:
-    prompt = SUMMARIZATION_PROMPT.format(chunk_text=chunk_text)
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful legal assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
-    return resp.choices[0].message.content.strip()
+REDUCE_PROMPT = (
+    "You are a legal summarization assistant. The following are intermediate summaries "
+    "of parts of a contract. Produce a single concise abstractive summary of the whole contract, "
+    "emphasizing obligations, risks, and important dates and numeric values. "
+    "Also produce a short (4-item) prioritized checklist of clauses that require human review.\n\n"
+    "{summaries}"
+)
 
-def hierarchical_summary_openai(text: str, chunk_size_chars: int = 2500, overlap_chars: int = 200, model="gpt-4.1-mini"):
-    text = re.sub(r'\n{2,}', '\n\n', text).strip()
-    
+SYSTEM_PROMPT = "You are a helpful legal assistant."
+
+# Rate limiting and retries
+# Limits are per process and shared by every contract summarised concurrently in it.
+MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", 8))
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", 200000))
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until ``amount`` tokens are available, take them and return the time waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits applied together."""
+
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE, tokens_per_minute: int = TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int) -> float:
+        return self.requests.acquire(1) + self.tokens.acquire(tokens)
+
+
+rate_limiter = RateLimiter()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size (~4 characters per token), used for the tokens-per-minute budget."""
+    return len(text) // 4 + 1
+
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def _is_retryable(exc) -> bool:
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Timeouts and dropped connections carry no status code.
+    return isinstance(exc, (APIConnectionError, ConnectionError, TimeoutError))
+
+
+def _retry_delay(exc, attempt: int) -> float:
+    # Full jitter keeps concurrent workers that hit the same 429 from retrying in lockstep.
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        delay = max(delay, float(headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def _resolve_cache(cache):
+    # None -> shared on-disk cache, False -> no caching, anything else is used as given.
+    if cache is None:
+        return get_summary_cache()
+    return cache or None
+
+
+def _chat_completion(template: str, text: str, model: str, temperature: float, max_tokens: int, field: str = "chunk_text", client=None, limiter=None, cache=None, max_retries: int = MAX_RETRIES) -> str:
+    """
+    Fill ``template``'s ``{field}`` with ``text`` and complete it.
+
+    Completions are cached under a hash of the template, text and request parameters
+    (see Summary_cache), so repeated text is served without a network call.
+    """
+    return _chat_completion_with_usage(template, text, model, temperature, max_tokens, field,
+                                       client, limiter, cache, max_retries)[0]
+
+
+def _chat_completion_with_usage(template: str, text: str, model: str, temperature: float, max_tokens: int, field: str = "chunk_text", client=None, limiter=None, cache=None, max_retries: int = MAX_RETRIES):
+    """``_chat_completion`` that also returns the tokens the request spent (0 for a cache hit)."""
+    cache = _resolve_cache(cache)
+    key = None
+    if cache is not None:
+        key = summary_cache_key(template, text, model, temperature, max_tokens, SYSTEM_PROMPT)
+        cached = cache.get(key)
+        if cached is not None:
+            if current_span() is not None:
+                current_span().attrs["cached"] = True
+            return cached, 0
+
+    prompt = template.format(**{field: text})
+    summary, tokens = _request_completion(prompt, model, temperature, max_tokens, client, limiter, max_retries)
+    if cache is not None:
+        cache.put(key, summary)
+    return summary, tokens
+
+
+def _request_completion(prompt: str, model: str, temperature: float, max_tokens: int, client=None, limiter=None, max_retries: int = MAX_RETRIES):
+    """Send one chat completion with retries; returns the content and the tokens it used."""
+    client = client or get_client()
+    limiter = limiter or rate_limiter
+    for attempt in range(max_retries + 1):
+        limiter.acquire(estimate_tokens(SYSTEM_PROMPT + prompt) + max_tokens)
+        try:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            content = resp.choices[0].message.content.strip()
+            tokens = _usage_tokens(resp, prompt, content)
+            if current_span() is not None:
+                current_span().add(tokens=tokens)
+            return content, tokens
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            time.sleep(_retry_delay(e, attempt))
+
+
+def _usage_tokens(resp, prompt: str, content: str) -> int:
+    """Tokens a request used: the API's reported usage when present, else an estimate."""
+    usage = getattr(resp, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None) is not None:
+        return usage.total_tokens
+    return estimate_tokens(SYSTEM_PROMPT + prompt) + estimate_tokens(content)
+
+
+def summarize_chunk_openai(chunk_text: str, model: str = "gpt-4.1-mini", temperature: float = 0.0, max_tokens: int = 400, client=None, limiter=None, cache=None) -> str:
+    with span("summarize_chunk", items=1, model=model):
+        return _chat_completion(SUMMARIZATION_PROMPT, chunk_text, model, temperature, max_tokens,
+                                client=client, limiter=limiter, cache=cache)
+
+
+def summarize_chunks_openai(chunks, model: str = "gpt-4.1-mini", max_in_flight: int = MAX_IN_FLIGHT, client=None, limiter=None, cache=None):
+    """
+    Map stage: summarise ``chunks`` concurrently, at most ``max_in_flight`` requests at a time.
+
+    Each request goes through the shared rate limiter and is retried with jittered
+    backoff on 429/5xx. Summaries are returned in chunk order whatever order they finish in.
+    Pass ``client`` (anything exposing ``chat.completions.create``) to run against a fake
+    client, or set OPENAI_BASE_URL to point the default client at a local stub server.
+    Chunks already in the summary cache are returned without a request.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return []
+    workers = max(1, min(max_in_flight, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarise") as pool:
+        return list(pool.map(
+            propagate(lambda ch: summarize_chunk_openai(ch, model=model, client=client, limiter=limiter, cache=cache)),
+            chunks
+        ))
+
+
+# Chunking
+# Chunks are sized in model tokens and built from whole clauses, so no clause is cut
+# mid-sentence and nothing is sent twice unless a single clause exceeds the budget.
+CHUNK_TOKENS = 2000
+LONG_CLAUSE_OVERLAP_TOKENS = 100
+CHUNK_SUMMARY_MAX_TOKENS = 400  # summarize_chunk_openai default
+REDUCE_MAX_TOKENS = 600
+CONTEXT_WINDOW_TOKENS = {
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1": 1047576,
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+}
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # BPE files are downloaded on first use; offline hosts fall back to the estimate.
+        print(f"⚠️ tiktoken encoding unavailable ({e.__class__.__name__}); estimating token counts")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4.1-mini") -> int:
+    """Exact token count with tiktoken when it is installed, otherwise ``estimate_tokens``."""
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _token_windows(text: str, max_tokens: int, overlap_tokens: int, model: str):
+    encoding = _encoding_for(model)
+    step = max(1, max_tokens - overlap_tokens)
+    if encoding is None:
+        # ~4 characters per token, matching estimate_tokens.
+        size, step = max_tokens * 4, step * 4
+        return [text[i:i + size] for i in range(0, max(len(text) - overlap_tokens * 4, 1), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, max(len(tokens) - overlap_tokens, 1), step)]
+
+
+def chunk_budget(model: str, max_chunk_tokens: int = CHUNK_TOKENS, max_tokens: int = CHUNK_SUMMARY_MAX_TOKENS) -> int:
+    """Clause-text budget per chunk, clipped so prompt plus completion fit the model's context window."""
+    context = CONTEXT_WINDOW_TOKENS.get(model)
+    if context is None:
+        return max_chunk_tokens
+    overhead = count_tokens(SYSTEM_PROMPT + SUMMARIZATION_PROMPT, model) + max_tokens
+    return max(1, min(max_chunk_tokens, context - overhead))
+
+
+def chunk_clause_groups(clauses, max_chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = LONG_CLAUSE_OVERLAP_TOKENS, model: str = "gpt-4.1-mini"):
+    """
+    ``chunk_clauses_by_tokens`` keeping track of which clauses went into each chunk.
+
+    Returns:
+        list[tuple[int, int, str]]: ``(start, end, chunk_text)`` with ``clauses[start:end]``
+        packed into the chunk. The windows of an over-long clause ``i`` all carry ``(i, i + 1)``.
+    """
+    groups = []
+    current = []
+    current_start = 0
+    current_tokens = 0
+    for i, clause in enumerate(clauses):
+        n = count_tokens(clause, model)
+        if n > max_chunk_tokens:
+            if current:
+                groups.append((current_start, i, "\n".join(current)))
+                current, current_tokens = [], 0
+            groups.extend((i, i + 1, window) for window in _token_windows(clause, max_chunk_tokens, overlap_tokens, model))
+            continue
+        # +1 for the newline joining clauses
+        if current and current_tokens + n + 1 > max_chunk_tokens:
+            groups.append((current_start, i, "\n".join(current)))
+            current, current_tokens = [], 0
+        if not current:
+            current_start = i
+        current.append(clause)
+        current_tokens += n + (1 if len(current) > 1 else 0)
+    if current:
+        groups.append((current_start, len(clauses), "\n".join(current)))
+    return groups
+
+
+def chunk_clauses_by_tokens(clauses, max_chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = LONG_CLAUSE_OVERLAP_TOKENS, model: str = "gpt-4.1-mini"):
+    """
+    Greedily pack whole clauses, in order, into chunks of at most ``max_chunk_tokens``.
+
+    A clause longer than the budget is emitted on its own as overlapping token windows;
+    that is the only place overlap is used.
+    """
+    return [chunk for _, _, chunk in chunk_clause_groups(clauses, max_chunk_tokens, overlap_tokens, model)]
+
+
+def chunk_text_by_chars(text: str, chunk_size_chars: int = 2500, overlap_chars: int = 200):
+    """Legacy fixed-character windows with overlap."""
     chunks = []
     i = 0
     while i < len(text):
-        chunk = text[i:i+chunk_size_chars]
-        chunks.append(chunk)
+        chunks.append(text[i:i + chunk_size_chars])
         i += chunk_size_chars - overlap_chars
+    return chunks
 
 
-    chunk_summaries = []
-    for ch in chunks:
-        summary = summarize_chunk_openai(ch, model=model)
-        chunk_summaries.append(summary)
+@dataclass
+class SummaryPlan:
+    chunks: int
+    api_calls: int
+    prompt_tokens: int
+    max_completion_tokens: int
+
+    def __str__(self):
+        return (f"{self.chunks} chunks, {self.api_calls} API calls, "
+                f"~{self.prompt_tokens} prompt tokens, <= {self.max_completion_tokens} completion tokens")
 
-    combined = "\n\n".join(chunk_summaries)
-    final_prompt = (
-        "You are a legal summarization assistant. The following are intermediate summaries "
-        "of parts of a contract. Produce a single concise abstractive summary of the whole contract, "
-        "emphasizing obligations, risks, and important dates and numeric values. "
-        "Also produce a short (4-item) prioritized checklist of clauses that require human review.\n\n"
-        f"{combined}"
-    )
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful legal assistant."},
-            {"role": "user", "content": final_prompt}
-        ],
-        temperature=0.0,
-        max_tokens=600
+def plan_summary(chunks, model: str = "gpt-4.1-mini", max_tokens: int = CHUNK_SUMMARY_MAX_TOKENS, reduce_max_tokens: int = REDUCE_MAX_TOKENS) -> SummaryPlan:
+    """
+    Expected cost of summarising ``chunks`` before any call is made: one map call per chunk
+    plus one reduce call, whose input is bounded by the chunk summaries' ``max_tokens``.
+    No chunks means no calls at all.
+    """
+    if not chunks:
+        return SummaryPlan(chunks=0, api_calls=0, prompt_tokens=0, max_completion_tokens=0)
+    overhead = count_tokens(SYSTEM_PROMPT + SUMMARIZATION_PROMPT, model)
+    map_tokens = sum(count_tokens(ch, model) + overhead for ch in chunks)
+    reduce_tokens = count_tokens(SYSTEM_PROMPT + REDUCE_PROMPT, model) + len(chunks) * max_tokens
+    return SummaryPlan(
+        chunks=len(chunks),
+        api_calls=len(chunks) + 1,
+        prompt_tokens=map_tokens + reduce_tokens,
+        max_completion_tokens=len(chunks) * max_tokens + reduce_max_tokens,
     )
-    final_summary = resp.choices[0].message.content.strip()
+
+
+def hierarchical_summary_openai(text: str = None, chunk_size_chars: int = 2500, overlap_chars: int = 200, model="gpt-4.1-mini", max_in_flight: int = MAX_IN_FLIGHT, client=None, limiter=None, cache=None, bypass_cache: bool = False, clauses=None, chunking: str = "tokens", max_chunk_tokens: int = CHUNK_TOKENS):
+    """
+    Map-reduce summary: summarise chunks concurrently, then merge the chunk summaries.
+
+    With ``chunking="tokens"`` (default) whole clauses are packed into chunks of at most
+    ``max_chunk_tokens`` model tokens (see ``chunk_clauses_by_tokens``). Pass ``clauses``
+    when they are already split (e.g. the ``Clause`` column from classify_contract);
+    otherwise ``text`` is split with ``split_into_clauses``. ``chunking="chars"`` keeps the
+    old fixed ``chunk_size_chars`` windows with ``overlap_chars`` overlap.
+
+    Chunk and reduce calls go through the persistent summary cache unless ``bypass_cache``
+    is set (or ``cache=False``), so re-summarising an unchanged contract makes no API calls.
+
+    Returns:
+        tuple[str, list[str]]: final summary and the per-chunk summaries; both empty, with no
+        API calls, when there is nothing to summarise.
+
+    Raises:
+        ValueError: if neither ``text`` nor ``clauses`` is given.
+    """
+    if text is None and clauses is None:
+        raise ValueError("hierarchical_summary_openai needs text or clauses to summarise")
+    if bypass_cache:
+        cache = False
+
+    if chunking == "chars":
+        if text is None:
+            text = "\n".join(clauses)
+        text = re.sub(r'\n{2,}', '\n\n', text).strip()
+        chunks = chunk_text_by_chars(text, chunk_size_chars, overlap_chars)
+    elif chunking == "tokens":
+        if clauses is None:
+            text = re.sub(r'\n{2,}', '\n\n', text).strip()
+            clauses = split_into_clauses(text) or [text]
+        budget = chunk_budget(model, max_chunk_tokens)
+        chunks = chunk_clauses_by_tokens(clauses, budget, model=model)
+    else:
+        raise ValueError(f"Unknown chunking mode '{chunking}'")
+    chunks = [chunk for chunk in chunks if chunk.strip()]
+    if not chunks:
+        print("⚠️ Nothing to summarise; skipping the API calls.")
+        return "", []
+
+    print(f"Summarization plan: {plan_summary(chunks, model)}")
+
+    chunk_summaries = summarize_chunks_openai(chunks, model=model, max_in_flight=max_in_flight,
+                                              client=client, limiter=limiter, cache=cache)
+
+    final_summary = reduce_summaries(chunk_summaries, model=model, client=client, limiter=limiter, cache=cache)
     return final_summary, chunk_summaries
 
+
+def reduce_summaries(chunk_summaries, model: str = "gpt-4.1-mini", client=None, limiter=None, cache=None) -> str:
+    """Merge chunk summaries, in document order, into the final summary (one API call, none if there are none)."""
+    if not chunk_summaries:
+        return ""
+    combined = "\n\n".join(chunk_summaries)
+    with span("summarize_reduce", items=len(chunk_summaries), model=model):
+        return _chat_completion(REDUCE_PROMPT, combined, model, temperature=0.0, max_tokens=REDUCE_MAX_TOKENS,
+                                field="summaries", client=client, limiter=limiter, cache=cache)
+
+# Tier-prioritised summary
+# Tier 1-2 clauses (liability, termination, IP...) get the full map-reduce treatment;
+# Tier 3-5 clauses are grouped by label, clipped and summarised together in one short call.
+# The number of calls and their worst-case tokens are fixed before the first request, so
+# a contract never spends more than the token and cost ceilings.
+PRIORITY_TIERS = (1, 2)
+SUMMARY_TOKEN_BUDGET = int(os.getenv("OPENAI_SUMMARY_TOKEN_BUDGET", 40000))
+SUMMARY_COST_BUDGET = float(os.getenv("OPENAI_SUMMARY_COST_BUDGET", 0.05))  # USD per contract
+SUMMARY_MAX_CALLS = int(os.getenv("OPENAI_SUMMARY_MAX_CALLS", 16))
+LOW_TIER_TOKENS = 1500               # clipped low-tier text sent in the single low-tier call
+LOW_TIER_CLAUSE_TOKENS = 60          # per clause excerpt
+LOW_TIER_CLAUSES_PER_LABEL = 3
+LOW_TIER_MAX_TOKENS = 200
+# USD per 1M (prompt, completion) tokens; models not listed are only held to the token budget.
+MODEL_PRICES = {
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+LOW_TIER_PROMPT = """
+You are a legal summarization assistant. Below are excerpts of the routine clauses of a contract, grouped by clause type.
+In at most 4 short bullet points, state what they cover and flag anything non-standard (unusual amounts, one-sided terms, missing protections).
+
+{chunk_text}
+"""
+
+
+def call_cost(prompt_tokens: int, completion_tokens: int, model: str) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+def _low_tier_text(clauses, labels, model: str, max_tokens: int = LOW_TIER_TOKENS):
+    """
+    Label-grouped, clipped excerpts of the low-tier clauses, at most ``max_tokens``; the
+    most frequent labels come first. Returns the text and the labels that made it in.
+    """
+    groups = {}
+    for clause, label in zip(clauses, labels):
+        groups.setdefault(label, []).append(clause)
+    lines = []
+    included = set()
+    used = 0
+    for label, group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        excerpts = [_token_windows(c, LOW_TIER_CLAUSE_TOKENS, 0, model)[0].strip()
+                    for c in group[:LOW_TIER_CLAUSES_PER_LABEL]]
+        line = f"{label} ({len(group)} clauses): " + " | ".join(excerpts)
+        n = count_tokens(line, model) + 1
+        if used + n > max_tokens:
+            break
+        lines.append(line)
+        included.add(label)
+        used += n
+    return "\n".join(lines), included
+
+
+def _completion_with_tokens(span_name: str, template: str, text: str, model: str, max_tokens: int, field: str = "chunk_text", client=None, limiter=None, cache=None):
+    """``_chat_completion`` inside its own span, returning the summary and the tokens it spent."""
+    with span(span_name, items=1, model=model):
+        return _chat_completion_with_usage(template, text, model, 0.0, max_tokens, field=field,
+                                           client=client, limiter=limiter, cache=cache)
+
+
+def plan_tiered_summary(df, model: str = "gpt-4.1-mini", token_budget: int = SUMMARY_TOKEN_BUDGET, cost_budget: float = SUMMARY_COST_BUDGET, max_calls: int = SUMMARY_MAX_CALLS, max_chunk_tokens: int = CHUNK_TOKENS):
+    """
+    Decide every call of a tiered summary before making any.
+
+    Priority clauses are packed into chunks Tier 1 first, then Tier 2, each in document
+    order; the longest prefix of those chunks whose worst case (prompt plus ``max_tokens``
+    completion for every call, including the low-tier and reduce calls) fits
+    ``token_budget``, ``cost_budget`` and ``max_calls`` is kept. Clauses in dropped chunks
+    are skipped.
+
+    Returns:
+        dict: ``chunks`` (text, per-tier token shares and clause counts), ``low_tier``
+        (the same for the low-tier call, or None), the planned ``api_calls``, ``tokens`` and ``cost_usd``, and ``skipped``
+        clause counts per tier.
+    """
+    tiers = df["Tier"].astype(int).tolist()
+    labels = df["Predicted Label"].astype(str).tolist()
+    clauses = df["Clause"].astype(str).tolist()
+
+    priority = sorted((i for i, t in enumerate(tiers) if t in PRIORITY_TIERS), key=lambda i: (tiers[i], i))
+    tagged = [f"[{labels[i]}] {clauses[i]}" for i in priority]
+    budget = chunk_budget(model, max_chunk_tokens)
+    map_overhead = count_tokens(SYSTEM_PROMPT + SUMMARIZATION_PROMPT, model)
+    chunks = []
+    for start, end, text in chunk_clause_groups(tagged, budget, model=model):
+        shares, counts = {}, {}
+        for i in priority[start:end]:
+            shares[tiers[i]] = shares.get(tiers[i], 0) + count_tokens(clauses[i], model)
+            counts[tiers[i]] = counts.get(tiers[i], 0) + 1
+        chunks.append({"text": text, "shares": shares, "counts": counts,
+                       "prompt_tokens": map_overhead + count_tokens(text, model)})
+
+    low_rows = [i for i, t in enumerate(tiers) if t not in PRIORITY_TIERS]
+    low_tier = None
+    if low_rows:
+        text, included = _low_tier_text([clauses[i] for i in low_rows], [labels[i] for i in low_rows], model)
+        counts, left_out = {}, {}
+        for i in low_rows:
+            target = counts if labels[i] in included else left_out
+            target[tiers[i]] = target.get(tiers[i], 0) + 1
+        low_tier = {"text": text, "shares": counts, "counts": counts, "left_out": left_out,
+                    "prompt_tokens": count_tokens(SYSTEM_PROMPT + LOW_TIER_PROMPT + text, model)}
+
+    # Separators and the "Routine clauses" heading around the summaries fed to the reduce call
+    reduce_overhead = count_tokens(SYSTEM_PROMPT + REDUCE_PROMPT, model) + 8
+    if low_tier:
+        reduce_overhead += LOW_TIER_MAX_TOKENS
+
+    def worst_case(k):
+        prompt = sum(c["prompt_tokens"] for c in chunks[:k]) + reduce_overhead + k * (CHUNK_SUMMARY_MAX_TOKENS + 1)
+        completion = k * CHUNK_SUMMARY_MAX_TOKENS + REDUCE_MAX_TOKENS
+        if low_tier:
+            prompt += low_tier["prompt_tokens"]
+            completion += LOW_TIER_MAX_TOKENS
+        return prompt + completion, call_cost(prompt, completion, model)
+
+    fixed_calls = 1 + (1 if low_tier else 0)
+    kept = 0
+    while kept < len(chunks) and kept + 1 + fixed_calls <= max_calls:
+        tokens, cost = worst_case(kept + 1)
+        if tokens > token_budget or (cost_budget and cost > cost_budget):
+            break
+        kept += 1
+    tokens, cost = worst_case(kept)
+    if tokens > token_budget or (cost_budget and cost > cost_budget):
+        print(f"⚠️ Even the low-tier and reduce calls exceed the summary budget (~{tokens} tokens, ${cost:.4f})")
+
+    skipped = dict(low_tier["left_out"]) if low_tier else {}
+    for chunk in chunks[kept:]:
+        for tier, n in chunk["counts"].items():
+            skipped[tier] = skipped.get(tier, 0) + n
+    return {
+        "chunks": chunks[:kept],
+        "low_tier": low_tier,
+        "api_calls": kept + fixed_calls,
+        "tokens": tokens,
+        "cost_usd": cost,
+        "skipped": skipped,
+    }
+
+
+def _spread(report, shares, tokens, key):
+    # Attribute a call's tokens to tiers in proportion to their share of its input (clause
+    # tokens for priority chunks, clause counts for the low-tier call)
+    total = sum(shares.values())
+    if not total:
+        return
+    for tier, share in shares.items():
+        report[tier][key] += tokens * share / total
+
+
+def tiered_summary_openai(df, model: str = "gpt-4.1-mini", token_budget: int = SUMMARY_TOKEN_BUDGET, cost_budget: float = SUMMARY_COST_BUDGET, max_calls: int = SUMMARY_MAX_CALLS, max_in_flight: int = MAX_IN_FLIGHT, client=None, limiter=None, cache=None, bypass_cache: bool = False):
+    """
+    Budgeted summary of a classified contract (``Clause``, ``Predicted Label`` and ``Tier``
+    columns from classify_contract).
+
+    Tier 1-2 clauses are summarised chunk by chunk as in ``hierarchical_summary_openai``;
+    Tier 3-5 clauses go into one short, label-grouped call; both feed one reduce call. See
+    ``plan_tiered_summary`` for how the budget is enforced.
+
+    Returns:
+        tuple[str, list[str], dict]: final summary, the chunk summaries (priority chunks,
+        then the low-tier summary) and a per-tier report of clauses, summarised/skipped
+        clauses and planned vs spent tokens (spent is 0 for cache hits). Nothing is sent
+        when no clause fits the budget; the summary is then empty.
+    """
+    if bypass_cache:
+        cache = False
+    plan = plan_tiered_summary(df, model, token_budget, cost_budget, max_calls)
+
+    report = {int(t): {"clauses": 0, "summarized": 0, "skipped": 0, "planned_tokens": 0.0, "spent_tokens": 0.0}
+              for t in sorted(df["Tier"].astype(int).unique())}
+    for t in df["Tier"].astype(int):
+        report[t]["clauses"] += 1
+    for tier, n in plan["skipped"].items():
+        report[tier]["skipped"] = n
+
+    if not plan["chunks"] and not plan["low_tier"]:
+        print("⚠️ Nothing to summarise within the budget; skipping the API calls.")
+        tier_report = {
+            "tiers": {tier: {k: round(v) if isinstance(v, float) else v for k, v in row.items()} for tier, row in report.items()},
+            "reduce": {"planned_tokens": 0, "spent_tokens": 0},
+            "api_calls": 0,
+            "planned_tokens": 0,
+            "planned_cost_usd": 0.0,
+            "token_budget": token_budget,
+            "cost_budget_usd": cost_budget,
+        }
+        print_tier_report(tier_report)
+        return "", [], tier_report
+
+    print(f"Tiered summarization plan: {len(plan['chunks'])} priority chunks"
+          f"{' + 1 low-tier call' if plan['low_tier'] else ''} + 1 reduce = {plan['api_calls']} API calls, "
+          f"<= {plan['tokens']} tokens, <= ${plan['cost_usd']:.4f}")
+
+    calls = [(c, SUMMARIZATION_PROMPT, CHUNK_SUMMARY_MAX_TOKENS, "summarize_chunk") for c in plan["chunks"]]
+    if plan["low_tier"]:
+        calls.append((plan["low_tier"], LOW_TIER_PROMPT, LOW_TIER_MAX_TOKENS, "summarize_low_tiers"))
+
+    def run(call):
+        part, template, max_tokens, name = call
+        return _completion_with_tokens(name, template, part["text"], model, max_tokens,
+                                       client=client, limiter=limiter, cache=cache)
+
+    results = []
+    if calls:
+        workers = max(1, min(max_in_flight, len(calls)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarise") as pool:
+            results = list(pool.map(propagate(run), calls))
+
+    summaries = []
+    for (summary, spent), (part, _, max_tokens, _) in zip(results, calls):
+        summaries.append(summary)
+        _spread(report, part["shares"], part["prompt_tokens"] + max_tokens, "planned_tokens")
+        _spread(report, part["shares"], spent, "spent_tokens")
+        for tier, n in part["counts"].items():
+            report[tier]["summarized"] += n
+
+    reduce_input = summaries[:len(plan["chunks"])]
+    if plan["low_tier"]:
+        reduce_input.append("Routine clauses:\n" + summaries[-1])
+    final_summary, spent = _completion_with_tokens("summarize_reduce", REDUCE_PROMPT, "\n\n".join(reduce_input), model,
+                                                   REDUCE_MAX_TOKENS, field="summaries", client=client, limiter=limiter,
+                                                   cache=cache)
+    reduce_prompt = count_tokens(SYSTEM_PROMPT + REDUCE_PROMPT + "\n\n".join(reduce_input), model)
+
+    tier_report = {
+        "tiers": {tier: {k: round(v) if isinstance(v, float) else v for k, v in row.items()} for tier, row in report.items()},
+        "reduce": {"planned_tokens": reduce_prompt + REDUCE_MAX_TOKENS, "spent_tokens": spent},
+        "api_calls": plan["api_calls"],
+        "planned_tokens": plan["tokens"],
+        "planned_cost_usd": plan["cost_usd"],
+        "token_budget": token_budget,
+        "cost_budget_usd": cost_budget,
+    }
+    print_tier_report(tier_report)
+    return final_summary, summaries, tier_report
+
+
+def print_tier_report(tier_report):
+    print(f"{'Tier':>6} {'clauses':>8} {'summarised':>11} {'skipped':>8} {'planned tok':>12} {'spent tok':>10}")
+    for tier, row in tier_report["tiers"].items():
+        print(f"{tier:>6} {row['clauses']:>8} {row['summarized']:>11} {row['skipped']:>8} "
+              f"{row['planned_tokens']:>12} {row['spent_tokens']:>10}")
+    reduce = tier_report["reduce"]
+    print(f"{'reduce':>6} {'':>8} {'':>11} {'':>8} {reduce['planned_tokens']:>12} {reduce['spent_tokens']:>10}")
+
 # Main Function
-def summarize_contract(file_path: str, output_path: str = None) -> str:
+def summarize_contract(file_path, output_path: str = None) -> str:
     """
     Summarize a contract file (PDF or DOCX) and save the abstractive summary.
     
     Args:
-        file_path (str): Path to the uploaded contract file
-        output_path (str, optional): Path to save the summary. Defaults to 'Contract_Abstractive_Summary.txt' in current folder.
+        file_path (str | ContractDocument): Path to the uploaded contract file, or the
+            document already parsed by ``Ingestion.load_document``
+        output_path (str, optional): Path to save the summary. Defaults to 'Contract_Abstractive_Summary.txt' next to the file (current folder for a parsed document).
     
     Returns:
         str: Final abstractive summary
     """
-    # Extract text
-    if file_path.lower().endswith(".pdf"):
-        text = extract_text_from_pdf(file_path)
-    elif file_path.lower().endswith(".docx"):
-        text = extract_text_from_docx(file_path)
-    else:
-        raise ValueError("Unsupported file type")
+    document = as_document(file_path)
 
     # Summarize
-    final_summary, _ = hierarchical_summary_openai(text)
+    final_summary, _ = hierarchical_summary_openai(clauses=document.clause_texts or [document.text])
 
     # Set default output path if none provided
     if output_path is None:
-        output_path = os.path.join(os.path.dirname(file_path), "Contract_Abstractive_Summary.txt")
+        folder = "" if isinstance(file_path, ContractDocument) else os.path.dirname(file_path)
+        output_path = os.path.join(folder, "Contract_Abstractive_Summary.txt")
 
     # Save summary
     with open(output_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,135 @@
+# Persistent, content-addressed cache for LLM summaries (SQLite, size-bounded LRU)
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", os.path.join(BASE_DIR, "cache", "summaries.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_BYPASS_ENV = "SUMMARY_CACHE_BYPASS"
+
+
+def summary_cache_key(template: str, text: str, model: str, temperature: float, max_tokens: int, system_prompt: str = "") -> str:
+    """
+    SHA-256 over everything that determines the completion: prompt template, the text
+    substituted into it, system prompt, model, temperature and max_tokens. Editing the
+    template or any parameter therefore changes the key instead of serving stale entries.
+    """
+    payload = json.dumps([template, text, system_prompt, model, float(temperature), int(max_tokens)],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Key/value store for summaries with least-recently-used eviction once the stored text
+    exceeds ``max_bytes``. Safe to share between threads; WAL mode lets several processes
+    use the same file.
+
+    Args:
+        path (str): SQLite database file. Created with its directory if missing.
+        max_bytes (int): Size bound on stored summary text.
+        bypass (bool): Neither read nor write; every lookup goes to the API.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, bypass: bool = None):
+        if bypass is None:
+            bypass = os.getenv(CACHE_BYPASS_ENV, "").lower() in ("1", "true", "yes")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_last_access ON summaries(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        if self.bypass:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        if self.bypass:
+            return
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the bound so a full cache does not evict on every insert.
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM summaries ORDER BY last_access ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= target:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM summaries WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "bypass": self.bypass,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_summary_cache():
+    """Process-wide cache at CACHE_PATH, opened on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SummaryCache()
+        return _default_cache
@@ -0,0 +1,285 @@
+# Lightweight per-stage tracing and metrics
+#
+# Usage:
+#   from Tracing import span, traced
+#
+#   with span("extract", file_type="pdf") as s:
+#       pages = ...
+#       s.items = len(pages)
+#
+#   @traced("split", items=len)
+#   def split_into_clauses(text): ...
+#
+# Every finished span
+#   - updates the process-wide per-stage metrics (calls, duration histogram, items, tokens,
+#     errors, peak RSS), served in Prometheus text format by Api_service's /metrics,
+#   - is appended to a JSONL trace file when CONTRACT_NLP_TRACE_FILE is set, and
+#   - is added to the enclosing collect_spans() block, which is how an API job gets its
+#     own per-stage timings.
+# CONTRACT_NLP_TRACING=0 turns spans into no-ops.
+
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+
+TRACING_ENV = "CONTRACT_NLP_TRACING"
+TRACE_FILE_ENV = "CONTRACT_NLP_TRACE_FILE"
+TRACING = os.getenv(TRACING_ENV, "1").lower() not in ("0", "false", "no")
+TRACE_FILE = os.getenv(TRACE_FILE_ENV)
+METRIC_PREFIX = "contract_nlp"
+# Upper bounds (seconds) of the duration histogram buckets.
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None when it cannot be measured."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        # Windows reports the peak working set; elsewhere fall back to the current RSS.
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    # ru_maxrss is kilobytes on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@dataclass
+class Span:
+    name: str
+    start: float                # wall-clock start (epoch seconds)
+    seconds: float = 0.0
+    items: int = None           # pages, clauses, chunks... whatever the stage processes
+    tokens: int = None          # model / LLM tokens, where the stage knows them
+    peak_rss_mb: float = None   # process peak RSS when the span ended
+    error: str = None
+    parent: str = None
+    thread: str = None
+    attrs: dict = field(default_factory=dict)
+
+    def add(self, items=0, tokens=0):
+        """Accumulate counts, e.g. tokens reported by each request inside the span."""
+        if items:
+            self.items = (self.items or 0) + items
+        if tokens:
+            self.tokens = (self.tokens or 0) + tokens
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class StageMetrics:
+    """Per-stage aggregates of every finished span, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.stages = {}
+        self.peak_rss_mb = None
+        self._lock = threading.Lock()
+
+    def observe(self, span):
+        with self._lock:
+            stage = self.stages.get(span.name)
+            if stage is None:
+                stage = self.stages[span.name] = {
+                    "calls": 0, "errors": 0, "seconds": 0.0, "items": 0, "tokens": 0,
+                    "buckets": [0] * len(self.buckets),
+                }
+            stage["calls"] += 1
+            stage["seconds"] += span.seconds
+            stage["items"] += span.items or 0
+            stage["tokens"] += span.tokens or 0
+            if span.error:
+                stage["errors"] += 1
+            for i, bound in enumerate(self.buckets):
+                if span.seconds <= bound:
+                    stage["buckets"][i] += 1
+            if span.peak_rss_mb is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0.0, span.peak_rss_mb)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {k: v for k, v in stage.items() if k != "buckets"}
+                    for name, stage in self.stages.items()}
+
+    def prometheus(self):
+        p = METRIC_PREFIX
+        with self._lock:
+            stages = {name: dict(stage, buckets=list(stage["buckets"])) for name, stage in self.stages.items()}
+            peak = self.peak_rss_mb
+        lines = [
+            f"# HELP {p}_stage_duration_seconds Duration of pipeline stage spans.",
+            f"# TYPE {p}_stage_duration_seconds histogram",
+        ]
+        for name, stage in stages.items():
+            for bound, count in zip(self.buckets, stage["buckets"]):
+                lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stage["calls"]}')
+            lines.append(f'{p}_stage_duration_seconds_sum{{stage="{name}"}} {stage["seconds"]:.6f}')
+            lines.append(f'{p}_stage_duration_seconds_count{{stage="{name}"}} {stage["calls"]}')
+        for metric, key, help_text in (
+            ("stage_items_total", "items", "Items (pages, clauses, chunks) processed by each stage."),
+            ("stage_tokens_total", "tokens", "Model and LLM tokens processed by each stage."),
+            ("stage_errors_total", "errors", "Stage spans that ended with an exception."),
+        ):
+            lines.append(f"# HELP {p}_{metric} {help_text}")
+            lines.append(f"# TYPE {p}_{metric} counter")
+            for name, stage in stages.items():
+                lines.append(f'{p}_{metric}{{stage="{name}"}} {stage[key]}')
+        if peak is not None:
+            lines.append(f"# HELP {p}_peak_rss_bytes Peak resident set size seen at the end of a span.")
+            lines.append(f"# TYPE {p}_peak_rss_bytes gauge")
+            lines.append(f"{p}_peak_rss_bytes {int(peak * 1024 * 1024)}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonlExporter:
+    """Appends one JSON object per finished span to ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+metrics = StageMetrics()
+_exporter = JsonlExporter(TRACE_FILE) if TRACE_FILE else None
+_current = contextvars.ContextVar("contract_nlp_span", default=None)
+_collector = contextvars.ContextVar("contract_nlp_span_collector", default=None)
+
+
+def current_span():
+    """The innermost open span of this thread/context, or None."""
+    return _current.get()
+
+
+def _finish(s):
+    metrics.observe(s)
+    collector = _collector.get()
+    if collector is not None:
+        collector.append(s)
+    if _exporter is not None:
+        _exporter.export(s)
+
+
+@contextmanager
+def span(name, items=None, tokens=None, **attrs):
+    """
+    Time the enclosed block as stage ``name``.
+
+    Yields the ``Span``; set ``items``/``tokens`` on it (or call ``add``) once they are
+    known. Exceptions are recorded on the span and re-raised.
+    """
+    parent = _current.get()
+    s = Span(name=name, start=time.time(), items=items, tokens=tokens, attrs=attrs,
+             parent=parent.name if parent else None, thread=threading.current_thread().name)
+    if not TRACING:
+        yield s
+        return
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        s.seconds = time.perf_counter() - t0
+        s.peak_rss_mb = peak_rss_mb()
+        _current.reset(token)
+        _finish(s)
+
+
+def record_span(name, seconds, items=None, tokens=None, **attrs):
+    """Record a span measured by the caller, e.g. one phase of interleaved work."""
+    if not TRACING:
+        return None
+    parent = _current.get()
+    s = Span(name=name, start=time.time() - seconds, seconds=seconds, items=items, tokens=tokens,
+             peak_rss_mb=peak_rss_mb(), parent=parent.name if parent else None,
+             thread=threading.current_thread().name, attrs=attrs)
+    _finish(s)
+    return s
+
+
+def traced(name, items=None):
+    """
+    Decorator form of ``span``. ``items``, if given, is called on the return value to
+    count the items processed (e.g. ``len``).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as s:
+                result = fn(*args, **kwargs)
+                if items is not None:
+                    s.items = items(result)
+                return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_spans():
+    """Collect every span finished inside the block (and in ``propagate``d tasks) into a list."""
+    spans = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+
+def current_collector():
+    """The list the enclosing ``collect_spans()`` block collects into, or None."""
+    return _collector.get()
+
+
+def propagate(fn):
+    """
+    Wrap ``fn`` so that it runs with the caller's tracing context in another thread (e.g. a
+    ThreadPoolExecutor task), keeping its spans in the caller's collector and under the
+    caller's span.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time: each call gets its own copy.
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def summarize_spans(spans):
+    """Per-stage totals of ``spans``, in order of first appearance."""
+    summary = {}
+    for s in list(spans):
+        stage = summary.setdefault(s.name, {"calls": 0, "seconds": 0.0, "items": 0, "tokens": 0, "errors": 0})
+        stage["calls"] += 1
+        stage["seconds"] += s.seconds
+        stage["items"] += s.items or 0
+        stage["tokens"] += s.tokens or 0
+        stage["errors"] += 1 if s.error else 0
+        if s.peak_rss_mb is not None:
+            stage["peak_rss_mb"] = max(stage.get("peak_rss_mb", 0.0), s.peak_rss_mb)
+    return summary
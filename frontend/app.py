@@ -1,92 +1,158 @@
 import streamlit as st
+import io
 import os
-from Input_pipeline import classify_contract
-from Summarisation_pipeline import hierarchical_summary_openai
-from Report_Generator import generate_pdf_report
+import time
+import pandas as pd
+import requests
+
+# The pipeline runs in Api_service (uvicorn Api_service:app); this app only uploads the
+# contract, follows the job and shows its artifacts.
+
+API_URL = os.getenv("CONTRACT_NLP_API_URL", "http://127.0.0.1:8000")
+POLL_SECONDS = 1.0
+REQUEST_TIMEOUT = 30
+
+STAGES = {
+    "ingestion": "Reading contract...",
+    "classification": "Step 1: Classifying Contract Clauses...",
+    "summarization": "Step 2: Generating Contract Summary...",
+    "report": "Step 3: Generating PDF Report...",
+}
+
+
+def timings_table(timings):
+    # Job stages (job_*) first, then the pipeline spans inside them.
+    rows = [
+        {"Stage": name, "Seconds": round(t["seconds"], 3), "Calls": t["calls"], "Items": t["items"],
+         "Tokens": t["tokens"], "Peak RSS (MB)": round(t["peak_rss_mb"]) if t.get("peak_rss_mb") else None}
+        for name, t in timings.items()
+    ]
+    rows.sort(key=lambda row: not row["Stage"].startswith("job_"))
+    return pd.DataFrame(rows)
+
+
+def summary_tokens_table(spend):
+    rows = [
+        {"Tier": str(tier), "Clauses": t["clauses"], "Summarised": t["summarized"], "Skipped": t["skipped"],
+         "Planned tokens": t["planned_tokens"], "Spent tokens": t["spent_tokens"]}
+        for tier, t in spend["tiers"].items()
+    ]
+    rows.append({"Tier": "reduce", "Planned tokens": spend["reduce"]["planned_tokens"],
+                 "Spent tokens": spend["reduce"]["spent_tokens"]})
+    return pd.DataFrame(rows)
+
+
+def api_get(path, **kwargs):
+    resp = requests.get(f"{API_URL}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+    resp.raise_for_status()
+    return resp
+
+
+def submit_contract(uploaded_file):
+    resp = requests.post(
+        f"{API_URL}/jobs",
+        files={"file": (uploaded_file.name, uploaded_file.getvalue())},
+        timeout=REQUEST_TIMEOUT
+    )
+    if resp.status_code == 429:
+        raise RuntimeError("The service is busy; please retry in a few seconds.")
+    resp.raise_for_status()
+    return resp.json()["id"]
+
+
+def wait_for_job(job_id):
+    status_box = st.empty()
+    while True:
+        job = api_get(f"/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            status_box.empty()
+            return job
+        status_box.info(STAGES.get(job["stage"], "Waiting in queue..."))
+        time.sleep(POLL_SECONDS)
 
-# Setup paths
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
-OUTPUT_DIR = ("D:\AI\Projects\Contract_NLP\output")
-
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 st.set_page_config(page_title="Contract NLP Tool", layout="wide")
 st.title("📄 Contract NLP Tool")
 
+with st.sidebar:
+    st.caption("Service")
+    try:
+        st.json(api_get("/health").json())
+    except requests.RequestException as e:
+        st.error(f"API not reachable at {API_URL}: {e}")
+
 # File upload
 
 uploaded_file = st.file_uploader("Upload your contract (PDF or DOCX)", type=["pdf", "docx"])
 
 if uploaded_file is not None:
-    uploaded_file_path = os.path.join(UPLOADS_DIR, uploaded_file.name)
-    with open(uploaded_file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    
     st.success(f"File uploaded: {uploaded_file.name}")
 
+    # Streamlit reruns this script on every interaction; keep the job of the current file.
+    upload_key = (uploaded_file.name, uploaded_file.size)
+    if st.session_state.get("upload_key") != upload_key:
+        try:
+            st.session_state["job_id"] = submit_contract(uploaded_file)
+            st.session_state["upload_key"] = upload_key
+        except Exception as e:
+            st.error(f"Error submitting contract: {e}")
+            st.stop()
+
+    job_id = st.session_state["job_id"]
+    job = wait_for_job(job_id)
+    artifacts = set(job["artifacts"])
+    if job["status"] == "failed":
+        st.error(f"Error during {job.get('failed_stage') or 'processing'}: {job['error']}")
+
     # Step 1: Clause Classification
 
     st.subheader("Step 1: Classifying Contract Clauses...")
-    try:
-        classified_df = classify_contract(uploaded_file_path)
+    if "csv" in artifacts:
+        csv_bytes = api_get(f"/jobs/{job_id}/csv").content
         st.success("✅ Clause classification complete!")
-        st.dataframe(classified_df.head())
-
-        csv_path = os.path.join(OUTPUT_DIR, "classified_contract.csv")
+        st.dataframe(pd.read_csv(io.BytesIO(csv_bytes)).head())
         st.download_button(
             label="Download Classified CSV",
-            data=open(csv_path, "rb"),
+            data=csv_bytes,
             file_name="classified_contract.csv",
             mime="text/csv"
         )
-    except Exception as e:
-        st.error(f"Error during classification: {e}")
 
     # Step 2: Summarization
 
     st.subheader("Step 2: Generating Contract Summary...")
-    try:
-        final_summary, chunk_summaries = hierarchical_summary_openai(
-            text=classified_df['Clause'].str.cat(sep="\n"),
-            chunk_size_chars=2500,
-            overlap_chars=200
-        )
-        summary_path = os.path.join(OUTPUT_DIR, "Contract_Abstractive_Summary.txt")
-        with open(summary_path, "w", encoding="utf-8") as f:
-            f.write(final_summary)
+    if "summary" in artifacts:
+        final_summary = api_get(f"/jobs/{job_id}/summary").text
         st.success("✅ Summary generated!")
         st.text_area("Contract Summary", final_summary, height=300)
-
         st.download_button(
             label="Download Summary",
-            data=open(summary_path, "rb"),
+            data=final_summary.encode("utf-8"),
             file_name="Contract_Abstractive_Summary.txt",
             mime="text/plain"
         )
-    except Exception as e:
-        st.error(f"Error during summarization: {e}")
+        if job.get("summary_tokens"):
+            spend = job["summary_tokens"]
+            st.caption(f"Tiered summary: {spend['api_calls']} API calls, at most {spend['planned_tokens']} tokens "
+                       f"(budget {spend['token_budget']}, ${spend['planned_cost_usd']:.4f} of ${spend['cost_budget_usd']:.2f})")
+            st.dataframe(summary_tokens_table(spend), hide_index=True)
 
     # Step 3: Generate PDF Report
 
     st.subheader("Step 3: Generating PDF Report...")
-    try:
-        pdf_path = os.path.join(OUTPUT_DIR, "Contract_Analysis_Report.pdf")
-        generate_pdf_report(
-            csv_path=os.path.join(OUTPUT_DIR, "classified_contract.csv"),
-            summary_path=summary_path,
-            output_pdf=pdf_path,
-            graphs_dir="D:\AI\Projects\Contract_NLP\Graphs"
-        )
-        st.success(f"✅ PDF report generated: {pdf_path}")
-
+    if "report" in artifacts:
+        st.success("✅ PDF report generated!")
         st.download_button(
             label="Download PDF Report",
-            data=open(pdf_path, "rb"),
+            data=api_get(f"/jobs/{job_id}/report").content,
             file_name="Contract_Analysis_Report.pdf",
             mime="application/pdf"
         )
-    except Exception as e:
-        st.error(f"Error during PDF generation: {e}")
+
+    # Processing time per stage
+
+    if job.get("timings"):
+        st.subheader("Processing Time")
+        timings = timings_table(job["timings"])
+        st.bar_chart(timings[timings["Stage"].str.startswith("job_")].set_index("Stage")["Seconds"])
+        st.dataframe(timings, hide_index=True)
@@ -0,0 +1,448 @@
+# Distill_LBERT.py
+# Distils the fine-tuned Legal-BERT classifier into a smaller student for CPU inference.
+#
+# Usage:
+#   python python_Scripts/Distill_LBERT.py [--layers 4] [--hidden-size 384] [--epochs 6]
+#
+# The teacher labels every clause of combined_clauses.csv once (its logits are cached), the
+# student - a BERT with fewer and narrower layers sharing the teacher's tokenizer - is
+# trained on a mix of the teacher's softened distribution and the gold labels, and both
+# are then measured on the same held-out clauses, each in a fresh process: accuracy,
+# agreement with the teacher, latency and peak RSS. The student is saved in the teacher's
+# layout (AutoModelForSequenceClassification + tokenizer + label_encoder.pkl), so the
+# frontend loads it with
+#   CONTRACT_NLP_MODEL_PATH=<output> CONTRACT_NLP_LABEL_ENCODER=<output>/label_encoder.pkl
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass
+from functools import partial
+
+import joblib
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from sklearn.model_selection import GroupShuffleSplit
+from torch.utils.data import Dataset, DataLoader
+from transformers import AutoModelForSequenceClassification, AutoTokenizer, get_linear_schedule_with_warmup
+from tqdm import tqdm
+
+from Train_LBERT import DEVICE, MAX_LEN, LengthBucketSampler, _autocast, _file_digest, _tokenizer_digest, collate_batch
+
+# -------------------------------
+# Paths and Hyperparameters
+# -------------------------------
+TEACHER_MODEL = "bhargav-07-bidkar/Legalbert_Finetuned"
+LABEL_ENCODER_PATH = "label_encoder.pkl"
+CLAUSES_CSV = "combined_clauses.csv"
+OUTPUT_DIR = "legalbert_student"
+SOFT_LABEL_DIR = os.path.join("CUAD_v1", "processed", "teacher_logits")
+
+STUDENT_LAYERS = 4
+STUDENT_HIDDEN = 384
+STUDENT_HEADS = 6     # for a narrower student; one with the teacher's width keeps its heads
+BATCH_SIZE = 32
+EPOCHS = 6
+LR = 1e-4
+TEMPERATURE = 2.0
+SOFT_WEIGHT = 0.7      # share of the loss from the teacher's distribution; the rest is gold-label CE
+HOLDOUT = 0.15
+TEACHER_BATCH_SIZE = 32
+LATENCY_CLAUSES = 200  # clauses timed one at a time for the single-clause latency
+
+
+@dataclass
+class DistillConfig:
+    teacher: str = TEACHER_MODEL
+    label_encoder: str = LABEL_ENCODER_PATH
+    csv: str = CLAUSES_CSV
+    output_dir: str = OUTPUT_DIR
+    layers: int = STUDENT_LAYERS
+    hidden_size: int = STUDENT_HIDDEN
+    heads: int = None     # None: the teacher's heads at its hidden size, else STUDENT_HEADS
+    batch_size: int = BATCH_SIZE
+    epochs: int = EPOCHS
+    lr: float = LR
+    warmup_ratio: float = 0.06
+    weight_decay: float = 0.01
+    max_grad_norm: float = 1.0
+    temperature: float = TEMPERATURE
+    soft_weight: float = SOFT_WEIGHT
+    holdout: float = HOLDOUT
+    bf16: bool = False
+    threads: int = None
+    seed: int = 0
+
+# -------------------------------
+# Data
+# -------------------------------
+class ClauseDataset(Dataset):
+    """Tokenized clauses with gold label ids and, for training, the teacher's logits."""
+
+    def __init__(self, input_ids, labels, teacher_logits=None):
+        self.input_ids = input_ids
+        self.labels = labels
+        self.teacher_logits = teacher_logits
+        self.lengths = np.array([len(ids) for ids in input_ids])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        item = {
+            "input_ids": torch.tensor(self.input_ids[idx], dtype=torch.long),
+            "labels": torch.tensor(self.labels[idx], dtype=torch.long),
+        }
+        if self.teacher_logits is not None:
+            item["teacher_logits"] = torch.from_numpy(self.teacher_logits[idx])
+        return item
+
+
+def collate_distill(items, pad_token_id=0):
+    batch = collate_batch(items, pad_token_id)
+    if "teacher_logits" in items[0]:
+        batch["teacher_logits"] = torch.stack([item["teacher_logits"] for item in items])
+    return batch
+
+
+def load_clauses(csv_path, le):
+    # Same rows and label ids as the frontend's parity sample: clause text alone, as at inference
+    df = pd.read_csv(csv_path, usecols=["Label", "Clause"]).dropna()
+    df = df[df["Label"].isin(le.classes_)]
+    return df["Clause"].astype(str).tolist(), le.transform(df["Label"])
+
+
+def _normalize(clause):
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", clause.lower()).split())
+
+
+def split_indices(clauses, holdout, seed):
+    # CUAD repeats a span once per category it belongs to: split by normalised text so no
+    # held-out clause is also a training clause
+    splitter = GroupShuffleSplit(n_splits=1, test_size=holdout, random_state=seed)
+    train, test = next(splitter.split(np.zeros(len(clauses)), groups=[_normalize(c) for c in clauses]))
+    return np.sort(train), np.sort(test)
+
+
+def _loader(dataset, tokenizer, batch_size, shuffle, seed=0):
+    return DataLoader(dataset, batch_sampler=LengthBucketSampler(dataset.lengths, batch_size, shuffle=shuffle, seed=seed),
+                      collate_fn=partial(collate_distill, pad_token_id=tokenizer.pad_token_id or 0))
+
+# -------------------------------
+# Soft labels
+# -------------------------------
+# The teacher's logits for every clause are computed once and stored next to the
+# pre-tokenized splits, keyed on the CSV, the tokenizer and the teacher's classifier weights.
+def _teacher_digest(teacher):
+    h = hashlib.sha256(teacher.config.name_or_path.encode("utf-8"))
+    for param in teacher.classifier.parameters():
+        h.update(param.detach().cpu().numpy().tobytes())
+    return h.hexdigest()
+
+
+def teacher_logits(teacher, tokenizer, input_ids, csv_path, cache_dir=SOFT_LABEL_DIR, batch_size=TEACHER_BATCH_SIZE):
+    h = hashlib.sha256()
+    for part in (_file_digest(csv_path), _tokenizer_digest(tokenizer), _teacher_digest(teacher), str(MAX_LEN)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    path = os.path.join(cache_dir, f"{h.hexdigest()[:20]}.npy")
+    if os.path.exists(path):
+        print(f"Using cached teacher logits from {path}")
+        return np.load(path)
+
+    dataset = ClauseDataset(input_ids, np.zeros(len(input_ids), dtype=np.int64))
+    logits = np.zeros((len(dataset), teacher.config.num_labels), dtype=np.float32)
+    teacher.eval()
+    with torch.inference_mode():
+        for rows in tqdm(LengthBucketSampler(dataset.lengths, batch_size, shuffle=False), desc="Soft-labelling"):
+            batch = collate_distill([dataset[i] for i in rows], tokenizer.pad_token_id or 0)
+            out = teacher(input_ids=batch["input_ids"].to(DEVICE), attention_mask=batch["attention_mask"].to(DEVICE))
+            logits[rows] = out.logits.float().cpu().numpy()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, logits)
+    os.replace(tmp, path)
+    print(f"Teacher logits for {len(logits)} clauses -> {path}")
+    return logits
+
+# -------------------------------
+# Student
+# -------------------------------
+def build_student(teacher, config):
+    """
+    A narrower, shallower copy of the teacher's architecture.
+
+    With the teacher's hidden size, every k-th encoder layer is copied over (as in
+    DistilBERT), so the attention heads must be the teacher's too; with a smaller one, the
+    word embeddings start from the teacher's projected onto their top principal components.
+    Everything else starts from scratch.
+    """
+    t_config = teacher.config
+    same_width = config.hidden_size == t_config.hidden_size
+    heads = config.heads or (t_config.num_attention_heads if same_width else STUDENT_HEADS)
+    if config.hidden_size % heads:
+        raise ValueError(f"Hidden size {config.hidden_size} is not divisible by {heads} attention heads")
+    if same_width and heads != t_config.num_attention_heads:
+        # The copied query/key/value weights would be split into differently sized heads.
+        raise ValueError(f"A student with the teacher's hidden size copies its layers, so it needs the "
+                         f"teacher's {t_config.num_attention_heads} attention heads, not {heads}")
+    s_config = type(t_config).from_dict({
+        **t_config.to_dict(),
+        "num_hidden_layers": config.layers,
+        "hidden_size": config.hidden_size,
+        "num_attention_heads": heads,
+        "intermediate_size": t_config.intermediate_size * config.hidden_size // t_config.hidden_size,
+    })
+    student = AutoModelForSequenceClassification.from_config(s_config)
+    t_base = getattr(teacher, teacher.base_model_prefix)
+    s_base = getattr(student, student.base_model_prefix)
+
+    if same_width:
+        s_base.embeddings.load_state_dict(t_base.embeddings.state_dict())
+        step = t_config.num_hidden_layers / config.layers
+        for i, layer in enumerate(s_base.encoder.layer):
+            layer.load_state_dict(t_base.encoder.layer[min(t_config.num_hidden_layers - 1, int((i + 1) * step) - 1)].state_dict())
+        if getattr(t_base, "pooler", None) is not None and getattr(s_base, "pooler", None) is not None:
+            s_base.pooler.load_state_dict(t_base.pooler.state_dict())
+        student.classifier.load_state_dict(teacher.classifier.state_dict())
+    elif config.hidden_size < t_config.hidden_size:
+        with torch.no_grad():
+            weights = t_base.embeddings.word_embeddings.weight.float()
+            centred = weights - weights.mean(dim=0)
+            _, _, components = torch.pca_lowrank(centred, q=config.hidden_size, center=False)
+            projected = centred @ components
+            scale = s_config.initializer_range / projected.std()
+            s_base.embeddings.word_embeddings.weight.copy_(projected * scale)
+    return student
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature, soft_weight):
+    # KL between the temperature-softened distributions, scaled by T^2 so its gradients stay
+    # comparable to the cross-entropy term as T changes
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=-1),
+                    F.softmax(teacher_logits / temperature, dim=-1), reduction="batchmean") * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return soft_weight * soft + (1 - soft_weight) * hard
+
+
+def train_epoch(student, dataloader, optimizer, scheduler, config):
+    student.train()
+    total_loss = torch.zeros((), device=DEVICE)
+    samples = 0
+    start = time.perf_counter()
+    for batch in tqdm(dataloader, desc="Distilling"):
+        batch = {k: v.to(DEVICE, non_blocking=True) for k, v in batch.items()}
+        with _autocast(config):
+            logits = student(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+        loss = distillation_loss(logits.float(), batch["teacher_logits"], batch["labels"],
+                                 config.temperature, config.soft_weight)
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(student.parameters(), config.max_grad_norm)
+        optimizer.step()
+        scheduler.step()
+        optimizer.zero_grad(set_to_none=True)
+        total_loss += loss.detach()
+        samples += batch["labels"].size(0)
+    return total_loss.item() / max(1, len(dataloader)), samples / (time.perf_counter() - start)
+
+
+def predict_ids(model, dataloader, config=None):
+    """Class ids for every row of an unshuffled loader, in dataset order."""
+    config = config or DistillConfig()
+    model.eval()
+    preds = np.zeros(len(dataloader.dataset), dtype=np.int64)
+    with torch.inference_mode():
+        for rows, batch in zip(dataloader.batch_sampler, dataloader):
+            with _autocast(config):
+                logits = model(input_ids=batch["input_ids"].to(model.device),
+                               attention_mask=batch["attention_mask"].to(model.device)).logits
+            preds[rows] = logits.argmax(dim=-1).cpu().numpy()
+    return preds
+
+# -------------------------------
+# Teacher vs student report
+# -------------------------------
+# Each model is loaded and measured on CPU in a fresh process, so the peak RSS of one does
+# not include the other (or the training run).
+def _peak_rss_mb():
+    # VmHWM rather than ru_maxrss on Linux: ru_maxrss survives exec, so a spawned process
+    # would report its parent's peak
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measure(model_dir, clauses, threads, latency_clauses):
+    if threads:
+        torch.set_num_threads(threads)
+    rss_before = _peak_rss_mb()
+    start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+    model.eval()
+    load_seconds = time.perf_counter() - start
+
+    input_ids = tokenizer(clauses, truncation=True, max_length=MAX_LEN)["input_ids"]
+    dataset = ClauseDataset(input_ids, np.zeros(len(clauses), dtype=np.int64))
+    start = time.perf_counter()
+    preds = predict_ids(model, _loader(dataset, tokenizer, BATCH_SIZE, shuffle=False))
+    batched_seconds = time.perf_counter() - start
+
+    # Single-clause calls, tokenized the way Input_pipeline.predict_clause_label does
+    timings = []
+    with torch.inference_mode():
+        for clause in clauses[:latency_clauses]:
+            start = time.perf_counter()
+            inputs = tokenizer(clause, return_tensors="pt", truncation=True, padding=True, max_length=MAX_LEN)
+            model(**inputs)
+            timings.append(time.perf_counter() - start)
+
+    return {
+        "model": model_dir,
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "load_seconds": load_seconds,
+        "single_ms_median": 1000 * float(np.median(timings)),
+        "single_ms_p95": 1000 * float(np.percentile(timings, 95)),
+        "batched_clauses_per_second": len(clauses) / batched_seconds,
+        "model_rss_mb": _peak_rss_mb() - rss_before,
+        "peak_rss_mb": _peak_rss_mb(),
+        "preds": preds.tolist(),
+    }
+
+
+def measure(model_dir, clauses, threads=None, latency_clauses=LATENCY_CLAUSES):
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measure, (model_dir, clauses, threads, latency_clauses))
+
+
+def compare(teacher_dir, student_dir, clauses, true_ids, threads=None):
+    rows = []
+    for name, model_dir in (("teacher", teacher_dir), ("student", student_dir)):
+        print(f"Measuring {name} ({model_dir})...")
+        rows.append(dict(measure(model_dir, clauses, threads), name=name))
+    teacher_preds = np.asarray(rows[0]["preds"])
+    for row in rows:
+        preds = np.asarray(row.pop("preds"))
+        row["accuracy"] = float(np.mean(preds == true_ids))
+        row["agreement_with_teacher"] = float(np.mean(preds == teacher_preds))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"\n{'':8} {'params':>12} {'accuracy':>9} {'agreement':>10} {'1-clause ms':>12} {'p95 ms':>8} "
+          f"{'clauses/s':>10} {'model RSS MB':>13} {'peak RSS MB':>12}")
+    for r in rows:
+        print(f"{r['name']:8} {r['parameters']:>12,} {r['accuracy']:>9.4f} {r['agreement_with_teacher']:>10.4f} "
+              f"{r['single_ms_median']:>12.2f} {r['single_ms_p95']:>8.2f} {r['batched_clauses_per_second']:>10.1f} "
+              f"{r['model_rss_mb']:>13.0f} {r['peak_rss_mb']:>12.0f}")
+    teacher, student = rows
+    print(f"Student: {teacher['single_ms_median'] / student['single_ms_median']:.1f}x faster per clause, "
+          f"{teacher['peak_rss_mb'] / student['peak_rss_mb']:.1f}x less peak RSS, "
+          f"{teacher['parameters'] / student['parameters']:.1f}x fewer parameters, "
+          f"accuracy {student['accuracy'] - teacher['accuracy']:+.4f}")
+
+# -------------------------------
+# Main
+# -------------------------------
+def parse_args():
+    defaults = DistillConfig()
+    parser = argparse.ArgumentParser(description="Distil the fine-tuned Legal-BERT into a smaller student.")
+    parser.add_argument("--teacher", default=defaults.teacher, help="Teacher model directory or Hub id")
+    parser.add_argument("--label-encoder", default=defaults.label_encoder)
+    parser.add_argument("--csv", default=defaults.csv, help="Labelled clauses (Label, Clause)")
+    parser.add_argument("--output-dir", default=defaults.output_dir)
+    parser.add_argument("--layers", type=int, default=defaults.layers)
+    parser.add_argument("--hidden-size", type=int, default=defaults.hidden_size)
+    parser.add_argument("--heads", type=int, default=defaults.heads,
+                        help=f"Attention heads (default: the teacher's at its hidden size, else {STUDENT_HEADS})")
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--epochs", type=int, default=defaults.epochs)
+    parser.add_argument("--lr", type=float, default=defaults.lr)
+    parser.add_argument("--temperature", type=float, default=defaults.temperature)
+    parser.add_argument("--soft-weight", type=float, default=defaults.soft_weight)
+    parser.add_argument("--holdout", type=float, default=defaults.holdout)
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    return DistillConfig(**{k.replace("-", "_"): v for k, v in vars(parser.parse_args()).items()})
+
+
+def main(config=None):
+    config = config or parse_args()
+    torch.manual_seed(config.seed)
+    if config.threads:
+        torch.set_num_threads(config.threads)
+
+    # Teacher, labels and soft labels
+    le = joblib.load(config.label_encoder)
+    tokenizer = AutoTokenizer.from_pretrained(config.teacher)
+    teacher = AutoModelForSequenceClassification.from_pretrained(config.teacher)
+    teacher.to(DEVICE)
+    if teacher.config.num_labels != len(le.classes_):
+        raise ValueError(f"Teacher has {teacher.config.num_labels} labels, label encoder {len(le.classes_)}")
+
+    clauses, true_ids = load_clauses(config.csv, le)
+    input_ids = tokenizer(clauses, truncation=True, max_length=MAX_LEN)["input_ids"]
+    soft = teacher_logits(teacher, tokenizer, input_ids, config.csv)
+    train_rows, test_rows = split_indices(clauses, config.holdout, config.seed)
+    print(f"Clauses: {len(clauses)} (train {len(train_rows)}, held out {len(test_rows)}), labels: {len(le.classes_)}")
+
+    # Student
+    student = build_student(teacher, config)
+    del teacher
+    student.to(DEVICE)
+    print(f"Student: {config.layers} layers, hidden size {config.hidden_size}, "
+          f"{student.config.num_attention_heads} heads, "
+          f"{sum(p.numel() for p in student.parameters()):,} parameters")
+
+    train_data = ClauseDataset([input_ids[i] for i in train_rows], true_ids[train_rows], soft[train_rows])
+    test_data = ClauseDataset([input_ids[i] for i in test_rows], true_ids[test_rows])
+    train_loader = _loader(train_data, tokenizer, config.batch_size, shuffle=True, seed=config.seed)
+    test_loader = _loader(test_data, tokenizer, config.batch_size, shuffle=False)
+    teacher_test_ids = soft[test_rows].argmax(axis=1)
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=config.lr, weight_decay=config.weight_decay)
+    total_steps = len(train_loader) * config.epochs
+    scheduler = get_linear_schedule_with_warmup(optimizer, int(total_steps * config.warmup_ratio), total_steps)
+
+    for epoch in range(config.epochs):
+        print(f"\nEpoch {epoch+1}/{config.epochs}")
+        loss, samples_per_s = train_epoch(student, train_loader, optimizer, scheduler, config)
+        preds = predict_ids(student, test_loader, config)
+        print(f"Loss: {loss:.4f} | Held-out Acc: {np.mean(preds == test_data.labels):.4f} | "
+              f"Agreement with teacher: {np.mean(preds == teacher_test_ids):.4f} | {samples_per_s:.1f} samples/s")
+
+    # Save in the teacher's layout
+    os.makedirs(config.output_dir, exist_ok=True)
+    student.save_pretrained(config.output_dir)
+    tokenizer.save_pretrained(config.output_dir)
+    joblib.dump(le, os.path.join(config.output_dir, "label_encoder.pkl"))
+    print(f"Student saved to {config.output_dir}")
+
+    # Teacher vs student on the held-out clauses
+    rows = compare(config.teacher, config.output_dir, [clauses[i] for i in test_rows], true_ids[test_rows], config.threads)
+    print_comparison(rows)
+    with open(os.path.join(config.output_dir, "distillation_report.json"), "w", encoding="utf-8") as f:
+        json.dump({"config": asdict(config), "held_out_clauses": len(test_rows), "models": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
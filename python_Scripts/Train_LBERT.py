@@ -1,9 +1,20 @@
 # LegalBERT_Paragraph_Classification.py
+import argparse
+import hashlib
+import json
+import math
 import os
+import shutil
+import time
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
+from functools import partial
+
+import numpy as np
 import pandas as pd
 import torch
-from torch.utils.data import Dataset, DataLoader
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, AdamW
+from torch.utils.data import Dataset, DataLoader, Sampler
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, get_linear_schedule_with_warmup
 from sklearn.preprocessing import LabelEncoder
 from tqdm import tqdm
 
@@ -20,134 +31,453 @@ EPOCHS = 3
 LR = 2e-5
 MAX_LEN = 512  # max tokens per paragraph
 
+# Pre-tokenized splits are cached here, keyed on tokenizer, MAX_LEN, label mapping and CSV contents
+TOKEN_CACHE_DIR = os.path.join(DATA_DIR, "token_cache")
+PRETOKENIZE_CHUNK_ROWS = 2048
+# Length bucketing: batches are drawn from shuffled pools of BUCKET_POOL_BATCHES batches
+# sorted by length, and padded to the longest sequence (rounded up to PAD_TO_MULTIPLE)
+BUCKET_POOL_BATCHES = 50
+PAD_TO_MULTIPLE = 8
+CHECKPOINT_DIR = "checkpoints"
+
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# -------------------------------
+# Pre-tokenization (memory-mapped token store)
+# -------------------------------
+# Each split is tokenized once into <TOKEN_CACHE_DIR>/<split>-<key>/:
+#   input_ids.bin  all token ids back to back (uint16 when the vocabulary fits)
+#   offsets.npy    row i is input_ids[offsets[i]:offsets[i+1]]
+#   labels.npy     encoded labels
+#   meta.json      dtype, counts and what the key was built from
+# "clause [SEP] paragraph" is a single text, so token_type_ids are all zero and the
+# attention mask is all ones up to the padding; only input ids need storing.
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _tokenizer_digest(tokenizer):
+    h = hashlib.sha256(f"{type(tokenizer).__name__}|{tokenizer.name_or_path}|{len(tokenizer)}".encode("utf-8"))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # Full serialized vocabulary and normalizer/pre-tokenizer settings; truncation and
+        # padding are call-time state left behind by the last tokenizer call
+        spec = json.loads(backend.to_str())
+        spec.pop("truncation", None)
+        spec.pop("padding", None)
+        h.update(json.dumps(spec, sort_keys=True).encode("utf-8"))
+    else:
+        h.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def token_cache_key(csv_path, tokenizer, le, max_len=MAX_LEN):
+    h = hashlib.sha256()
+    for part in (_file_digest(csv_path), _tokenizer_digest(tokenizer), str(max_len), "\x1f".join(map(str, le.classes_))):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:20]
+
+
+def pretokenize(csv_path, tokenizer, le, cache_dir=TOKEN_CACHE_DIR, max_len=MAX_LEN, chunk_rows=PRETOKENIZE_CHUNK_ROWS):
+    """
+    Tokenize a split CSV into the memory-mapped token store, once.
+
+    The CSV is read in chunks of ``chunk_rows``, so no full DataFrame is kept. Returns the
+    store directory; an existing store with the same key is reused as is.
+    """
+    split = os.path.splitext(os.path.basename(csv_path))[0]
+    store_dir = os.path.join(cache_dir, f"{split}-{token_cache_key(csv_path, tokenizer, le, max_len)}")
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        print(f"Using pre-tokenized {split} from {store_dir}")
+        return store_dir
+
+    dtype = np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else np.int32
+    tmp_dir = f"{store_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    offsets = [0]
+    labels = []
+    with open(os.path.join(tmp_dir, "input_ids.bin"), "wb") as ids_file:
+        for chunk in pd.read_csv(csv_path, usecols=["clause", "paragraph", "label"], chunksize=chunk_rows):
+            texts = [f"{clause} [SEP] {paragraph}" for clause, paragraph in zip(chunk["clause"].astype(str), chunk["paragraph"].astype(str))]
+            encoded = tokenizer(texts, truncation=True, max_length=max_len,
+                                return_attention_mask=False, return_token_type_ids=False)["input_ids"]
+            for ids in encoded:
+                ids_file.write(np.asarray(ids, dtype=dtype).tobytes())
+                offsets.append(offsets[-1] + len(ids))
+            labels.extend(le.transform(chunk["label"]))
+
+    np.save(os.path.join(tmp_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, "labels.npy"), np.asarray(labels, dtype=np.int64))
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"dtype": np.dtype(dtype).name, "rows": len(labels), "tokens": offsets[-1], "max_len": max_len,
+                   "source": os.path.abspath(csv_path), "tokenizer": tokenizer.name_or_path}, f, indent=2)
+    try:
+        os.replace(tmp_dir, store_dir)
+    except OSError:
+        # Another run stored the same split first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"Pre-tokenized {split}: {len(labels)} rows, {offsets[-1]} tokens -> {store_dir}")
+    return store_dir
+
+
 # -------------------------------
 # Dataset Class
 # -------------------------------
 class CUADDataset(Dataset):
-    def __init__(self, clauses, paragraphs, labels, tokenizer, max_len=512):
-        self.clauses = clauses
-        self.paragraphs = paragraphs
-        self.labels = labels
-        self.tokenizer = tokenizer
-        self.max_len = max_len
+    """
+    Reads a pre-tokenized split straight from its memory-mapped store.
+
+    Items are unpadded ``input_ids`` tensors plus ``labels``; ``collate_batch`` pads each
+    batch. The arrays are opened lazily, so every DataLoader worker maps the files itself
+    instead of receiving a pickled copy.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(store_dir, "offsets.npy"))
+        self.labels = np.load(os.path.join(store_dir, "labels.npy"))
+        self.lengths = np.diff(self.offsets)
+        self._ids = None
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = np.memmap(os.path.join(self.store_dir, "input_ids.bin"), dtype=self.meta["dtype"], mode="r",
+                                  shape=(self.meta["tokens"],))
+        return self._ids
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_ids"] = None
+        return state
 
     def __len__(self):
-        return len(self.clauses)
+        return len(self.labels)
 
     def __getitem__(self, idx):
-        clause = str(self.clauses[idx])
-        paragraph = str(self.paragraphs[idx])
-        text = f"{clause} [SEP] {paragraph}"  # Combine clause + paragraph
-
-        encoding = self.tokenizer(
-            text,
-            truncation=True,
-            padding="max_length",
-            max_length=self.max_len,
-            return_tensors="pt",
-        )
-        item = {key: val.squeeze(0) for key, val in encoding.items()}
-        item["labels"] = torch.tensor(self.labels[idx], dtype=torch.long)
-        return item
+        ids = self.ids[self.offsets[idx]:self.offsets[idx + 1]]
+        return {
+            "input_ids": torch.from_numpy(ids.astype(np.int64)),
+            "labels": torch.tensor(self.labels[idx], dtype=torch.long),
+        }
+
+
+class LengthBucketSampler(Sampler):
+    """
+    Batch sampler that groups rows of similar token length.
+
+    With ``shuffle``, rows are shuffled, cut into pools of ``batch_size * pool_batches``,
+    each pool is sorted by length and split into batches, and the batch order is shuffled
+    again - batches stay random across epochs but need little padding. Without it, rows are
+    batched in length order (for evaluation).
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, pool_batches=BUCKET_POOL_BATCHES, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pool_size = batch_size * pool_batches
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        # start_batch skips the batches of this epoch already trained on (resume)
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def __len__(self):
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if not self.shuffle:
+            order = np.argsort(self.lengths, kind="stable")
+            for start in range(0, len(order), self.batch_size):
+                yield order[start:start + self.batch_size].tolist()
+            return
+
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        start_batch, self.start_batch = self.start_batch, 0
+        order = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.pool_size):
+            pool = order[start:start + self.pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+        for i in rng.permutation(len(batches))[start_batch:]:
+            yield batches[i].tolist()
+
+
+def collate_batch(items, pad_token_id=0, pad_to_multiple=PAD_TO_MULTIPLE):
+    """Pad a batch to its longest sequence (rounded up to ``pad_to_multiple``)."""
+    longest = max(len(item["input_ids"]) for item in items)
+    if pad_to_multiple:
+        longest = min(MAX_LEN, -(-longest // pad_to_multiple) * pad_to_multiple)
+    input_ids = torch.full((len(items), longest), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(items), longest), dtype=torch.long)
+    for row, item in enumerate(items):
+        n = len(item["input_ids"])
+        input_ids[row, :n] = item["input_ids"]
+        attention_mask[row, :n] = 1
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "labels": torch.stack([item["labels"] for item in items]),
+    }
 
 # -------------------------------
 # Load CSVs and encode labels
 # -------------------------------
-def load_data(train_csv, val_csv, test_csv):
-    train_df = pd.read_csv(train_csv)
-    val_df = pd.read_csv(val_csv)
-    test_df = pd.read_csv(test_csv)
-
-    # Encode labels
+def load_data(train_csv, val_csv, test_csv, tokenizer, cache_dir=TOKEN_CACHE_DIR):
+    # Only the label columns are read to fit the encoder; the splits are then tokenized
+    # chunk by chunk into the token store (or taken from it).
     le = LabelEncoder()
-    all_labels = pd.concat([train_df['label'], val_df['label'], test_df['label']])
-    le.fit(all_labels)
+    le.fit(pd.concat([pd.read_csv(path, usecols=["label"])["label"] for path in (train_csv, val_csv, test_csv)]))
+
+    datasets = [CUADDataset(pretokenize(path, tokenizer, le, cache_dir)) for path in (train_csv, val_csv, test_csv)]
+    return (*datasets, le)
+
+# -------------------------------
+# Training configuration
+# -------------------------------
+@dataclass
+class TrainConfig:
+    batch_size: int = BATCH_SIZE
+    accumulation_steps: int = 1       # effective batch = batch_size * accumulation_steps
+    epochs: int = EPOCHS
+    lr: float = LR
+    warmup_ratio: float = 0.06        # linear warmup, then linear decay to zero
+    weight_decay: float = 0.01
+    max_grad_norm: float = 1.0
+    bf16: bool = False                # bfloat16 autocast (CPUs with AVX512-BF16/AMX benefit most)
+    num_workers: int = 0              # DataLoader worker processes
+    compile: bool = False             # torch.compile the model
+    threads: int = None               # torch intra-op threads (default: torch's choice)
+    log_every: int = 50               # optimizer steps between loss / throughput logs
+    checkpoint_dir: str = CHECKPOINT_DIR
+    checkpoint_every: int = 500       # optimizer steps between checkpoints (0: only at epoch end)
+    resume: bool = False
+    seed: int = 0
 
-    train_df['label'] = le.transform(train_df['label'])
-    val_df['label'] = le.transform(val_df['label'])
-    test_df['label'] = le.transform(test_df['label'])
 
-    return train_df, val_df, test_df, le
+def _autocast(config):
+    if not config.bf16:
+        return nullcontext()
+    return torch.autocast(device_type=DEVICE.type, dtype=torch.bfloat16)
 
 # -------------------------------
 # Data Loaders
 # -------------------------------
-def create_dataloaders(tokenizer, train_df, val_df, test_df, batch_size):
-    train_dataset = CUADDataset(train_df['clause'], train_df['paragraph'], train_df['label'], tokenizer, max_len=MAX_LEN)
-    val_dataset = CUADDataset(val_df['clause'], val_df['paragraph'], val_df['label'], tokenizer, max_len=MAX_LEN)
-    test_dataset = CUADDataset(test_df['clause'], test_df['paragraph'], test_df['label'], tokenizer, max_len=MAX_LEN)
+def create_dataloaders(tokenizer, train_dataset, val_dataset, test_dataset, batch_size, num_workers=0, seed=0):
+    collate = partial(collate_batch, pad_token_id=tokenizer.pad_token_id or 0)
 
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
-    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+    def loader(dataset, shuffle):
+        return DataLoader(dataset, batch_sampler=LengthBucketSampler(dataset.lengths, batch_size, shuffle=shuffle, seed=seed),
+                          collate_fn=collate, num_workers=num_workers, persistent_workers=num_workers > 0,
+                          pin_memory=DEVICE.type == "cuda")
 
-    return train_loader, val_loader, test_loader
+    return loader(train_dataset, True), loader(val_dataset, False), loader(test_dataset, False)
+
+# -------------------------------
+# Checkpoints
+# -------------------------------
+# One rolling checkpoint.pt with everything needed to continue mid-epoch: model,
+# optimizer and scheduler state, position in the (deterministic) batch order and RNG state.
+def save_checkpoint(config, model, optimizer, scheduler, progress):
+    os.makedirs(config.checkpoint_dir, exist_ok=True)
+    path = os.path.join(config.checkpoint_dir, "checkpoint.pt")
+    tmp = path + ".tmp"
+    torch.save({
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+        "progress": dict(progress),
+        "config": asdict(config),
+        "torch_rng": torch.get_rng_state(),
+    }, tmp)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(config, model, optimizer, scheduler):
+    path = os.path.join(config.checkpoint_dir, "checkpoint.pt")
+    if not os.path.exists(path):
+        print(f"No checkpoint at {path}; starting from scratch")
+        return None
+    state = torch.load(path, map_location=DEVICE, weights_only=False)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    scheduler.load_state_dict(state["scheduler"])
+    torch.set_rng_state(state["torch_rng"])
+    progress = state["progress"]
+    print(f"Resumed from {path}: epoch {progress['epoch'] + 1}, batch {progress['batch']}, step {progress['step']}")
+    return progress
 
 # -------------------------------
 # Training Loop
 # -------------------------------
-def train(model, dataloader, optimizer):
+def train(model, dataloader, optimizer, scheduler=None, config=None, progress=None, checkpoint=None):
+    """
+    One epoch, resuming at ``progress["batch"]`` when set.
+
+    Losses are summed on-device and only read back every ``log_every`` optimizer steps,
+    so there is no host sync per batch. ``checkpoint`` (called every ``checkpoint_every``
+    optimizer steps) saves the trainer state.
+    """
+    config = config or TrainConfig()
+    progress = progress if progress is not None else {"epoch": 0, "batch": 0, "step": 0, "samples": 0}
+    accumulation = config.accumulation_steps
     model.train()
-    total_loss = 0
-    for batch in tqdm(dataloader, desc="Training"):
-        batch = {k: v.to(DEVICE) for k, v in batch.items()}
-        outputs = model(**batch)
-        loss = outputs.loss
-        optimizer.zero_grad()
-        loss.backward()
+    total_loss = torch.zeros((), device=DEVICE)
+    window_loss = torch.zeros((), device=DEVICE)
+    batches = window_batches = window_samples = 0
+    window_start = time.perf_counter()
+    optimizer.zero_grad(set_to_none=True)
+
+    bar = tqdm(dataloader, desc="Training", initial=progress["batch"], total=len(dataloader))
+    for batch in bar:
+        batch = {k: v.to(DEVICE, non_blocking=True) for k, v in batch.items()}
+        with _autocast(config):
+            loss = model(**batch).loss
+        (loss / accumulation).backward()
+        total_loss += loss.detach()
+        window_loss += loss.detach()
+        batches += 1
+        window_batches += 1
+        window_samples += batch["labels"].size(0)
+        progress["batch"] += 1
+        progress["samples"] += batch["labels"].size(0)
+
+        # Step on every accumulation boundary, and on the epoch's last (possibly partial) group
+        if progress["batch"] % accumulation and progress["batch"] != len(dataloader):
+            continue
+        torch.nn.utils.clip_grad_norm_(model.parameters(), config.max_grad_norm)
         optimizer.step()
-        total_loss += loss.item()
-    return total_loss / len(dataloader)
+        if scheduler is not None:
+            scheduler.step()
+        optimizer.zero_grad(set_to_none=True)
+        progress["step"] += 1
+
+        if progress["step"] % config.log_every == 0:
+            elapsed = time.perf_counter() - window_start
+            bar.set_postfix(loss=f"{window_loss.item() / window_batches:.4f}",
+                            samples_per_s=f"{window_samples / elapsed:.1f}")
+            window_loss.zero_()
+            window_batches = window_samples = 0
+            window_start = time.perf_counter()
+        if checkpoint is not None and config.checkpoint_every and progress["step"] % config.checkpoint_every == 0:
+            checkpoint(progress)
+
+    return total_loss.item() / max(1, batches)
 
-def evaluate(model, dataloader):
+def evaluate(model, dataloader, config=None):
+    config = config or TrainConfig()
     model.eval()
-    total_loss = 0
-    correct = 0
+    total_loss = torch.zeros((), device=DEVICE)
+    correct = torch.zeros((), dtype=torch.long, device=DEVICE)
     total = 0
-    with torch.no_grad():
+    with torch.inference_mode():
         for batch in tqdm(dataloader, desc="Evaluating"):
-            batch = {k: v.to(DEVICE) for k, v in batch.items()}
-            outputs = model(**batch)
-            loss = outputs.loss
-            logits = outputs.logits
-            total_loss += loss.item()
-            preds = torch.argmax(logits, dim=-1)
-            correct += (preds == batch['labels']).sum().item()
+            batch = {k: v.to(DEVICE, non_blocking=True) for k, v in batch.items()}
+            with _autocast(config):
+                outputs = model(**batch)
+            total_loss += outputs.loss.float()
+            preds = torch.argmax(outputs.logits, dim=-1)
+            correct += (preds == batch['labels']).sum()
             total += batch['labels'].size(0)
-    accuracy = correct / total
-    return total_loss / len(dataloader), accuracy
+    accuracy = correct.item() / total
+    return total_loss.item() / len(dataloader), accuracy
 
 # -------------------------------
 # Main
 # -------------------------------
-def main():
-    # Load data
-    train_df, val_df, test_df, le = load_data(TRAIN_CSV, VAL_CSV, TEST_CSV)
-    print(f"Labels: {list(le.classes_)}")
-    print(f"Train: {len(train_df)}, Val: {len(val_df)}, Test: {len(test_df)}")
+def parse_args():
+    defaults = TrainConfig()
+    parser = argparse.ArgumentParser(description="Fine-tune Legal-BERT on CUAD clauses.")
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--accumulation-steps", type=int, default=defaults.accumulation_steps)
+    parser.add_argument("--epochs", type=int, default=defaults.epochs)
+    parser.add_argument("--lr", type=float, default=defaults.lr)
+    parser.add_argument("--warmup-ratio", type=float, default=defaults.warmup_ratio)
+    parser.add_argument("--bf16", action="store_true", help="bfloat16 autocast")
+    parser.add_argument("--num-workers", type=int, default=defaults.num_workers)
+    parser.add_argument("--compile", action="store_true", help="torch.compile the model")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--log-every", type=int, default=defaults.log_every)
+    parser.add_argument("--checkpoint-dir", default=defaults.checkpoint_dir)
+    parser.add_argument("--checkpoint-every", type=int, default=defaults.checkpoint_every)
+    parser.add_argument("--resume", action="store_true", help="Continue from checkpoint-dir/checkpoint.pt")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    return TrainConfig(**{k.replace("-", "_"): v for k, v in vars(parser.parse_args()).items()})
+
+
+def main(config=None):
+    config = config or parse_args()
+    torch.manual_seed(config.seed)
+    if config.threads:
+        torch.set_num_threads(config.threads)
 
-    # Tokenizer & Model
+    # Tokenizer
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+
+    # Load (pre-tokenized) data
+    train_data, val_data, test_data, le = load_data(TRAIN_CSV, VAL_CSV, TEST_CSV, tokenizer)
+    print(f"Labels: {list(le.classes_)}")
+    print(f"Train: {len(train_data)}, Val: {len(val_data)}, Test: {len(test_data)}")
+
+    # Model
     model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, num_labels=len(le.classes_))
     model.to(DEVICE)
 
     # Data loaders
-    train_loader, val_loader, test_loader = create_dataloaders(tokenizer, train_df, val_df, test_df, BATCH_SIZE)
+    train_loader, val_loader, test_loader = create_dataloaders(tokenizer, train_data, val_data, test_data,
+                                                               config.batch_size, config.num_workers, config.seed)
+
+    # Optimizer and schedule
+    optimizer = torch.optim.AdamW(model.parameters(), lr=config.lr, weight_decay=config.weight_decay)
+    total_steps = math.ceil(len(train_loader) / config.accumulation_steps) * config.epochs
+    scheduler = get_linear_schedule_with_warmup(optimizer, int(total_steps * config.warmup_ratio), total_steps)
+
+    progress = {"epoch": 0, "batch": 0, "step": 0, "samples": 0}
+    if config.resume:
+        progress = load_checkpoint(config, model, optimizer, scheduler) or progress
+    # Checkpoints hold the plain model's weights, so they load with or without compile.
+    # Dynamic padding varies the sequence length per batch: compile for dynamic shapes
+    # rather than recompiling for every new length.
+    trained_model = torch.compile(model, dynamic=True) if config.compile else model
+
+    def checkpoint(state):
+        save_checkpoint(config, model, optimizer, scheduler, state)
 
-    # Optimizer
-    optimizer = AdamW(model.parameters(), lr=LR)
+    print(f"Effective batch size {config.batch_size * config.accumulation_steps}, {total_steps} optimizer steps"
+          f"{', bf16 autocast' if config.bf16 else ''}{', compiled' if config.compile else ''}")
 
     # Training
-    for epoch in range(EPOCHS):
-        print(f"\nEpoch {epoch+1}/{EPOCHS}")
-        train_loss = train(model, train_loader, optimizer)
-        val_loss, val_acc = evaluate(model, val_loader)
-        print(f"Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.4f}")
+    while progress["epoch"] < config.epochs:
+        epoch = progress["epoch"]
+        print(f"\nEpoch {epoch+1}/{config.epochs}")
+        train_loader.batch_sampler.set_epoch(epoch, progress["batch"])
+        start = time.perf_counter()
+        samples = progress["samples"]
+        train_loss = train(trained_model, train_loader, optimizer, scheduler, config, progress, checkpoint)
+        samples = progress["samples"] - samples
+        seconds = time.perf_counter() - start
+        val_loss, val_acc = evaluate(trained_model, val_loader, config)
+        print(f"Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.4f} | "
+              f"{samples / seconds:.1f} samples/s")
+        progress.update(epoch=epoch + 1, batch=0)
+        checkpoint(progress)
 
     # Test evaluation
-    test_loss, test_acc = evaluate(model, test_loader)
+    test_loss, test_acc = evaluate(trained_model, test_loader, config)
     print(f"\nTest Loss: {test_loss:.4f} | Test Acc: {test_acc:.4f}")
 
     # Save model